@@ -1,19 +1,33 @@
+import os
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException,Query
-from sqlalchemy import or_
-from sqlalchemy.orm import Session
-from app.models.models import Person, PersonType, Band,pers_band,Genre,City
-from app.api.routes.auth import get_current_user,get_db
-from app.schemas.schemas import ArtistUpdate, BandUpdate
+from fastapi import APIRouter, Depends, HTTPException,Query, Request
+from fastapi.responses import FileResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import get_settings
+from app.core.database import get_db
+from app.models.models import Person, PersonType, Band,pers_band
+from app.api.routes.auth import get_current_user
+from app.schemas.schemas import ArtistUpdate, BandUpdate, ArtistSearchResult, BandRead, Page, TrackRead, UserRead
+from app.services.search import search_query, search_key, search_result
+from app.services.read_models import SearchRow
+from app.services.reference import reference_cache
+from app.services.response_cache import cached_page, invalidate_responses
+from app.services.media import (AUDIO_DIR, AUDIO_MAX_BYTES, FORMATI_AUDIO, MEDIA_ROOT, NOME_BRANO, file_path,
+                                media_file_response, media_worker, read_waveform, store_upload)
+from app.services.sanction_service import check_account_not_frozen
+from app.core.pagination import MAX_PAGE_SIZE, apply_keyset, build_page, stream_json
 
 router = APIRouter(prefix="/artists", tags=["Artists"])
+#il nome del brano è il suo sha256: il contenuto di un URL non cambia mai
+CACHE_CONTROL_BRANO = f"public, max-age={get_settings().media_max_age}, immutable"
 
 
-@router.put("/me")
-def update_artist(
+@router.put("/me", response_model=UserRead)
+async def update_artist(
     update: ArtistUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: Person = Depends(get_current_user)
 ):  # controllo l'accesso all'utente
     if current_user.tipo_utente != PersonType.artista: # type: ignore
@@ -30,17 +44,17 @@ def update_artist(
     if update.file_path:
         current_user.file_path = update.file_path # type: ignore
     # salvo nel db
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     return current_user
 
 
 
-@router.put("/me/band")
-def update_artist_band(
+@router.put("/me/band", response_model=BandRead)
+async def update_artist_band(
     current_band_name: str,
     update: BandUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: Person = Depends(get_current_user)
 ):
     #  Verifichiamo che sia un artista
@@ -50,10 +64,10 @@ def update_artist_band(
 
     #  Cerchiamo la band filtrando per nome e appartenenza dell'utente
     # Uniamo la tabella Band con pers_band per controllare il collegamento
-    band = db.query(Band).join(pers_band).filter(
+    band = await db.scalar(select(Band).join(pers_band).filter(
         Band.nome == current_band_name,
         pers_band.person_id == current_user.id
-    ).first()
+    ))
 
     if not band:
         raise HTTPException(
@@ -71,49 +85,103 @@ def update_artist_band(
     if update.cachet is not None: # type: ignore
         band.cachet = update.cachet # type: ignore
 
-    # Salvataggio
-    db.commit()
-    db.refresh(band)
+    # Salvataggio (nome e genere della band compaiono nelle ricerche)
+    await invalidate_responses(db, "artists")
+    await db.commit()
+    await db.refresh(band)
 
     return band
 
 
-@router.get("/artists")
-def search_artists(
-    artist:Optional[str] = Query(None, description="Nome artista o band"),
+@router.get("/artists", response_model=Page[ArtistSearchResult])
+async def search_artists(
+    artist:Optional[str] = Query(None, description="Nome artista o band (tollerante ai refusi)"),
     genere_id:Optional[int] = Query(None, description="ID del genere musicale"),
     citta: Optional[str] = Query(None, description="Nome della città"),
     categoria:Optional[str] = Query(None, description="inedita, tribute Band, cover Band"),
-    db:Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Restituisce tutti i risultati in streaming"),
+    db:AsyncSession = Depends(get_db)
 
 ):
-    # Base query per le Band
-    query_band = db.query(Band).join(Genre)
-    
-    #Filtri per le Band
-    if artist:
-        query_band = query_band.filter(Band.nome.ilike(f"%{artist}%"))
-    if genere_id:
-        query_band = query_band.filter(Band.genere_id == genere_id)
-    if categoria:
-        query_band = query_band.filter(Band.categoria == categoria)
-        
-    if citta:
-        query_band = query_band.join(Band.band_list).join(Person).join(City).filter(City.nome.ilike(f"%{citta}%"))
-        
-    results_bands = query_band.all()
-    
-    query_artists = db.query(Person).filter(Person.tipo_utente == PersonType.artista)
-    if artist:
-        query_artists = query_artists.filter(or_(Person.nome.ilike(f"%{artist}%"), Person.cognome.ilike(f"%{artist}%")))
-    if genere_id:
-        query_artists = query_artists.filter(Person.genere_id == genere_id)
-    if citta:
-        query_artists = query_artists.join(City).filter(City.nome.ilike(f"%{citta}%"))
-
-    results_artists = query_artists.all()
+    # Band e artisti solisti in un'unica lista ordinata per rilevanza (indici GIN pg_trgm/tsvector)
+    #nomi e filtro delle città dai dati di riferimento in memoria, senza join su city
+    riferimenti = await reference_cache.get(db)
+    query, order_by = search_query(riferimenti, q=artist, genere_id=genere_id, categoria=categoria, citta=citta)
+    if stream:
+        return stream_json(
+            query.order_by(*order_by),
+            lambda r: ArtistSearchResult(**search_result(SearchRow(*r), artist, riferimenti)).model_dump_json(),
+            scalars=False
+        )
+
+    async def pagina():
+        righe = [SearchRow(*r) for r in (await db.execute(apply_keyset(query, order_by, cursor, limit))).all()]
+        return build_page(righe, search_key, limit, serialize=lambda r: search_result(r, artist, riferimenti))
+
+    #risultati uguali per tutti gli utenti: cache per parametri, svuotata dalle scritture su band e artisti
+    parametri = dict(artist=artist, genere_id=genere_id, citta=citta, categoria=categoria, cursor=cursor, limit=limit)
+    return await cached_page("artists", parametri, ArtistSearchResult, pagina)
+
 
+def track_read(person: Person) -> dict:
+    # solo i brani caricati qui hanno picchi e URL; un percorso inserito a mano non si può servire
+    nome_file = os.path.basename(str(person.file_path or ""))
+    trovato = NOME_BRANO.match(nome_file)
+    if not trovato:
+        raise HTTPException(status_code=404, detail="Nessun brano caricato per questo artista")
+    analisi = read_waveform(trovato.group(1)) or {}
     return {
-        "bands": results_bands,
-        "solo_artists": results_artists
-    }
\ No newline at end of file
+        "url": f"{router.prefix}/tracks/{nome_file}",
+        "pronto": bool(analisi),
+        "durata": analisi.get("durata"),
+        "picchi": analisi.get("picchi"),
+    }
+
+
+@router.post("/me/track", response_model=TrackRead, status_code=201,
+             openapi_extra={"requestBody": {"content": {t: {} for t in FORMATI_AUDIO.values()}, "required": True}})
+async def upload_artist_track(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Person = Depends(get_current_user),
+    _= Depends(check_account_not_frozen)
+):
+    if current_user.tipo_utente != PersonType.artista: # type: ignore
+        raise HTTPException(
+            status_code=403, detail="Errore, Accesso negato: Area Riservata agli Artisti")
+    lunghezza = request.headers.get("content-length")
+    if lunghezza and lunghezza.isdigit() and int(lunghezza) > AUDIO_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Il brano supera il limite di {AUDIO_MAX_BYTES // (1024 * 1024)} MB")
+
+    # il corpo della richiesta è il brano: va su disco a blocchi, con il nome del suo sha256
+    salvato = await store_upload(request.stream(), max_bytes=AUDIO_MAX_BYTES, formati=FORMATI_AUDIO, cartella=AUDIO_DIR)
+    current_user.file_path = file_path(salvato.nome_file, AUDIO_DIR) # type: ignore
+    await db.commit()
+
+    # durata e picchi nel pool di processi: il player li legge da GET /artists/{id}/track senza scaricare l'audio
+    media_worker.waveform(salvato.nome_file)
+    return track_read(current_user)
+
+
+@router.get("/{person_id}/track", response_model=TrackRead)
+async def get_artist_track(person_id: int, db: AsyncSession = Depends(get_db)):
+    artista = await db.scalar(select(Person).filter(Person.id == person_id, Person.tipo_utente == PersonType.artista))
+    if not artista:
+        raise HTTPException(status_code=404, detail="Artista non trovato")
+    return track_read(artista)
+
+
+@router.get("/tracks/{nome_file}", response_class=FileResponse)
+#HEAD (dimensione e Accept-Ranges per il player) fuori dallo schema: stessa funzione, operation id duplicato
+@router.head("/tracks/{nome_file}", response_class=FileResponse, include_in_schema=False)
+async def get_track_file(nome_file: str, request: Request):
+    # Range/If-Range (206, 416) li gestisce FileResponse: il player salta nel brano senza scaricarlo tutto
+    if not NOME_BRANO.match(nome_file):
+        raise HTTPException(status_code=404, detail="File non trovato")
+    relativo = file_path(nome_file, AUDIO_DIR)
+    if not os.path.exists(os.path.join(MEDIA_ROOT, relativo)):
+        raise HTTPException(status_code=404, detail="File non trovato")
+    etag = f'"{nome_file.split(".")[0]}"'
+    return media_file_response(request, relativo, FORMATI_AUDIO[nome_file.rsplit(".", 1)[1]], etag, CACHE_CONTROL_BRANO)
@@ -1,49 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
-from pydantic import EmailStr
-from dotenv import load_dotenv
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
-from app.core.database import SessionLocal
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
 from app.models.models import Person, StateAccountType, Invitation, StateInvitation, pers_band, Band,PersonType,Venue,BookingOrganization
-from app.schemas.schemas import UserBase,ArtistRegister,DirectorRegister,PromoterRegister,UserLogin
-from datetime import datetime, timedelta, timezone
+from app.schemas.schemas import UserBase,ArtistRegister,DirectorRegister,PromoterRegister,UserLogin,RegistrationResponse,TokenResponse,RefreshRequest,MessageResponse,UserRead
+from app.services.auth_context import AuthContext, get_cached_auth_context, invalidate_auth_context, load_auth_context
+from app.services.passwords import password_hasher
+from app.services.outbox import enqueue_email
+from app.services.response_cache import invalidate_responses
+from app.services.tokens import TokenClaims, decode_access_token, issue_tokens, revoke_refresh_family, rotate_refresh_token
 from fastapi.security import  OAuth2PasswordBearer
-from jwt import ExpiredSignatureError,PyJWTError
-import jwt
 import uuid
-import os
-
-load_dotenv()
-
-conf = ConnectionConfig(
-    MAIL_USERNAME=str(os.getenv('MAIL_USERNAME', '')),
-    MAIL_PASSWORD=str(os.getenv('MAIL_PASSWORD', '')), # type: ignore
-    MAIL_FROM=str(os.getenv('MAIL_FROM', '')),
-    MAIL_PORT=int(str(os.getenv('MAIL_PORT', '587'))),
-    MAIL_SERVER=str(os.getenv('MAIL_SERVER', '')),
-    MAIL_FROM_NAME="EasyGIG Team",
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
-)
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-async def send_invitation_email(email_to: EmailStr, token: str, sender_name: str, band_name: str):
+def invitation_email(token: str, sender_name: str, band_name: str):
+    """Restituisce oggetto e corpo html della mail d'invito nella band."""
     url = f"http://127.0.0.1:8000/register?token_invito={token}"
 
     html = f"""
@@ -56,42 +31,33 @@ async def send_invitation_email(email_to: EmailStr, token: str, sender_name: str
         </body>
     </html>
     """
-
-    message = MessageSchema(
-        subject=f"Invito per la band {band_name}",
-        recipients=[str(email_to)], # type: ignore
-        body=html,
-        subtype=MessageType.html
-    )
-
-    fm = FastMail(conf)
-    await fm.send_message(message)
+    return f"Invito per la band {band_name}", html
 
 
 #ENDPOINT PER LA REGISTRAZIONE DEGLI ARTISTI
-@router.post("/register/artist")
-def register_artist(
+@router.post("/register/artist", response_model=RegistrationResponse)
+async def register_artist(
     user:ArtistRegister,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     #Controllo se la mail è già presente nel db
-    if db.query(Person).filter(Person.email == user.email).first():
+    if await db.scalar(select(Person.id).filter(Person.email == user.email)):
         raise HTTPException(status_code=400, detail="Email già registrata")
     
     #Controllo se ha l'invito
     invito = None
     if user.token_invito: #Se c'è l'invito faccio una query per confrontare il token inviato.
-        invito = db.query(Invitation).filter(
+        invito = await db.scalar(select(Invitation).filter(
             Invitation.token == user.token_invito,
             Invitation.stato == StateInvitation.pending
-        ).first()
+        ))
         if not invito: #se dal controllo l'invito non risulta valido mando un eccezione
             raise HTTPException(status_code=409, detail="Invito non valido o scaduto")
     
+    #salvo l'hash della password (calcolato nel pool di processi, 503 se saturo)
+    password_hash = await password_hasher.hash(user.password)
     try:
         #Creo l'utente se non esiste già
-        password_hash = pwd_context.hash(user.password) #salvo l'hash della password
         nuovo_utente = Person( #registro i dati dell'utente in ingresso
             nome = user.nome,
             cognome = user.cognome,
@@ -103,10 +69,8 @@ def register_artist(
             tipo_utente = PersonType.artista
         )
         db.add(nuovo_utente)
-        db.flush() #Ottengo l'ID
+        await db.flush() #Ottengo l'ID
         
-        #Nel caso voglia spedire gli inviti alla registrazione dei componenti della band
-        inviti_da_spedire = []
         #CASO 1: Si unisce ad una band esistente tramite l'invito
         if invito:
             db.add(pers_band(person_id = nuovo_utente.id, band_id = invito.band_id))
@@ -121,7 +85,7 @@ def register_artist(
                 genere_id=1 #default
             )
             db.add(nuova_band)
-            db.flush()
+            await db.flush()
             
             #Associo la band l'utente
             db.add(pers_band(person_id = nuovo_utente.id, band_id = nuova_band.id))
@@ -136,42 +100,38 @@ def register_artist(
                         band_id = nuova_band.id,
                         sender_id = nuovo_utente.id
                     ))
-        #Commit finale
-        db.commit()
+                    #la mail d'invito parte solo se la registrazione va a buon fine (outbox)
+                    oggetto, html = invitation_email(token, str(nuovo_utente.nome), str(nuova_band.nome))
+                    enqueue_email(db, mail, oggetto, html)
+        #Commit finale (il nuovo artista o la nuova band compaiono nelle ricerche)
+        await invalidate_responses(db, "artists")
+        await db.commit()
+        invalidate_auth_context(nuovo_utente.id) # type: ignore
         
-        #Spedisco gli inviti
-        for invito in inviti_da_spedire:
-            background_tasks.add_task(
-                send_invitation_email,
-                invito["email"],
-                invito["token"],
-                str(nuovo_utente.nome),
-                invito["band"]
-                
-            )
         #messaggio di conferma
         return {"message": "Registrazione artista avvenuta con successo", "id": nuovo_utente.id}
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Errore: {e}")
         raise HTTPException(status_code=500, detail="Errore durante la registrazione")
     
     
     
 #ENDPOINT PER LA REGISTRAZIONE DEL DIRETTORE ARTISTICO
-@router.post("/register/artisticDirector")
-def register_director(
+@router.post("/register/artisticDirector", response_model=RegistrationResponse)
+async def register_director(
     user:DirectorRegister,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     #Controllo se la mail è già presente nel database
-    if db.query(Person).filter(Person.email == user.email).first():
+    if await db.scalar(select(Person.id).filter(Person.email == user.email)):
         raise HTTPException(status_code=400, detail="Email già registrata")
     
+    #salvo l'hash della password (calcolato nel pool di processi, 503 se saturo)
+    password_hash = await password_hasher.hash(user.password)
     try:
         #creo il direttore
-        password_hash = pwd_context.hash(user.password) #salvo l'hash della password
         nuovo_utente = Person(
             nome = user.nome,
             cognome = user.cognome,
@@ -185,13 +145,13 @@ def register_director(
         )
         #aggiungo il nuovo direttore
         db.add(nuovo_utente)
-        db.flush()
+        await db.flush()
         #creo il locale
         nuova_venue = Venue(
             nome = user.nome_locale,
             email = user.email_locale,
             telefono = user.telefono_locale,
-            tipo_sale = user.tipo_sala,
+            tipo_sala = user.tipo_sala,
             capienza = user.capienza,
             strumentazione = user.strumentazione,
             city_id = user.city_id,
@@ -199,24 +159,28 @@ def register_director(
         )
         #aggiunto il locale al database
         db.add(nuova_venue)
-        db.commit()
+        await invalidate_responses(db, "venues")
+        await db.commit()
+        invalidate_auth_context(nuovo_utente.id) # type: ignore
         return {"message": "Registrazione effettuata con successo", "id": nuovo_utente.id, "venue_id": nuova_venue.id}
     #errore in caso di mancata comunicazione del server
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail= f"Errore durante la registrazione: {str(e)}")
     
     
 #ENDPOINT PER REGISTRAZIONE DEL PROMOTER
-@router.post("/register/promoter")
-def register_promoter(
+@router.post("/register/promoter", response_model=RegistrationResponse)
+async def register_promoter(
     user:PromoterRegister,
-    db:Session = Depends(get_db)
+    db:AsyncSession = Depends(get_db)
 ):
     #Controllo se la mail è già presente nel database
-    if db.query(Person).filter(Person.email == user.email).first():
+    if await db.scalar(select(Person.id).filter(Person.email == user.email)):
         raise HTTPException(status_code=400, detail = "Email già registrata")
     
+    #salvo l'hash della password (calcolato nel pool di processi, 503 se saturo)
+    password_hash = await password_hasher.hash(user.password)
     try:
         
         #creo l'organizzazione
@@ -225,10 +189,9 @@ def register_promoter(
          tipo_booking = user.tipo_organizzazione
         )
         db.add(nuova_organizzazione)
-        db.flush()
+        await db.flush()
         
         #creo il promoter
-        password_hash = pwd_context.hash(user.password)#salvo l'hash della password
         nuovo_utente = Person(
             nome = user.nome,
             cognome = user.cognome,
@@ -242,72 +205,90 @@ def register_promoter(
         )
         #aggiungo il promoter
         db.add(nuovo_utente)
-        db.commit()
+        await db.commit()
         return {"message": "Registrazione effettuata con successo", "id": nuovo_utente.id, "organization_id": nuova_organizzazione.id}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail= f"Errore durante la registrazione: {str(e)}")
     
     
     
     
     
-@router.post("/login")
-def user_login(user:UserLogin, db:Session = Depends(get_db)):
+@router.post("/login", response_model=TokenResponse)
+async def user_login(user:UserLogin, db:AsyncSession = Depends(get_db)):
     try:
         #cerco l'utente
-        utente_trovato = db.query(Person).filter(Person.email == user.email).first()
+        utente_trovato = await db.scalar(select(Person).filter(Person.email == user.email))
         
         if not utente_trovato: #se l'utente non esiste lancio un eccezione
             raise HTTPException(status_code = 401, detail = "Credenziali non valide")
         #se trovo l'utente faccio l'hash della password
         password_hash = utente_trovato.password_hash
         #verifico che la password digitata sia uguale alle credenziali presenti nel db
-        if not pwd_context.verify(user.password, str(password_hash)):
+        valida, nuovo_hash = await password_hasher.verify(user.password, str(password_hash))
+        if not valida:
             raise HTTPException(status_code = 401 , detail= "Credenziali non valide") #se non trovo le credenziali lancio un errore
+        #se il costo di bcrypt è cambiato aggiorno l'hash in modo trasparente
+        if nuovo_hash:
+            utente_trovato.password_hash = nuovo_hash # type: ignore
+            await db.commit()
         
-        #creo le variabile per il contenuto del token JSON
-        SECRET_KEY = os.getenv("SECRET_KEY")
-        exp = datetime.now(timezone.utc)+ timedelta(hours=2)
-        
-        payload = {"sub":str(utente_trovato.id),"exp": exp}
-        #creo il token JSON con jwt
-        token_jwt = jwt.encode(payload= payload,key=str(SECRET_KEY),algorithm="HS256")
-        return {
-            "access_token":token_jwt,
-            "token_type": "bearer"
-        }
+        #token di accesso breve con ruolo e stato dell'account, più il refresh token salvato nel database
+        ctx = await load_auth_context(db, utente_trovato.id) # type: ignore
+        return await issue_tokens(db, ctx) # type: ignore
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail= f"Errore durante il login: {str(e)}")
         
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh_tokens(richiesta: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    #il refresh token viene consumato: il client deve usare quello nuovo della risposta
+    return await rotate_refresh_token(db, richiesta.refresh_token)
+
+
+@router.post("/logout", response_model=MessageResponse)
+async def logout(richiesta: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    await revoke_refresh_family(db, richiesta.refresh_token)
+    return {"message": "Logout effettuato"}
+
+
+def decode_user_id(token: str) -> int:
+    return decode_access_token(token).user_id
+
+
+def get_token_claims(token: str = Depends(oauth2_scheme)) -> TokenClaims:
+    #ruolo e stato dell'account dal token di accesso: nessuna query
+    return decode_access_token(token)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    user_id = decode_user_id(token)
     try:
-        #recupero la chiave segreta
-        SECRET_KEY = os.getenv("SECRET_KEY")
-        #decodifico il token
-        payload = jwt.decode(token, key=str(SECRET_KEY), algorithms=["HS256"])
         #con il contenuto del token vado a pescare dal database l'id e lo confronto
-        utente = db.query(Person).filter(Person.id == payload["sub"]).first()
-        #se non esiste lancio un errore 401
-        if not utente:
-            raise HTTPException(status_code=401, detail="Errore, utente non trovato")
-        #ritorno l'utente
-        return utente
-    
-    except ExpiredSignatureError:
-        # Errore specifico: il token ha superato la data "exp"
-        raise HTTPException(status_code=401, detail="Token scaduto, effettua nuovamente il login")
-    except PyJWTError:
-        # Errore specifico: il token è malformato o la firma non corrisponde
-        raise HTTPException(status_code=401, detail="Credenziali di autenticazione non valide")
+        utente = await db.scalar(select(Person).filter(Person.id == user_id))
     except Exception as e:
         # Qualsiasi altro errore
         raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
+    #se non esiste lancio un errore 401
+    if not utente:
+        raise HTTPException(status_code=401, detail="Errore, utente non trovato")
+    #ritorno l'utente
+    return utente
+
+
+async def get_auth_context(claims: TokenClaims = Depends(get_token_claims), db: AsyncSession = Depends(get_db)) -> AuthContext:
+    #contesto di autorizzazione (ruolo, stato account, locali, band) letto dalla cache per utente
+    ctx = await get_cached_auth_context(db, claims.user_id)
+    if not ctx:
+        raise HTTPException(status_code=401, detail="Errore, utente non trovato")
+    return ctx
     
     
-@router.get("/me") #ritorna le informazione dell'utente dopo aver richiamata la funzione get_current user per la verifica del token
-def profile_info( utente:Person = Depends(get_current_user)):
+@router.get("/me", response_model=UserRead) #ritorna le informazione dell'utente (senza password_hash) dopo aver richiamata la funzione get_current user per la verifica del token
+async def profile_info( utente:Person = Depends(get_current_user)):
     return utente
     
     
@@ -1,148 +1,172 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.api.routes.auth import get_db, get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
+from app.api.routes.auth import get_auth_context
+from app.services.auth_context import AuthContext
 from app.services.sanction_service import check_account_not_frozen
-from app.models.models import Booking, PersonType, Slot, Person, BookingState, SlotType, Venue, Calendar, Band, pers_band
-from app.schemas.schemas import BookingReject
+from app.models.models import Booking, PersonType, Slot, BookingState, SlotType, Calendar
+from app.schemas.schemas import BookingReject, BookingBulkAction, BookingRead, BookingBulkResult, BookingActionResult, Page
+from app.services.booking_service import STATI_ATTIVI, slot_state_if, transition_bookings
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset, build_page, stream_json
 from datetime import date
 
 
 router = APIRouter(prefix="/bookings", tags=["Bookings"])
 
+MAX_BULK_BOOKINGS = 200 #prenotazioni gestibili con una sola chiamata a /bookings/bulk
 
-@router.post("/{booking_id}/accept")
-def accept_booking(
-    booking_id: int,
-    db: Session = Depends(get_db),
-    current_user: Person = Depends(get_current_user),
-    _= Depends(check_account_not_frozen)): # type: ignore
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
 
-    if not booking:
+async def load_booking(db: AsyncSession, booking_id: int):
+    #booking, slot, locale e data evento in un'unica query
+    riga = (await db.execute(
+        select(Booking, Slot, Calendar.venue_id, Calendar.data)
+        .outerjoin(Slot, Booking.slot_id == Slot.id)
+        .outerjoin(Calendar, Slot.calendar_id == Calendar.id)
+        .filter(Booking.id == booking_id)
+    )).first()
+    if not riga:
         raise HTTPException(status_code=404, detail="Prenotazione non trovata")
+    return riga
 
-    venue = db.query(Venue).join(Calendar).join(
-        Slot).filter(Slot.id == booking.slot_id).first()
 
-    if not venue or venue.direttore_id != current_user.id: # type: ignore
-        raise HTTPException(
-            status_code=403, detail="Non hai i permessi per gestire la prenotazione")
+def director_permission(ctx: AuthContext):
+    #la prenotazione deve riguardare uno dei locali diretti dall'utente
+    return Calendar.venue_id.in_(ctx.venue_ids)
 
-    if booking.stato_prenotazione != BookingState.pendente: # type: ignore
-        raise HTTPException(
-            status_code=400, detail="Questa prenotazione è già stata gestita")
 
-    booking.stato_prenotazione = BookingState.accettata # type: ignore
+async def accept(db: AsyncSession, booking_ids: list[int], ctx: AuthContext) -> list[int]:
+    return await transition_bookings(
+        db, booking_ids, (BookingState.pendente,), BookingState.accettata,
+        director_permission(ctx), lambda _t: SlotType.occupato)
 
-    slot = db.query(Slot).filter(Slot.id == booking.slot_id).first()
-    if slot:
-        slot.stato = SlotType.occupato # type: ignore
 
-    db.commit()
-    return {"message": "Prenotazione accettata con successo!", "booking_id": booking_id}
+async def reject(db: AsyncSession, booking_ids: list[int], ctx: AuthContext, ragione: str) -> list[int]:
+    return await transition_bookings(
+        db, booking_ids, (BookingState.pendente,), BookingState.rifiutata,
+        director_permission(ctx), lambda _t: SlotType.disponibile, ragione=ragione)
+
+
+@router.post("/bulk", response_model=BookingBulkResult)
+async def bulk_bookings(
+    action: BookingBulkAction,
+    db: AsyncSession = Depends(get_db),
+    ctx: AuthContext = Depends(get_auth_context),
+    _= Depends(check_account_not_frozen)):
+    booking_ids = list(dict.fromkeys(action.booking_ids))
+    if not booking_ids:
+        raise HTTPException(status_code=400, detail="Nessuna prenotazione indicata")
+    if len(booking_ids) > MAX_BULK_BOOKINGS:
+        raise HTTPException(
+            status_code=400, detail=f"Si possono gestire al massimo {MAX_BULK_BOOKINGS} prenotazioni per volta")
+
+    if action.azione == 'accetta':
+        aggiornate = await accept(db, booking_ids, ctx)
+    else:
+        if not action.ragione or len(action.ragione.strip()) == 0:
+            raise HTTPException(
+                status_code=400, detail="Devi fornire un motivazione per il rifiuto")
+        aggiornate = await reject(db, booking_ids, ctx, action.ragione)
+
+    #le prenotazioni non aggiornate non esistono, non sono del direttore o sono già state gestite
+    gestite = set(aggiornate)
+    return {"aggiornate": aggiornate, "ignorate": [b for b in booking_ids if b not in gestite]}
 
 
-@router.post("/{booking_id}/reject")
-def reject_booking(
+@router.post("/{booking_id}/accept", response_model=BookingActionResult)
+async def accept_booking(
     booking_id: int,
-    reject_data: BookingReject,
-    db: Session = Depends(get_db),
-    current_user: Person = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    ctx: AuthContext = Depends(get_auth_context),
     _= Depends(check_account_not_frozen)): # type: ignore
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
-
-    if not booking:
-        raise HTTPException(status_code=404, detail="Prenotazione non trovata")
+    if not await accept(db, [booking_id], ctx):
+        #nessuna riga aggiornata: ricostruisco il motivo
+        _booking, _slot, venue_id, _data = await load_booking(db, booking_id)
+        if venue_id is None or venue_id not in ctx.venue_ids:
+            raise HTTPException(
+                status_code=403, detail="Non hai i permessi per gestire la prenotazione")
+        raise HTTPException(
+            status_code=400, detail="Questa prenotazione è già stata gestita")
 
-    venue = db.query(Venue).join(Calendar).join(
-        Slot).filter(Slot.id == booking.slot_id).first()
+    return {"message": "Prenotazione accettata con successo!", "booking_id": booking_id}
 
-    if not venue or venue.direttore_id != current_user.id: # type: ignore
-        raise HTTPException(status_code=403, detail="Non autorizzato")
 
+@router.post("/{booking_id}/reject", response_model=BookingActionResult)
+async def reject_booking(
+    booking_id: int,
+    reject_data: BookingReject,
+    db: AsyncSession = Depends(get_db),
+    ctx: AuthContext = Depends(get_auth_context),
+    _= Depends(check_account_not_frozen)): # type: ignore
     if not reject_data.ragione or len(reject_data.ragione.strip()) == 0:
         raise HTTPException(
             status_code=400, detail="Devi fornire un motivazione per il rifiuto")
 
-    booking.stato_prenotazione = BookingState.rifiutata # type: ignore
-    booking.ragione = reject_data.ragione # type: ignore
-
-    slot = db.query(Slot).filter(Slot.id == booking.slot_id).first()
-    if slot:
-        slot.stato = SlotType.disponibile # type: ignore
+    if not await reject(db, [booking_id], ctx, reject_data.ragione):
+        _booking, _slot, venue_id, _data = await load_booking(db, booking_id)
+        if venue_id is None or venue_id not in ctx.venue_ids:
+            raise HTTPException(status_code=403, detail="Non autorizzato")
+        raise HTTPException(
+            status_code=400, detail="Questa prenotazione è già stata gestita")
 
-    db.commit()
-    return {"message": "Prenotazione rifiutata", "ragione": booking.ragione}
+    return {"message": "Prenotazione rifiutata", "ragione": reject_data.ragione}
 
 
-@router.post("/{booking_id}/cancel")
-def cancel_booking(
+@router.post("/{booking_id}/cancel", response_model=BookingActionResult)
+async def cancel_booking(
     booking_id: int,
     cancel_data: BookingReject,
-    db: Session = Depends(get_db),
-    current_user: Person = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    ctx: AuthContext = Depends(get_auth_context),
     _= Depends(check_account_not_frozen)
 ):
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
-    
-    if not booking:
-        raise HTTPException(status_code=404, detail="Prenotazione non trovata")
-
-    slot = db.query(Slot).filter(
-        Slot.id == booking.slot_id).first()
-    calendar = db.query(Calendar).filter(
-        Calendar.id == slot.calendar_id).first() if slot else None
-    venue = db.query(Venue).filter(
-        Venue.id == calendar.venue_id).first() if calendar else None
-    utente_attuale = current_user.id
-    band = booking.band_id
-    is_member = db.query(pers_band).filter(
-        pers_band.person_id == utente_attuale, pers_band.band_id == band).first()
-    promoter = booking.promoter_id
-    d_artistico = venue.direttore_id if venue else None
-
-    if utente_attuale != d_artistico: # type: ignore
-        if not is_member:
-            if utente_attuale != promoter: # type: ignore
-                raise HTTPException(
-                    status_code=403, detail="Autorizzazione negata")
-
     # Verifichiamo che la motivazione sia presente
     if not cancel_data.ragione or len(cancel_data.ragione.strip()) == 0:
         raise HTTPException(
             status_code=400, detail="La motivazione della cancellazione è obbligatoria per tutti gli utenti")
 
-    # Logica di cancellazione: lo slot torna disponibile
-    booking.stato_prenotazione = BookingState.annullata # type: ignore
-    booking.ragione = cancel_data.ragione # type: ignore
-
-    slot = db.query(Slot).filter(Slot.id == booking.slot_id).first()
-    if slot:
-        slot.stato = SlotType.disponibile # type: ignore
-
-    data_evento: date | None = calendar.data if calendar else None # type: ignore
+    #può annullare il direttore del locale, un membro della band o il promoter
+    permesso = or_(
+        Calendar.venue_id.in_(ctx.venue_ids),
+        Booking.band_id.in_(ctx.band_ids),
+        Booking.promoter_id == ctx.user_id,
+    )
+    # Logica di cancellazione: lo slot torna disponibile, a meno che la data dell'evento sia già arrivata
     today = date.today()
-    if data_evento and today >= data_evento:
-        if slot:
-            slot.stato = SlotType.occupato # type: ignore
-    else:
-        if slot:
-            slot.stato = SlotType.disponibile # type: ignore
+    stato_slot = lambda t: slot_state_if(t.c.data <= today, SlotType.occupato, SlotType.disponibile)
+
+    if not await transition_bookings(
+            db, [booking_id], STATI_ATTIVI, BookingState.annullata, permesso, stato_slot, ragione=cancel_data.ragione):
+        booking, _slot, venue_id, _data = await load_booking(db, booking_id)
+        is_director = venue_id is not None and venue_id in ctx.venue_ids
+        is_member = booking.band_id is not None and booking.band_id in ctx.band_ids
+        is_promoter = booking.promoter_id is not None and booking.promoter_id == ctx.user_id
+        if not (is_director or is_member or is_promoter):
+            raise HTTPException(
+                status_code=403, detail="Autorizzazione negata")
+        raise HTTPException(
+            status_code=400, detail="Questa prenotazione non è più attiva")
 
-    db.commit()
     return {"message": "Prenotazione annullata correttamente"}
 
 
-@router.get("/my-bookings")
-def get_my_bookings(
-    db: Session = Depends(get_db),
-    current_user: Person = Depends(get_current_user),
+@router.get("/my-bookings", response_model=Page[BookingRead])
+async def get_my_bookings(
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Restituisce tutte le prenotazioni in streaming"),
+    db: AsyncSession = Depends(get_db),
+    ctx: AuthContext = Depends(get_auth_context),
     _= Depends(check_account_not_frozen)
 ):
-    if current_user.tipo_utente != PersonType.artista: # type: ignore
+    if ctx.tipo_utente != PersonType.artista:
         raise HTTPException(
             status_code=403, detail="Accesso riservato agli artisti")
-    my_bookings = db.query(Booking).join(Band).join(pers_band).filter(
-        pers_band.person_id == current_user.id).all()
-
-    return my_bookings
+    query = select(Booking).filter(Booking.band_id.in_(ctx.band_ids))
+    if stream:
+        return stream_json(query.order_by(Booking.id), lambda b: BookingRead.model_validate(b).model_dump_json())
+    if not ctx.band_ids:
+        return {"items": [], "next_cursor": None}
+
+    my_bookings = (await db.scalars(apply_keyset(query, [Booking.id], cursor, limit))).all()
+    return build_page(my_bookings, lambda b: (b.id,), limit)
@@ -1,29 +1,16 @@
 from datetime import date,time, datetime,timedelta
-from sqlalchemy.orm import Session
-from app.core.database import SessionLocal
-from fastapi import APIRouter,Depends, HTTPException
-from app.models.models import Calendar,Slot,Booking, enum
-from app.schemas.schemas import CalendarCreate,CalendarSchema,SlotBooking
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
+from fastapi import APIRouter,Depends, HTTPException, Query
+from app.models.models import Calendar,Slot,PersonType, enum
+from app.schemas.schemas import CalendarCreate,SlotBooking,CalendarRead,Page,CalendarBulkCreate,CalendarBulkResult,BookingRead
+from app.api.routes.auth import get_auth_context
+from app.services.auth_context import AuthContext
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset, build_page, stream_json
+from app.services.read_models import CALENDARS
 from app.services.sanction_service import check_account_not_frozen
-import os
-from dotenv import load_dotenv
-from fastapi_mail import ConnectionConfig,FastMail,MessageSchema, MessageType
-load_dotenv()
-
-conf = ConnectionConfig(
-    MAIL_USERNAME = os.getenv("MAIL_USERNAME", ""),
-    MAIL_PASSWORD = str(os.getenv("MAIL_PASSWORD","")), # type: ignore
-    MAIL_FROM = os.getenv("MAIL_FROM",""),
-    MAIL_PORT = int(os.getenv("MAIL_PORT",587)),
-    MAIL_SERVER = os.getenv("MAIL_SERVER",""),
-    MAIL_STARTTLS = True,
-    MAIL_SSL_TLS = False,
-    USE_CREDENTIALS = True,
-    VALIDATE_CERTS = True
-)
-
-
-
+from app.services.booking_service import reserve_slot
 
 
 router = APIRouter()
@@ -44,92 +31,144 @@ def calcolaDurataSlot(data:date, inizio:time, fine:time, slots:int):
     """
     inizio_dt:datetime = datetime.combine(data,inizio)
     fine_dt:datetime = datetime.combine(data,fine)
+    if fine_dt <= inizio_dt: #la serata termina dopo la mezzanotte
+        fine_dt += timedelta(days=1)
     durata_slots = (fine_dt-inizio_dt) / slots
     return durata_slots
 
-def get_db(): #apro la connessione con il database
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def generaOrariSlot(data:date, inizio:time, fine:time, slots:int):
+    """
+    Divide la serata in `slots` slot di uguale durata.
+
+    return: lista di coppie (orario_inizio, orario_fine)
+    """
+    durata = calcolaDurataSlot(data,inizio,fine,slots)
+    attuale_dt = datetime.combine(data,inizio)
+    orari = []
+    for n in range(slots):
+        fine_dt = attuale_dt + durata
+        orari.append((attuale_dt.time(), fine_dt.time()))
+        attuale_dt = fine_dt
+    return orari
+
+def dateRicorrenti(dal:date, al:date, giorni_settimana:list[int], ogni_n_settimane:int = 1):
+    """
+    Restituisce le date tra `dal` e `al` (inclusi) che cadono nei giorni indicati
+    (0 = lunedì), una settimana ogni `ogni_n_settimane` a partire da quella di `dal`.
+    """
+    giorni = set(giorni_settimana)
+    lunedi_iniziale = dal - timedelta(days=dal.weekday())
+    date_valide = []
+    giorno = dal
+    while giorno <= al:
+        settimana = (giorno - lunedi_iniziale).days // 7
+        if giorno.weekday() in giorni and settimana % ogni_n_settimane == 0:
+            date_valide.append(giorno)
+        giorno += timedelta(days=1)
+    return date_valide
 
 #Endpoint POST per la creazione di un calendario e di relativi slot "a scelta" del direttore artistico
-@router.post("/", response_model = CalendarSchema)
-def create_calendar(calendar_data:CalendarCreate, db:Session = Depends(get_db),_= Depends(check_account_not_frozen)):
+@router.post("/", response_model = CalendarRead)
+async def create_calendar(calendar_data:CalendarCreate, db:AsyncSession = Depends(get_db),_= Depends(check_account_not_frozen)):
     try:
         data = calendar_data.data
         data_inizio = calendar_data.ora_inizio
         data_fine = calendar_data.ora_fine
         slot_disponibili = calendar_data.numero_slot
-        durata = calcolaDurataSlot(data,data_inizio,data_fine,slot_disponibili)
         calendar = Calendar(data=data,data_inizio=data_inizio,data_fine=data_fine,slot_disponibili=slot_disponibili)
     
         db.add(calendar)
-        db.commit()
-        db.refresh(calendar)
+        await db.flush() #ottengo l'id, calendario e slot vengono salvati nella stessa transazione
     
-        attuale_dt =datetime.combine(data,data_inizio)
-        for n in range(slot_disponibili):
-            fine_dt = durata + attuale_dt
-            slot = Slot(orario_inizio=attuale_dt,orario_fine=fine_dt,calendar_id=calendar.id)
-            attuale_dt = fine_dt
-            db.add(slot)
-        db.commit()
+        for orario_inizio, orario_fine in generaOrariSlot(data,data_inizio,data_fine,slot_disponibili):
+            db.add(Slot(orario_inizio=orario_inizio,orario_fine=orario_fine,calendar_id=calendar.id))
+        await db.commit()
     except Exception as error:
         raise HTTPException(status_code=500, detail=f"Errore: {error}")
     
     return calendar
 
 
-#Enndpoint GET per recuperare tutti i calendari.
-@router.get("/", response_model=list[CalendarSchema])
-def get_calendars(db:Session = Depends(get_db),_=Depends(check_account_not_frozen)):
-    try:
-     calendar_list = db.query(Calendar).all()
-    except Exception as error:
-        raise HTTPException(status_code=500, detail= f"Errore: {error}")
-    return calendar_list
+#Endpoint POST per creare in un colpo solo i calendari di una stagione (date ricorrenti + layout degli slot)
+@router.post("/bulk", response_model=CalendarBulkResult)
+async def create_calendars_bulk(
+    bulk:CalendarBulkCreate,
+    db:AsyncSession = Depends(get_db),
+    ctx:AuthContext = Depends(get_auth_context),
+    _= Depends(check_account_not_frozen)
+):
+    if ctx.tipo_utente != PersonType.direttoreArtistico:
+        raise HTTPException(status_code=403, detail="Solo il direttore artistico può creare i calendari")
+    #il locale deve essere del direttore; se ne gestisce uno solo può essere omesso
+    venue_id = bulk.venue_id
+    if venue_id is None and len(ctx.venue_ids) == 1:
+        venue_id = next(iter(ctx.venue_ids))
+    if venue_id is None or venue_id not in ctx.venue_ids:
+        raise HTTPException(status_code=403, detail="Locale non valido per questo direttore")
 
+    if bulk.al < bulk.dal or (bulk.al - bulk.dal).days > 366:
+        raise HTTPException(status_code=400, detail="Intervallo di date non valido (massimo un anno)")
+    if not bulk.giorni_settimana or any(g < 0 or g > 6 for g in bulk.giorni_settimana) or bulk.ogni_n_settimane < 1:
+        raise HTTPException(status_code=400, detail="Ricorrenza non valida")
+
+    #il layout degli slot è lo stesso per ogni data: lo calcolo una volta sola
+    if bulk.slots:
+        orari = [(s.orario_inizio, s.orario_fine) for s in bulk.slots]
+    elif bulk.numero_slot >= 1:
+        orari = generaOrariSlot(bulk.dal,bulk.ora_inizio,bulk.ora_fine,bulk.numero_slot)
+    else:
+        raise HTTPException(status_code=400, detail="Occorre indicare almeno uno slot")
+
+    date_calendari = dateRicorrenti(bulk.dal,bulk.al,bulk.giorni_settimana,bulk.ogni_n_settimane)
+    if not date_calendari:
+        return {"calendari_creati": 0, "slot_creati": 0, "calendar_ids": []}
 
-#ENDPOINT POST per creare la prenotazione.
-@router.post("/{slot_id}")
-async def book(slot_id:int, booking_data:SlotBooking, db:Session = Depends(get_db),_=Depends(check_account_not_frozen)):
-    slot= None
     try:
-        slot = db.query(Slot).filter(Slot.id==slot_id).first() #cerco lo slot
-        active_booking = db.query(Booking).filter(Booking.slot_id == slot_id,Booking.stato_prenotazione.notin_(['rifiutata', 'annullata'])).first() #una prenotazione attiva in quello slot
-        
+        #INSERT multi-riga dei calendari (RETURNING degli id nello stesso ordine) e poi degli slot
+        calendar_ids = (await db.scalars(
+            insert(Calendar).returning(Calendar.id, sort_by_parameter_order=True),
+            [{
+                "data": giorno,
+                "data_inizio": bulk.ora_inizio,
+                "data_fine": bulk.ora_fine,
+                "slot_disponibili": len(orari),
+                "venue_id": venue_id,
+            } for giorno in date_calendari]
+        )).all()
+        await db.execute(insert(Slot), [
+            {"orario_inizio": inizio, "orario_fine": fine, "calendar_id": calendar_id}
+            for calendar_id in calendar_ids for inizio, fine in orari
+        ])
+        await db.commit()
     except Exception as error:
-        raise HTTPException(status_code=500,detail=f"Error: {error}")
-    if not slot:
-        raise HTTPException(status_code=404, detail="Errore, slot non trovato")
-        
-    if active_booking:
-        raise HTTPException(status_code=409, detail="Errore, Slot già occupato")
-    data_scadenza = datetime.now() + timedelta(days=5)
-    new_book = Booking(
-        slot_id=slot_id,
-        band_id=booking_data.artista_id,
-        stato_prenotazione='pendente',
-        scadenza = data_scadenza,
-        message = "Richiesta di prenotazione"
-        )
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Errore: {error}")
+
+    return {"calendari_creati": len(calendar_ids), "slot_creati": len(calendar_ids) * len(orari), "calendar_ids": calendar_ids}
+
+
+#Enndpoint GET per recuperare i calendari, paginati per (data, id) oppure in streaming.
+@router.get("/", response_model=Page[CalendarRead])
+async def get_calendars(
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Restituisce tutti i calendari in streaming"),
+    db:AsyncSession = Depends(get_db),
+    _=Depends(check_account_not_frozen)
+):
+    if stream:
+        return stream_json(CALENDARS.select().order_by(Calendar.data, Calendar.id), CALENDARS.dump_json, scalars=False)
+    query = apply_keyset(CALENDARS.select(), [Calendar.data, Calendar.id], cursor, limit)
     try:
-        db.add(new_book)
-        db.commit()
-        db.refresh(new_book)
-        
-        message = MessageSchema(
-            subject="Hai una nuova Prenotazione su EasyGIG!",
-            recipients=["easygigapp1.0@gmail.com"], # type: ignore
-            body=f"Ciao! È arrivata una nuova richiesta di prenotazione per lo slot {slot_id}.",
-            subtype=MessageType.html
-        )
-        fm=FastMail(conf)
-        await fm.send_message(message)
+     calendar_list = CALENDARS.build_all((await db.execute(query)).all())
     except Exception as error:
-        print(f"Errore invio mail: {error}")
-        raise HTTPException(status_code=500, detail=f"Errore: {error}")
-    
+        raise HTTPException(status_code=500, detail= f"Errore: {error}")
+    return build_page(calendar_list, lambda c: (c.data, c.id), limit)
+
+
+#ENDPOINT POST per creare la prenotazione.
+@router.post("/{slot_id}", response_model=BookingRead)
+async def book(slot_id:int, booking_data:SlotBooking, db:AsyncSession = Depends(get_db),_=Depends(check_account_not_frozen)):
+    #slot bloccato, prenotazione e mail al direttore (outbox) nella stessa transazione; 409 se già preso
+    new_book = await reserve_slot(db, slot_id, booking_data.artista_id)
     return new_book
@@ -0,0 +1,189 @@
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import case, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import AsyncSessionLocal, get_db
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset, build_page
+from app.api.routes.auth import get_auth_context
+from app.models.models import Calendar, Chat, Message
+from app.schemas.schemas import ChatRead, ChatReadResult, MessageCreate, MessageRead, Page
+from app.services.auth_context import AuthContext, get_cached_auth_context
+from app.services.chat import (MAX_LUNGHEZZA_MESSAGGIO, ChatAccess, chat_hub, chats_query, load_chat_access,
+                               mark_read, participant_filter, send_message)
+from app.services.sanction_service import check_account_not_frozen
+from app.services.tokens import decode_access_token
+
+
+router = APIRouter(prefix="/chats", tags=["Chat"])
+
+
+def check_testo(testo: str) -> str:
+    testo = testo.strip()
+    if not testo:
+        raise HTTPException(status_code=400, detail="Il messaggio è vuoto")
+    if len(testo) > MAX_LUNGHEZZA_MESSAGGIO:
+        raise HTTPException(
+            status_code=400, detail=f"Il messaggio supera i {MAX_LUNGHEZZA_MESSAGGIO} caratteri")
+    return testo
+
+
+async def get_chat_access(chat_id: int, db: AsyncSession, ctx: AuthContext) -> ChatAccess:
+    accesso = await load_chat_access(db, chat_id, ctx)
+    if not accesso:
+        raise HTTPException(status_code=404, detail="Chat non trovata")
+    return accesso
+
+
+@router.get("/", response_model=Page[ChatRead])
+async def get_chats(
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    ctx: AuthContext = Depends(get_auth_context)
+):
+    #i non letti sono quelli del lato dell'utente: locale o band/promoter
+    non_letti = case((Calendar.venue_id.in_(ctx.venue_ids), Chat.non_letti_direttore),
+                     else_=Chat.non_letti_controparte)
+    query = (
+        chats_query().with_only_columns(
+            Chat.id, Chat.booking_id, Chat.data_apertura, Chat.ultimo_messaggio, non_letti.label("non_letti"))
+        .filter(participant_filter(ctx))
+    )
+    righe = (await db.execute(apply_keyset(query, [Chat.id], cursor, limit))).all()
+    return build_page(righe, lambda c: (c.id,), limit, serialize=lambda c: c._asdict())
+
+
+@router.get("/{chat_id}/messages", response_model=Page[MessageRead])
+async def get_messages(
+    chat_id: int,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    ctx: AuthContext = Depends(get_auth_context)
+):
+    await get_chat_access(chat_id, db, ctx)
+    #dal più recente al più vecchio; il cursore porta ai messaggi precedenti
+    query = select(Message).filter(Message.chat_id == chat_id)
+    messaggi = (await db.scalars(apply_keyset(query, [Message.id], cursor, limit, desc=True))).all()
+    return build_page(messaggi, lambda m: (m.id,), limit)
+
+
+@router.post("/{chat_id}/messages", response_model=MessageRead)
+async def post_message(
+    chat_id: int,
+    messaggio: MessageCreate,
+    db: AsyncSession = Depends(get_db),
+    ctx: AuthContext = Depends(get_auth_context),
+    _= Depends(check_account_not_frozen)):
+    testo = check_testo(messaggio.testo)
+    accesso = await get_chat_access(chat_id, db, ctx)
+    evento = await send_message(db, accesso, ctx.user_id, testo)
+    return {**evento, "letto": False}
+
+
+@router.post("/{chat_id}/read", response_model=ChatReadResult)
+async def read_chat(
+    chat_id: int,
+    db: AsyncSession = Depends(get_db),
+    ctx: AuthContext = Depends(get_auth_context)
+):
+    accesso = await get_chat_access(chat_id, db, ctx)
+    return {"letti": await mark_read(db, accesso)}
+
+
+def errore(coda: asyncio.Queue, detail: str):
+    #se la coda è piena il client verrà comunque disconnesso: l'errore si può perdere
+    try:
+        coda.put_nowait(json.dumps({"tipo": "errore", "detail": detail}, ensure_ascii=False, separators=(",", ":")))
+    except asyncio.QueueFull:
+        pass
+
+
+@router.websocket("/{chat_id}/ws")
+async def chat_socket(websocket: WebSocket, chat_id: int, token: str = Query(...)):
+    """
+    Il client invia {"tipo": "messaggio", "testo": ...} oppure {"tipo": "letto"};
+    riceve gli eventi della chat ("messaggio", "letti") ed eventuali errori.
+    Il token JWT è nella query string perché i browser non permettono header sui WebSocket.
+    Token e account si ricontrollano a ogni operazione: token scaduto o revocato (es. ban) chiude il socket con 1008.
+    """
+    try:
+        claims = decode_access_token(token)
+    except HTTPException as error:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=error.detail)
+        return
+    user_id = claims.user_id
+
+    #nessuna sessione resta aperta per la durata della connessione: una per operazione
+    async with AsyncSessionLocal() as db:
+        ctx = await get_cached_auth_context(db, user_id)
+        accesso = await load_chat_access(db, chat_id, ctx) if ctx else None
+    if not ctx or not accesso:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Chat non trovata")
+        return
+
+    await websocket.accept()
+    coda = chat_hub.subscribe(chat_id)
+
+    async def ricevi():
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", status.WS_1000_NORMAL_CLOSURE))
+            if frame.get("text") is None:
+                errore(coda, "Sono ammessi solo messaggi di testo (JSON)")
+                continue
+            try:
+                dati = json.loads(frame["text"])
+                tipo = dati.get("tipo")
+            except (ValueError, AttributeError):
+                errore(coda, "Formato del messaggio non valido")
+                continue
+            #il token letto alla connessione può essere scaduto o revocato (ban, sblocco) nel frattempo
+            if not claims.ancora_valido():
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION,
+                                      reason="Token scaduto o revocato, rinnova l'accesso")
+                return
+            try:
+                if tipo == "messaggio":
+                    testo = check_testo(str(dati.get("testo") or ""))
+                    async with AsyncSessionLocal() as db:
+                        #contesto dalla cache, svuotata su ogni worker quando cambia lo stato dell'account
+                        ctx = await get_cached_auth_context(db, user_id)
+                        if not ctx or ctx.congelato:
+                            raise HTTPException(status_code=403, detail="Account bloccato: non puoi inviare messaggi")
+                        await send_message(db, accesso, user_id, testo)
+                elif tipo == "letto":
+                    async with AsyncSessionLocal() as db:
+                        await mark_read(db, accesso)
+                else:
+                    errore(coda, "Tipo di messaggio sconosciuto")
+            except HTTPException as error:
+                errore(coda, error.detail)
+
+    async def inoltra():
+        #unico punto che scrive sul socket: eventi della chat ed errori passano dalla coda
+        while True:
+            testo = await coda.get()
+            if testo is None:
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Client troppo lento")
+                return
+            await websocket.send_text(testo)
+
+    lettura = asyncio.create_task(ricevi())
+    scrittura = asyncio.create_task(inoltra())
+    try:
+        fatti, _ = await asyncio.wait({lettura, scrittura}, return_when=asyncio.FIRST_COMPLETED)
+        for task in fatti:
+            if not task.cancelled() and not isinstance(task.exception(), (WebSocketDisconnect, type(None))):
+                print(f"Errore nella chat {chat_id}: {task.exception()}")
+                #il client riceve la chiusura con il motivo invece di un socket che smette di rispondere
+                try:
+                    await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason="Errore interno della chat")
+                except RuntimeError:
+                    pass
+    finally:
+        lettura.cancel()
+        scrittura.cancel()
+        chat_hub.unsubscribe(chat_id, coda)
@@ -0,0 +1,153 @@
+import asyncio
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.routes.auth import get_auth_context
+from app.core.config import get_settings
+from app.core.database import get_db
+from app.models.models import Photo, PersonType
+from app.schemas.schemas import PhotoRead
+from app.services.auth_context import AuthContext
+from app.services.media import (FORMATI_FOTO, MEDIA_ROOT, NOME_FILE, THUMBNAIL_SIZES, UPLOAD_MAX_BYTES, file_path,
+                                media_file_response, media_worker, remove_stored, store_upload, thumbnail_name)
+from app.services.sanction_service import check_account_not_frozen
+
+settings = get_settings()
+#i file non cambiano mai contenuto (il nome è il loro sha256): il browser può tenerli per sempre
+CACHE_CONTROL_FILE = f"public, max-age={settings.media_max_age}, immutable"
+#miniatura non ancora pronta: si serve l'originale, da non tenere in cache a lungo
+CACHE_CONTROL_RIPIEGO = "public, max-age=60"
+
+router = APIRouter(prefix="/photos", tags=["Foto"])
+
+
+def photo_read(foto: Photo) -> dict:
+    nome_file = os.path.basename(str(foto.source))
+    digest = nome_file.split(".")[0]
+    return {
+        "id": foto.id,
+        "nome": foto.nome,
+        "url": f"{router.prefix}/files/{nome_file}",
+        "miniature": {lato: f"{router.prefix}/files/{thumbnail_name(digest, lato)}" for lato in THUMBNAIL_SIZES},
+        "venue_id": foto.venue_id,
+        "person_id": foto.person_id,
+    }
+
+
+async def discard_orphan(db: AsyncSession, nome_file: str, source: str):
+    # file scritto da questa richiesta ma nessuna foto salvata: se nessun'altra riga lo usa resterebbe orfano su disco
+    try:
+        await db.rollback()
+        if await db.scalar(select(Photo.id).filter(Photo.source == source).limit(1)) is None:
+            await asyncio.to_thread(remove_stored, nome_file)
+    except Exception as error:
+        print(f"File {nome_file} non rimosso dopo l'errore: {error}")
+
+
+async def save_photo(request: Request, response: Response, db: AsyncSession, nome: str,
+                     venue_id: int | None = None, person_id: int | None = None) -> dict:
+    # rifiuto subito i file dichiarati troppo grandi, senza leggere il corpo
+    lunghezza = request.headers.get("content-length")
+    if lunghezza and lunghezza.isdigit() and int(lunghezza) > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"La foto supera il limite di {UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
+
+    # il corpo della richiesta è il file: va su disco a blocchi mentre arriva
+    salvato = await store_upload(request.stream())
+    source = file_path(salvato.nome_file)
+
+    try:
+        # lo stesso file già caricato dallo stesso proprietario non crea una seconda foto
+        esistente = select(Photo).filter(Photo.source == source, Photo.venue_id == venue_id, Photo.person_id == person_id)
+        foto = await db.scalar(esistente)
+        if foto:
+            response.status_code = 200
+        else:
+            foto = Photo(nome=nome, source=source, venue_id=venue_id, person_id=person_id)
+            db.add(foto)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # caricamento identico arrivato in contemporanea: l'indice unico tiene la sua riga, restituisco quella
+                await db.rollback()
+                foto = await db.scalar(esistente)
+                if not foto:
+                    raise HTTPException(status_code=400, detail="Dati della foto non validi")
+                response.status_code = 200
+    except Exception:
+        if salvato.nuovo:
+            await discard_orphan(db, salvato.nome_file, source)
+        raise
+
+    # miniature fuori dal percorso della richiesta (quelle già presenti non vengono rifatte)
+    media_worker.thumbnails(salvato.nome_file)
+    return photo_read(foto)
+
+
+@router.post("/venue/{venue_id}", response_model=PhotoRead, status_code=201,
+             openapi_extra={"requestBody": {"content": {t: {} for t in FORMATI_FOTO.values()}, "required": True}})
+async def upload_venue_photo(
+    venue_id: int,
+    request: Request,
+    response: Response,
+    nome: str = Query(..., min_length=1, max_length=200),
+    ctx: AuthContext = Depends(get_auth_context),
+    _= Depends(check_account_not_frozen),
+    db: AsyncSession = Depends(get_db)
+):
+    # solo il direttore del locale può caricarne le foto
+    if ctx.tipo_utente != PersonType.direttoreArtistico or venue_id not in ctx.venue_ids:
+        raise HTTPException(status_code=403, detail="Accesso negato: puoi caricare foto solo per i tuoi locali")
+    return await save_photo(request, response, db, nome, venue_id=venue_id)
+
+
+@router.post("/me", response_model=PhotoRead, status_code=201,
+             openapi_extra={"requestBody": {"content": {t: {} for t in FORMATI_FOTO.values()}, "required": True}})
+async def upload_my_photo(
+    request: Request,
+    response: Response,
+    nome: str = Query(..., min_length=1, max_length=200),
+    ctx: AuthContext = Depends(get_auth_context),
+    _= Depends(check_account_not_frozen),
+    db: AsyncSession = Depends(get_db)
+):
+    return await save_photo(request, response, db, nome, person_id=ctx.user_id)
+
+
+@router.get("/venue/{venue_id}", response_model=list[PhotoRead])
+async def get_venue_photos(venue_id: int, db: AsyncSession = Depends(get_db)):
+    foto = (await db.scalars(select(Photo).filter(Photo.venue_id == venue_id).order_by(Photo.id))).all()
+    return [photo_read(f) for f in foto]
+
+
+@router.get("/person/{person_id}", response_model=list[PhotoRead])
+async def get_person_photos(person_id: int, db: AsyncSession = Depends(get_db)):
+    foto = (await db.scalars(select(Photo).filter(Photo.person_id == person_id).order_by(Photo.id))).all()
+    return [photo_read(f) for f in foto]
+
+
+@router.get("/files/{nome_file}", response_class=FileResponse)
+async def get_photo_file(nome_file: str, request: Request):
+    # solo nomi generati da noi: niente percorsi arbitrari
+    trovato = NOME_FILE.match(nome_file)
+    if not trovato:
+        raise HTTPException(status_code=404, detail="File non trovato")
+    etag = f'"{nome_file.split(".")[0]}"'
+    cache_control = CACHE_CONTROL_FILE
+    relativo = file_path(nome_file)
+
+    if not os.path.exists(os.path.join(MEDIA_ROOT, relativo)):
+        digest, lato = trovato.group(1), trovato.group(2)
+        originale = next((f"{digest}.{ext}" for ext in ("jpg", "png", "webp")
+                          if lato and os.path.exists(os.path.join(MEDIA_ROOT, file_path(f"{digest}.{ext}")))), None)
+        if not originale:
+            raise HTTPException(status_code=404, detail="File non trovato")
+        # miniatura non ancora generata (o persa): la rimetto in coda e intanto servo l'originale
+        media_worker.thumbnails(originale)
+        nome_file, relativo = originale, file_path(originale)
+        etag = f'"{digest}"'
+        cache_control = CACHE_CONTROL_RIPIEGO
+
+    return media_file_response(request, relativo, FORMATI_FOTO[nome_file.rsplit(".", 1)[1]], etag, cache_control)
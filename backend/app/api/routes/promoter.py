@@ -1,16 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.api.routes.auth import get_current_user, get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
+from app.api.routes.auth import get_current_user
 from app.models.models import Person, PersonType
-from app.schemas.schemas import PromoterUpdate
+from app.schemas.schemas import PromoterUpdate, UserRead
 
 router = APIRouter(prefix="/promoters", tags=["Promoters"])
 
 
-@router.put("/me")
-def update_promoter(
+@router.put("/me", response_model=UserRead)
+async def update_promoter(
     update: PromoterUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: Person = Depends(get_current_user)
 ):
     # Verifichiamo il ruolo
@@ -33,7 +34,7 @@ def update_promoter(
     if update.descrizione is not None:
         current_user.descrizione = update.descrizione
     # salvataggio nel db
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
 
     return current_user
@@ -0,0 +1,50 @@
+from typing import List
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.conditional import conditional_response
+from app.core.config import get_settings
+from app.core.database import get_db
+from app.schemas.schemas import CityRead, GenreRead, NationRead, ReferenceEnums, ReferenceRead, RegionRead
+from app.services.reference import reference_cache
+
+# Dati di riferimento per filtri e menu a tendina, serviti dalla cache in memoria con ETag:
+# il client ripresenta l'ETag in If-None-Match e riceve 304 finché i dati non cambiano.
+
+CACHE_CONTROL = f"public, max-age={get_settings().reference_max_age}"
+
+router = APIRouter(prefix="/reference", tags=["Dati di riferimento"])
+
+
+async def reference_response(sezione: str, request: Request, db: AsyncSession):
+    dati = (await reference_cache.get(db)).sezioni[sezione]
+    return conditional_response(request, dati.body, dati.etag, CACHE_CONTROL)
+
+
+@router.get("/", response_model=ReferenceRead)
+async def get_reference(request: Request, db: AsyncSession = Depends(get_db)):
+    return await reference_response("tutti", request, db)
+
+
+@router.get("/genres", response_model=List[GenreRead])
+async def get_genres(request: Request, db: AsyncSession = Depends(get_db)):
+    return await reference_response("generi", request, db)
+
+
+@router.get("/nations", response_model=List[NationRead])
+async def get_nations(request: Request, db: AsyncSession = Depends(get_db)):
+    return await reference_response("nazioni", request, db)
+
+
+@router.get("/regions", response_model=List[RegionRead])
+async def get_regions(request: Request, db: AsyncSession = Depends(get_db)):
+    return await reference_response("regioni", request, db)
+
+
+@router.get("/cities", response_model=List[CityRead])
+async def get_cities(request: Request, db: AsyncSession = Depends(get_db)):
+    return await reference_response("citta", request, db)
+
+
+@router.get("/enums", response_model=ReferenceEnums)
+async def get_enums(request: Request, db: AsyncSession = Depends(get_db)):
+    return await reference_response("enum", request, db)
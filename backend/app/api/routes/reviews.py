@@ -1,96 +1,83 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from app.models.models import Booking, Review, Score, BookingState, Slot, Person
-from app.api.routes.auth import get_current_user, get_db
-from app.schemas.schemas import ReviewCreate
+from app.core.database import get_db
+from app.models.models import Booking, Review, Score, BookingState, Slot, Person, Calendar, Venue, pers_band
+from app.api.routes.auth import get_current_user
+from app.schemas.schemas import ReviewCreate, ReviewResult
 
 
 router = APIRouter(prefix="/reviews", tags=["Reviews"])
 
-def update_reputation_score(recensito_id:int, db:Session):
-    media = db.query(func.avg(Score.voto)).join(Review).filter(
-        Review.recensito_id == recensito_id
-    ).scalar()
-    
-    if media is not None:
-        
-        persona = db.query(Person).filter(Person.id == recensito_id).first()
-        if persona:
-            persona.reputazione = round(float(media),2) # type: ignore
-            
-            db.commit()
-
-
-@router.post("/")
-def write_reviews(
+@router.post("/", response_model=ReviewResult)
+async def write_reviews(
         review_data: ReviewCreate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user=Depends(get_current_user)
 ):
-    
-    booking = db.query(Booking).filter(Booking.id == review_data.booking_id).first()
-    if not booking:
+
+    #booking -> slot -> calendar -> venue in un'unica query
+    riga = (await db.execute(
+        select(Booking, Slot, Calendar, Venue.direttore_id)
+        .join(Slot, Booking.slot_id == Slot.id)
+        .join(Calendar, Slot.calendar_id == Calendar.id)
+        .join(Venue, Calendar.venue_id == Venue.id)
+        .filter(Booking.id == review_data.booking_id)
+    )).first()
+    if not riga:
         raise HTTPException(status_code=404, detail="Prenotazione non trovata")
-    fine_evento = datetime.combine(booking.slot.data, booking.slot.ora_fine)
-    
-    if datetime.now() < fine_evento and booking.stato != BookingState.annullata:
+    booking, slot, calendario, direttore_id = riga
+    fine_evento = datetime.combine(calendario.data, slot.orario_fine)
+
+    if datetime.now() < fine_evento and booking.stato_prenotazione != BookingState.annullata:
         raise HTTPException(
             status_code=400,
             detail="Non puoi ancora recensire: L'evento non è terminato e non è stato annullato"
         )
-        
-    direttore_id = booking.slot.venue.direttore_id
-    autore_booking_id = booking.user_id
-    
-    if current_user.id == autore_booking_id:
+
+    #l'autore della prenotazione è il promoter oppure un membro della band
+    membri_band = (await db.scalars(
+        select(pers_band.person_id).filter(pers_band.band_id == booking.band_id)
+    )).all() if booking.band_id else []
+    autore_booking_id = booking.promoter_id or (membri_band[0] if membri_band else None)
+
+    if current_user.id == autore_booking_id or current_user.id in membri_band:
         recensito_id = direttore_id
     elif current_user.id == direttore_id:
         recensito_id = autore_booking_id
     else:
         raise HTTPException(status_code=403, detail="Non fai parte di questa prenotazione")
-        
-        
-    exist = db.query(Review).filter(
+
+
+    exist = await db.scalar(select(Review.id).filter(
         Review.booking_id == booking.id,
-        Review.recensore_id == current_user.id
-    ).first()
+        Review.autore_id == current_user.id
+    ))
     if exist:
         raise HTTPException(status_code=400, detail=" Hai già lasciato una recensione per questo evento")
-    
-    new_review = Review(
-        testo = review_data.testo,
-        booking_id = booking.id,
-        recensore_id = current_user.id,
-        recensito_id = recensito_id # type: ignore
-    )
-    db.add(new_review)
-    db.flush()
-    
+
     try:
         nuova_review = Review(
-            testo=review_data.testo,
+            description=review_data.testo or "",
             booking_id=booking.id,
-            recensore_id=current_user.id,
-            recensito_id=recensito_id
+            autore_id=current_user.id,
+            destinatario_id=recensito_id
         )
         db.add(nuova_review)
-        db.flush() # Otteniamo l'ID per lo Score
+        await db.flush() # Otteniamo l'ID per lo Score
 
         nuovo_voto = Score(
             voto=review_data.voto,
             review_id=nuova_review.id
         )
         db.add(nuovo_voto)
-        db.commit()
-
-        # 6. Aggiornamento dinamico della reputazione
-        update_reputation_score(recensito_id, db)
+        # La reputazione del destinatario viene aggiornata dal trigger aggiorna_reputazione
+        # (somma e numero dei voti), nella stessa transazione
+        await db.commit()
 
         return {"status": "success", "message": "Recensione inviata e reputazione aggiornata"}
-    
+
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Errore durante il salvataggio della recensione")
-
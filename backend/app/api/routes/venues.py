@@ -1,38 +1,134 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
 from app.models.models import Venue, VenueType, Person, PersonType
-from app.api.routes.auth import get_current_user, get_db
-from app.schemas.schemas import VenueUpdate
+from app.api.routes.auth import get_current_user
+from app.schemas.schemas import VenueUpdate, VenueRead, OpenSlotRead, Page
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset, build_page, stream_json
+from app.services.read_models import OPEN_SLOTS, VENUES
+from app.services.availability import open_slot_key, open_slots_query
+from app.services.reference import reference_cache
+from app.services.response_cache import cached_page, invalidate_responses
+from app.core.config import get_settings
+from datetime import date
+
+MAX_GIORNI_RICERCA = 366 #ampiezza massima dell'intervallo di date nella ricerca degli slot liberi
+MAX_RAGGIO_KM = get_settings().geo_max_radius_km
 
 
 router = APIRouter(prefix="/venues", tags=["Venues"])
 
 
-@router.get("/")
-def get_venues(
+@router.get("/", response_model=Page[VenueRead])
+async def get_venues(
     nome: str | None = None,
     city_id: int | None = None,
+    regione: str | None = None,
+    nazione: str | None = None,
+    vicino_a: str | None = Query(None, description="Nome della città da cui misurare il raggio"),
+    lat: float | None = Query(None, ge=-90, le=90),
+    lon: float | None = Query(None, ge=-180, le=180),
+    raggio_km: float = Query(50, gt=0, le=MAX_RAGGIO_KM),
     tipo: VenueType | None = None,
-    db: Session = Depends(get_db)
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Restituisce tutti i locali in streaming"),
+    db: AsyncSession = Depends(get_db)
 ):
 
-    query = db.query(Venue)
+    if stream:
+        query = await venues_query(db, nome, city_id, regione, nazione, vicino_a, lat, lon, raggio_km, tipo)
+        return stream_json(query.order_by(Venue.id), VENUES.dump_json, scalars=False)
+
+    async def pagina():
+        query = await venues_query(db, nome, city_id, regione, nazione, vicino_a, lat, lon, raggio_km, tipo)
+        righe = (await db.execute(apply_keyset(query, [Venue.id], cursor, limit))).all()
+        return build_page(VENUES.build_all(righe), lambda v: (v.id,), limit)
+
+    #pagine uguali per tutti gli utenti: cache per parametri, svuotata dalle scritture sui locali
+    parametri = dict(nome=nome, city_id=city_id, regione=regione, nazione=nazione, vicino_a=vicino_a,
+                     lat=lat, lon=lon, raggio_km=raggio_km if vicino_a or lat is not None else None,
+                     tipo=tipo, cursor=cursor, limit=limit)
+    return await cached_page("venues", parametri, VenueRead, pagina)
+
+
+async def venues_query(db: AsyncSession, nome: str | None, city_id: int | None, regione: str | None,
+                       nazione: str | None, vicino_a: str | None, lat: float | None, lon: float | None,
+                       raggio_km: float, tipo: VenueType | None):
+    query = VENUES.select()
     if nome:
         query = query.filter(Venue.nome.ilike(f"%{nome}%"))
 
+    #la città è quella del locale, non quella del direttore
     if city_id:
-        query = query.join(Venue.direttore).filter(Person.city_id == city_id)
+        query = query.filter(Venue.city_id == city_id)
+
+    #regione, nazione e raggio diventano un elenco di città, risolto dall'indice in memoria
+    if regione or nazione or vicino_a or lat is not None or lon is not None:
+        city_ids = await venue_city_ids(db, regione, nazione, vicino_a, lat, lon, raggio_km)
+        query = query.filter(Venue.city_id.in_(sorted(city_ids)))
 
     if tipo:
         query = query.filter(Venue.tipo_sala == tipo)
+    return query
+
+
+async def venue_city_ids(db: AsyncSession, regione: str | None, nazione: str | None, vicino_a: str | None,
+                         lat: float | None, lon: float | None, raggio_km: float) -> set[int]:
+    indice = (await reference_cache.get(db)).geo
+    insiemi = []
+    if regione:
+        insiemi.append(indice.cities_in_region(regione))
+    if nazione:
+        insiemi.append(indice.cities_in_nation(nazione))
+    if vicino_a:
+        centro = indice.find_city(vicino_a)
+        if not centro or centro.latitudine is None:
+            raise HTTPException(status_code=404, detail=f"Città {vicino_a} non trovata o senza coordinate")
+        lat, lon = centro.latitudine, centro.longitudine
+    elif (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="Per la ricerca per raggio servono sia lat sia lon")
+    if lat is not None:
+        insiemi.append(indice.within(lat, lon, raggio_km)) # type: ignore
+    return set.intersection(*(set(i) for i in insiemi))
+
+
+@router.get("/availability", response_model=Page[OpenSlotRead])
+async def get_open_slots(
+    dal: date,
+    al: date,
+    giorni_settimana: list[int] | None = Query(None, description="0 = lunedì ... 6 = domenica"),
+    city_id: int | None = None,
+    regione: str | None = None,
+    tipo_sala: VenueType | None = None,
+    capienza_min: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Restituisce tutti gli slot liberi in streaming"),
+    db: AsyncSession = Depends(get_db)
+):
+    # controlli sull'intervallo di date
+    if al < dal:
+        raise HTTPException(status_code=400, detail="La data finale deve essere successiva a quella iniziale")
+    if (al - dal).days > MAX_GIORNI_RICERCA:
+        raise HTTPException(status_code=400, detail=f"L'intervallo di ricerca non può superare {MAX_GIORNI_RICERCA} giorni")
+    if giorni_settimana and any(g < 0 or g > 6 for g in giorni_settimana):
+        raise HTTPException(status_code=400, detail="I giorni della settimana vanno da 0 (lunedì) a 6 (domenica)")
+
+    query, order_by = open_slots_query(dal, al, giorni_settimana, city_id, regione, tipo_sala, capienza_min)
+
+    if stream:
+        return stream_json(query.order_by(*order_by), OPEN_SLOTS.dump_json, scalars=False)
 
-    return query.all()
+    righe = (await db.execute(apply_keyset(query, order_by, cursor, limit))).all()
+    return build_page(OPEN_SLOTS.build_all(righe), open_slot_key, limit)
 
 
-@router.put("/me")
-def update_venue(
+@router.put("/me", response_model=VenueRead)
+async def update_venue(
     update: VenueUpdate,
-    db:Session=Depends(get_db),
+    db:AsyncSession=Depends(get_db),
     current_user: Person = Depends(get_current_user),
 ):
 
@@ -49,7 +145,7 @@ def update_venue(
             detail="Errore, occorre inserire le informazioni di capiena, tipo_sala e strumentazione",
         )
     # recupero i dati della venue
-    venue = db.query(Venue).filter(Venue.id_direttore == current_user.id).first()
+    venue = await db.scalar(select(Venue).filter(Venue.direttore_id == current_user.id))
     # se non trovo l'id lancio un errore
     if not venue:
         raise HTTPException(
@@ -64,8 +160,9 @@ def update_venue(
 
     if update.strumentazione is not None:
         venue.strumentazione = update.strumentazione # type: ignore
-    #salvataggio del db
-    db.commit()
-    db.refresh(venue)
+    #salvataggio del db (e le ricerche dei locali vanno ricalcolate)
+    await invalidate_responses(db, "venues")
+    await db.commit()
+    await db.refresh(venue)
 
     return venue
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class TTLCache:
+    """
+    Cache in memoria (per processo) con politica LRU e scadenza per chiave.
+
+    :param maxsize: numero massimo di chiavi, oltre il quale si scarta la meno usata
+    :param ttl: durata di default di una chiave, in secondi
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, scadenza = item
+            if scadenza < time.monotonic(): #chiave scaduta
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float | None = None):
+        scadenza = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, scadenza)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SingleFlightCache:
+    """
+    TTLCache per valori calcolati in modo asincrono (es. risposte già serializzate).
+    Richieste concorrenti con la stessa chiave aspettano un unico calcolo; invalidate() svuota la cache
+    e scarta i calcoli già partiti, che vengono restituiti a chi li aspetta ma non salvati.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._in_corso: dict = {}
+        self._generazione = 0
+        self.condivise = 0 #richieste servite dal calcolo di un'altra richiesta
+        self.invalidazioni = 0
+
+    async def get_or_compute(self, key, compute) -> tuple:
+        """Restituisce (valore, "HIT" | "SHARED" | "MISS"); `compute` è una coroutine function senza argomenti."""
+        valore = self._cache.get(key)
+        if valore is not None:
+            return valore, "HIT"
+        while (in_corso := self._in_corso.get(key)) is not None:
+            try:
+                valore = await asyncio.shield(in_corso)
+                self.condivise += 1
+                return valore, "SHARED"
+            except asyncio.CancelledError:
+                #se è stata annullata la richiesta che calcolava, riprovo; altrimenti è annullata questa
+                if not in_corso.cancelled():
+                    raise
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._in_corso[key] = futuro
+        generazione = self._generazione
+        try:
+            valore = await compute()
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except Exception as error:
+            futuro.set_exception(error)
+            futuro.exception() #segna l'eccezione come letta anche se nessuno aspettava
+            raise
+        finally:
+            if self._in_corso.get(key) is futuro:
+                del self._in_corso[key]
+        if generazione == self._generazione:
+            self._cache.set(key, valore)
+        futuro.set_result(valore)
+        return valore, "MISS"
+
+    def invalidate(self):
+        self._generazione += 1
+        self._in_corso.clear()
+        self._cache.clear()
+        self.invalidazioni += 1
+
+    def stats(self) -> dict:
+        return {
+            "hits": self._cache.hits,
+            "misses": self._cache.misses,
+            "condivise": self.condivise,
+            "invalidazioni": self.invalidazioni,
+            "chiavi": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "ttl": self._cache.ttl,
+        }
@@ -0,0 +1,26 @@
+import hashlib
+from fastapi import Request, Response
+
+# GET condizionali: la risposta porta un ETag forte calcolato sul contenuto, quindi è lo stesso su tutti
+# i worker; se il client ripresenta lo stesso ETag in If-None-Match si risponde 304 senza corpo.
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Confronto debole di If-None-Match (RFC 9110): W/"x" e "x" coincidono."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def conditional_response(request: Request, body: bytes, etag: str, cache_control: str,
+                         media_type: str = "application/json") -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
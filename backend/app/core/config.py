@@ -0,0 +1,121 @@
+import os
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from dotenv import load_dotenv
+
+# Configurazione centrale dell'applicazione. Il file .env viene letto una sola volta, alla prima
+# chiamata di get_settings(); ogni campo si imposta con la variabile d'ambiente omonima in maiuscolo
+# (es. db_pool_size -> DB_POOL_SIZE).
+
+VERI = ("1", "true", "yes")
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    #database
+    db_password: str = ""
+    db_host: str = "localhost"
+    db_name: str = "easygig"
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800 #secondi prima di riaprire una connessione
+    db_pool_pre_ping: bool = True
+
+    #autenticazione
+    secret_key: str = ""
+    access_token_minutes: int = 15 #durata dei token di accesso (e delle voci nell'insieme delle revoche)
+    refresh_token_days: int = 30
+    bcrypt_rounds: int = 12 #se cambia, gli hash esistenti vengono aggiornati al login successivo
+    password_pool_size: int = os.cpu_count() or 2
+    password_queue_limit: int = 64 #operazioni in coda oltre le quali si risponde 503
+    auth_context_ttl: int = 60
+    auth_context_maxsize: int = 10000
+
+    #mail
+    mail_username: str = ""
+    mail_password: str = ""
+    mail_from: str = ""
+    mail_from_name: str = "EasyGIG Team"
+    mail_server: str = ""
+    mail_port: int = 587
+    mail_starttls: bool = True
+    mail_ssl_tls: bool = False
+    mail_use_credentials: bool = True
+    mail_validate_certs: bool = True
+    smtp_pool_size: int = 5 #connessioni SMTP aperte contemporaneamente
+    smtp_timeout: int = 30
+
+    #outbox delle mail
+    outbox_batch_size: int = 50
+    outbox_max_attempts: int = 6
+    outbox_backoff_base: int = 30 #secondi prima del secondo tentativo
+    outbox_backoff_max: int = 3600
+    outbox_poll_interval: float = 2
+    outbox_lease: int = 300 #secondi in cui le mail prese da un worker non vengono riprese da altri
+
+    #job periodici e scadenze
+    jobs_lock_key: int = 74201901 #chiave dell'advisory lock del leader
+    jobs_leader_retry: float = 15 #secondi tra due tentativi di diventare leader
+    jobs_heartbeat: float = 15 #secondi tra due controlli della connessione del lock
+    deadline_max_sleep: float = 3600 #risveglio massimo: riallinea il timer all'orologio
+    deadline_retry: float = 60 #secondi prima di riprovare le scadenze andate in errore
+    expiry_chunk_size: int = 1000 #prenotazioni pendenti elaborate per blocco
+
+    #chat
+    chat_queue_size: int = 100 #eventi in attesa per connessione prima di chiuderla
+
+    #ascolto dei canali Postgres (LISTEN/NOTIFY)
+    notify_listen_retry: float = 5
+    notify_listen_heartbeat: float = 30
+
+    #dati di riferimento (generi, città, regioni, nazioni) e ricerca geografica dei locali
+    reference_ttl: float = 600 #ricarica di sicurezza, se una notifica di modifica va persa
+    reference_max_age: int = 300 #Cache-Control degli endpoint /reference
+    geo_cell_degrees: float = 0.5 #lato delle celle della griglia spaziale (circa 55 km di latitudine)
+    geo_max_radius_km: float = 500
+
+    #cache delle risposte delle ricerche pubbliche (/venues/, /artists/artists)
+    response_cache_ttl: float = 30
+    response_cache_maxsize: int = 1024 #pagine per endpoint
+
+    #foto e brani caricati (file indirizzati per contenuto, elaborati in un pool di processi)
+    media_root: str = "media" #relativa alla cartella di avvio se non è assoluta
+    upload_max_bytes: int = 10 * 1024 * 1024
+    upload_buffer_bytes: int = 1024 * 1024 #dati tenuti in memoria prima di ogni scrittura su disco
+    thumbnail_sizes: str = "320,960" #lato lungo delle miniature in pixel, separati da virgola
+    media_pool_size: int = 2
+    audio_max_bytes: int = 50 * 1024 * 1024 #brani demo degli artisti
+    waveform_points: int = 800 #picchi precalcolati per disegnare la forma d'onda
+    media_max_age: int = 31536000 #un anno: l'URL di un file cambia se cambia il contenuto
+    media_accel_redirect: str = "" #es. /_media/: il file lo spedisce nginx con sendfile (X-Accel-Redirect)
+
+    #liste in streaming
+    stream_yield_per: int = 1000 #righe lette per volta dal cursore lato server
+
+    @property
+    def database_url(self) -> str:
+        return f"postgresql://postgres:{self.db_password}@{self.db_host}/{self.db_name}"
+
+    @property
+    def async_database_url(self) -> str:
+        return f"postgresql+asyncpg://postgres:{self.db_password}@{self.db_host}/{self.db_name}"
+
+    @classmethod
+    def from_env(cls, environ=os.environ) -> "Settings":
+        valori = {}
+        for campo in fields(cls):
+            grezzo = environ.get(campo.name.upper())
+            if grezzo is None:
+                continue
+            if campo.type is bool:
+                valori[campo.name] = grezzo.lower() in VERI
+            else:
+                valori[campo.name] = campo.type(grezzo) # type: ignore
+        return cls(**valori)
+
+
+@lru_cache
+def get_settings() -> Settings:
+    load_dotenv()
+    return Settings.from_env()
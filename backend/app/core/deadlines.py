@@ -0,0 +1,77 @@
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from app.core.config import get_settings
+
+# Coda di scadenze in memoria: un heap ordinato per orario, con un solo timer sulla prima scadenza.
+# Il contenuto vero resta nel database: all'avvio la coda si ricostruisce con una query (indicizzata)
+# e ogni scadenza viene ricontrollata sul database prima di agire, quindi una voce superata
+# (ban revocato o prolungato, transazione annullata) non fa danni.
+
+settings = get_settings()
+DEADLINE_MAX_SLEEP = settings.deadline_max_sleep #risveglio massimo: riallinea il timer all'orologio
+DEADLINE_RETRY = settings.deadline_retry #secondi prima di riprovare le scadenze andate in errore
+
+
+class DeadlineQueue:
+    """
+    `carica()` restituisce le coppie (scadenza, chiave) salvate nel database (sincrona, gira in un thread);
+    `scadute(chiavi)` è la coroutine chiamata con le chiavi arrivate a scadenza.
+    """
+
+    def __init__(self, nome: str, carica, scadute, max_sleep: float = DEADLINE_MAX_SLEEP):
+        self.nome = nome
+        self.carica = carica
+        self.scadute = scadute
+        self.max_sleep = max_sleep
+        self._heap: list[tuple[datetime, int]] = []
+        self._sveglia = asyncio.Event()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, chiave: int, quando: datetime):
+        """Aggiunge una scadenza; sveglia il timer solo se diventa la prima della coda."""
+        heapq.heappush(self._heap, (quando, chiave))
+        if self._heap[0] == (quando, chiave):
+            self._sveglia.set()
+
+    async def rebuild(self):
+        #la query di caricamento è sincrona: fuori dal ciclo di eventi
+        self._heap = list(await asyncio.to_thread(self.carica))
+        heapq.heapify(self._heap)
+
+    def pop_due(self, adesso: datetime) -> list[int]:
+        chiavi = []
+        while self._heap and self._heap[0][0] <= adesso:
+            chiavi.append(heapq.heappop(self._heap)[1])
+        #la stessa chiave può comparire più volte (es. ban riprogrammato)
+        return list(dict.fromkeys(chiavi))
+
+    def next_wait(self, adesso: datetime) -> float | None:
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] - adesso).total_seconds(), 0)
+
+    async def run(self):
+        """Ricostruisce la coda e attende le scadenze finché non viene cancellata."""
+        await self.rebuild()
+        print(f"Coda {self.nome}: {len(self._heap)} scadenze caricate")
+        while True:
+            self._sveglia.clear()
+            chiavi = self.pop_due(datetime.now())
+            if chiavi:
+                try:
+                    await self.scadute(chiavi)
+                except Exception as error:
+                    print(f"Errore nella coda {self.nome}: {error}")
+                    riprova = datetime.now() + timedelta(seconds=DEADLINE_RETRY)
+                    for chiave in chiavi:
+                        heapq.heappush(self._heap, (riprova, chiave))
+                continue
+            attesa = self.next_wait(datetime.now())
+            attesa = self.max_sleep if attesa is None else min(attesa, self.max_sleep)
+            try:
+                await asyncio.wait_for(self._sveglia.wait(), attesa)
+            except asyncio.TimeoutError:
+                pass
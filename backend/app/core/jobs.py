@@ -0,0 +1,211 @@
+import asyncio
+import os
+import socket
+import time
+from datetime import datetime
+from sqlalchemy import func, select
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.models import JobRun
+from app.core.config import get_settings
+
+# Job periodici con un solo leader: con N worker uvicorn/gunicorn ogni processo ha il suo JobRunner,
+# ma solo quello che ottiene l'advisory lock di Postgres esegue i job. Il lock è legato alla
+# connessione: se il leader muore Postgres lo rilascia e un altro worker prende il suo posto.
+
+settings = get_settings()
+JOBS_LOCK_KEY = settings.jobs_lock_key #chiave dell'advisory lock del leader
+JOBS_LEADER_RETRY = settings.jobs_leader_retry #secondi tra due tentativi di diventare leader
+JOBS_HEARTBEAT = settings.jobs_heartbeat #secondi tra due controlli della connessione del lock
+
+
+class JobRunner:
+    """
+    Scheduler (APScheduler) creato e avviato in pausa da start(): riprende solo mentre il processo è leader.
+    Ogni esecuzione viene registrata nella tabella job_run (durata, righe elaborate, errore).
+    """
+
+    def __init__(
+        self,
+        engine=async_engine,
+        session_factory=AsyncSessionLocal,
+        lock_key: int = JOBS_LOCK_KEY,
+        retry: float = JOBS_LEADER_RETRY,
+        heartbeat: float = JOBS_HEARTBEAT,
+    ):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.lock_key = lock_key
+        self.retry = retry
+        self.heartbeat = heartbeat
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.scheduler = None
+        self._jobs: dict[str, tuple] = {}
+        self.leader = False
+        self._conn = None
+        self._conn_lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._in_corso: set[asyncio.Task] = set()
+        self._servizi: dict = {}
+        self._servizi_attivi: dict[str, asyncio.Task] = {}
+
+    def add_job(self, nome: str, funzione, **intervallo):
+        """Registra una coroutine da eseguire a intervalli (stessi argomenti del trigger 'interval')."""
+        self._jobs[nome] = (funzione, intervallo)
+
+    def add_task(self, nome: str, funzione):
+        """Registra una coroutine di lunga durata: parte quando il processo diventa leader, viene cancellata quando smette."""
+        self._servizi[nome] = funzione
+
+    #--- esecuzione e registrazione dei job ---
+
+    async def _run_job(self, nome: str, funzione):
+        #il lock potrebbe essere stato perso dall'ultimo heartbeat: lo riverifico prima di partire
+        if not await self._still_leader():
+            return
+        task = asyncio.current_task()
+        self._in_corso.add(task) # type: ignore
+        try:
+            await self.record(nome, funzione)
+        finally:
+            self._in_corso.discard(task) # type: ignore
+
+    async def record(self, nome: str, funzione, rilancia: bool = False):
+        """
+        Esegue `funzione` e ne salva l'esito in job_run (usato anche dai task registrati con add_task).
+        Con `rilancia` l'eventuale errore, dopo essere stato registrato, arriva anche al chiamante.
+        """
+        inizio = datetime.now()
+        start = time.perf_counter()
+        righe = None
+        errore = None
+        eccezione = None
+        try:
+            esito = await funzione()
+            if isinstance(esito, dict):
+                righe = esito.get("elaborate")
+            elif isinstance(esito, int):
+                righe = esito
+        except Exception as error:
+            errore = f"{type(error).__name__}: {error}"
+            eccezione = error
+            print(f"Errore nel job {nome}: {errore}")
+        durata_ms = int((time.perf_counter() - start) * 1000)
+
+        try:
+            async with self.session_factory() as db:
+                db.add(JobRun(job=nome, worker=self.worker, inizio=inizio, fine=datetime.now(),
+                              durata_ms=durata_ms, righe=righe, errore=errore))
+                await db.commit()
+        except Exception as error:
+            print(f"Impossibile registrare l'esecuzione del job {nome}: {error}")
+        if rilancia and eccezione:
+            raise eccezione
+
+    #--- elezione del leader ---
+
+    async def _try_lock(self) -> bool:
+        if self.engine.dialect.name != "postgresql":
+            return True #senza Postgres (test, sviluppo) c'è un solo processo
+        self._conn = await self.engine.connect()
+        ottenuto = await self._conn.scalar(select(func.pg_try_advisory_lock(self.lock_key)))
+        await self._conn.commit() #il lock è di sessione: non lascio la transazione aperta
+        if not ottenuto:
+            await self._release()
+        return bool(ottenuto)
+
+    async def _still_leader(self) -> bool:
+        if not self.leader:
+            return False
+        if self._conn is None:
+            return True
+        try:
+            async with self._conn_lock:
+                await self._conn.scalar(select(1))
+                await self._conn.commit()
+            return True
+        except Exception as error:
+            print(f"Connessione del leader persa ({self.worker}): {error}")
+            self._become_follower()
+            return False
+
+    async def _release(self):
+        async with self._conn_lock:
+            conn, self._conn = self._conn, None
+            if conn is None:
+                return
+            try:
+                if self.leader:
+                    await conn.scalar(select(func.pg_advisory_unlock(self.lock_key)))
+                    await conn.commit()
+                await conn.close()
+            except Exception:
+                await conn.invalidate()
+
+    def _become_leader(self):
+        self.leader = True
+        self.scheduler.resume() # type: ignore
+        for nome, funzione in self._servizi.items():
+            self._servizi_attivi[nome] = asyncio.create_task(funzione())
+        print(f"Job runner: {self.worker} è il leader")
+
+    def _become_follower(self):
+        if self.leader:
+            print(f"Job runner: {self.worker} non è più il leader")
+        self.leader = False
+        if self.scheduler:
+            self.scheduler.pause()
+        for task in self._servizi_attivi.values():
+            task.cancel()
+
+    async def _wait(self, secondi: float):
+        try:
+            await asyncio.wait_for(self._stop.wait(), secondi)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _campaign(self):
+        while not self._stop.is_set():
+            try:
+                if await self._try_lock():
+                    self._become_leader()
+                    while not self._stop.is_set() and await self._still_leader():
+                        await self._wait(self.heartbeat)
+            except Exception as error:
+                print(f"Errore nell'elezione del leader: {error}")
+            await self._release()
+            self._become_follower()
+            await self._wait(self.retry)
+
+    #--- ciclo di vita (lifespan dell'app) ---
+
+    def start(self):
+        #APScheduler viene importato solo qui: chi importa i servizi senza avviare l'app non lo carica
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+        self._stop.clear()
+        self.scheduler = AsyncIOScheduler()
+        for nome, (funzione, intervallo) in self._jobs.items():
+            self.scheduler.add_job(
+                self._run_job, 'interval', args=[nome, funzione], id=nome, replace_existing=True,
+                coalesce=True, max_instances=1, **intervallo)
+        self.scheduler.start(paused=True)
+        self._task = asyncio.create_task(self._campaign())
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            await self._task
+            self._task = None
+        if self.scheduler is None:
+            return
+        #niente nuove esecuzioni; quelle in corso terminano e vengono registrate prima di chiudere
+        self.scheduler.pause()
+        if self._in_corso or self._servizi_attivi:
+            await asyncio.gather(*self._in_corso, *self._servizi_attivi.values(), return_exceptions=True)
+        self._servizi_attivi = {}
+        self.scheduler.shutdown(wait=False)
+        self.scheduler = None
+
+
+job_runner = JobRunner()
@@ -0,0 +1,113 @@
+import asyncio
+from email.message import EmailMessage
+from email.utils import formataddr
+from app.core.config import Settings, get_settings
+
+#Configurazione SMTP unica per tutta l'applicazione: campi mail_* e smtp_* di Settings
+settings = get_settings()
+SMTP_POOL_SIZE = settings.smtp_pool_size #connessioni SMTP aperte contemporaneamente
+SMTP_TIMEOUT = settings.smtp_timeout
+
+
+def build_message(mittente: str, destinatario: str, oggetto: str, corpo_html: str) -> EmailMessage:
+    messaggio = EmailMessage()
+    messaggio["From"] = mittente
+    messaggio["To"] = destinatario
+    messaggio["Subject"] = oggetto
+    messaggio.set_content(corpo_html, subtype="html")
+    return messaggio
+
+
+class SmtpPool:
+    """
+    Pool di connessioni SMTP riutilizzabili.
+    Al massimo `size` invii in parallelo; una connessione torna nel pool dopo ogni invio
+    riuscito e viene scartata se l'invio fallisce.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: str | None = None,
+        password: str | None = None,
+        use_tls: bool = False,
+        start_tls: bool | None = None,
+        validate_certs: bool = True,
+        size: int = SMTP_POOL_SIZE,
+        timeout: int = SMTP_TIMEOUT,
+    ):
+        self.options = {
+            "hostname": hostname,
+            "port": port,
+            "username": username or None,
+            "password": password or None,
+            "use_tls": use_tls,
+            "start_tls": start_tls,
+            "validate_certs": validate_certs,
+            "timeout": timeout,
+        }
+        self.size = size
+        self.connessioni_aperte = 0 #contatore per benchmark e test
+        self._libere: list = [] #connessioni aiosmtplib.SMTP inattive
+        self._semaforo = asyncio.Semaphore(size)
+
+    @classmethod
+    def from_settings(cls, config: Settings = settings):
+        return cls(
+            hostname=config.mail_server,
+            port=config.mail_port,
+            username=config.mail_username if config.mail_use_credentials else None,
+            password=config.mail_password if config.mail_use_credentials else None,
+            use_tls=config.mail_ssl_tls,
+            start_tls=config.mail_starttls,
+            validate_certs=config.mail_validate_certs,
+            size=config.smtp_pool_size,
+            timeout=config.smtp_timeout,
+        )
+
+    async def _connect(self):
+        #aiosmtplib si carica al primo invio: i worker che non spediscono mail non lo importano
+        import aiosmtplib
+
+        smtp = aiosmtplib.SMTP(**self.options)
+        await smtp.connect()
+        self.connessioni_aperte += 1
+        return smtp
+
+    async def send(self, messaggio: EmailMessage):
+        import aiosmtplib
+
+        async with self._semaforo:
+            smtp = self._libere.pop() if self._libere else None
+            if smtp is not None and smtp.is_connected:
+                try:
+                    await smtp.send_message(messaggio)
+                    self._libere.append(smtp)
+                    return
+                except aiosmtplib.SMTPServerDisconnected:
+                    #il server ha chiuso la connessione rimasta inattiva: ne apro una nuova
+                    smtp.close()
+                except Exception:
+                    smtp.close()
+                    raise
+
+            smtp = await self._connect()
+            try:
+                await smtp.send_message(messaggio)
+            except Exception:
+                smtp.close()
+                raise
+            self._libere.append(smtp)
+
+    async def close(self):
+        while self._libere:
+            smtp = self._libere.pop()
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+
+
+def default_sender(config: Settings = settings) -> str:
+    return formataddr((config.mail_from_name, config.mail_from))
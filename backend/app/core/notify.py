@@ -0,0 +1,86 @@
+import asyncio
+from app.core.config import get_settings
+from app.core.database import async_engine
+
+# Ascolto dei canali Postgres (LISTEN/NOTIFY): una sola connessione per processo per tutti i canali.
+# Chi pubblica usa pg_notify nella propria transazione, quindi l'evento arriva solo dopo il commit
+# e a tutti i worker, compreso quello che l'ha inviato.
+
+settings = get_settings()
+NOTIFY_LISTEN_RETRY = settings.notify_listen_retry
+NOTIFY_LISTEN_HEARTBEAT = settings.notify_listen_heartbeat
+
+
+class PgListener:
+    """Canale -> callback(payload). Senza Postgres non ascolta nulla: chi pubblica consegna in locale."""
+
+    def __init__(self, engine=async_engine, retry: float = NOTIFY_LISTEN_RETRY,
+                 heartbeat: float = NOTIFY_LISTEN_HEARTBEAT):
+        self.engine = engine
+        self.retry = retry
+        self.heartbeat = heartbeat
+        self._callback: dict[str, object] = {}
+        self._on_connect: list = []
+        self._stop = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def postgres(self) -> bool:
+        return self.engine.dialect.name == "postgresql"
+
+    def add(self, channel: str, callback):
+        self._callback[channel] = callback
+
+    def on_connect(self, callback):
+        """callback() asincrona, eseguita a ogni connessione (anche la prima) dopo le LISTEN: recupera gli eventi persi."""
+        self._on_connect.append(callback)
+
+    def _on_notify(self, _connection, _pid, channel, payload):
+        try:
+            self._callback[channel](payload) # type: ignore
+        except Exception as error:
+            print(f"Evento non valido sul canale {channel}: {error}")
+
+    async def _wait(self, secondi: float):
+        try:
+            await asyncio.wait_for(self._stop.wait(), secondi)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        if not self.postgres or not self._callback:
+            return
+        while not self._stop.is_set():
+            try:
+                async with self.engine.connect() as conn:
+                    #la connessione asyncpg resta fuori da transazioni: le notifiche arrivano subito
+                    driver = (await conn.get_raw_connection()).driver_connection
+                    for channel in self._callback:
+                        await driver.add_listener(channel, self._on_notify) # type: ignore
+                    try:
+                        #se il recupero fallisce la connessione riparte da capo e ci riprova
+                        for callback in self._on_connect:
+                            await callback()
+                        while not self._stop.is_set():
+                            await self._wait(self.heartbeat)
+                            await driver.fetchval("SELECT 1") # type: ignore
+                    finally:
+                        for channel in self._callback:
+                            await driver.remove_listener(channel, self._on_notify) # type: ignore
+            except Exception as error:
+                #gli eventi persi durante la riconnessione li recupera chi li usa (on_connect)
+                print(f"Ascolto dei canali interrotto: {error}")
+            await self._wait(self.retry)
+
+    def start(self):
+        self._stop.clear()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            await self._task
+            self._task = None
+
+
+pg_listener = PgListener()
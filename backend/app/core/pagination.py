@@ -0,0 +1,119 @@
+import base64
+import enum
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
+from app.core.database import AsyncSessionLocal
+from app.core.config import get_settings
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+settings = get_settings()
+STREAM_YIELD_PER = settings.stream_yield_per #righe lette per volta dal cursore lato server
+
+
+#--- Cursori opachi: i valori delle colonne di ordinamento dell'ultima riga, in base64 ---
+
+def _encode_value(valore):
+    if isinstance(valore, datetime):
+        return {"dt": valore.isoformat()}
+    if isinstance(valore, date):
+        return {"d": valore.isoformat()}
+    if isinstance(valore, time):
+        return {"t": valore.isoformat()}
+    if isinstance(valore, Decimal):
+        return float(valore)
+    if isinstance(valore, enum.Enum):
+        return valore.value
+    return valore
+
+
+def _decode_value(valore):
+    if isinstance(valore, dict):
+        if "dt" in valore:
+            return datetime.fromisoformat(valore["dt"])
+        if "d" in valore:
+            return date.fromisoformat(valore["d"])
+        if "t" in valore:
+            return time.fromisoformat(valore["t"])
+    return valore
+
+
+def encode_cursor(valori) -> str:
+    testo = json.dumps([_encode_value(v) for v in valori], separators=(",", ":"))
+    return base64.urlsafe_b64encode(testo.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, n_colonne: int) -> list:
+    try:
+        testo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        valori = [_decode_value(v) for v in json.loads(testo)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursore di paginazione non valido")
+    if len(valori) != n_colonne:
+        raise HTTPException(status_code=400, detail="Cursore di paginazione non valido")
+    return valori
+
+
+#--- Paginazione keyset ---
+
+def apply_keyset(query, order_by: list, cursor: str | None, limit: int, desc: bool = False):
+    """
+    Ordina la query per `order_by` (tutte crescenti, o tutte decrescenti con `desc`;
+    l'ultima deve essere univoca) e, se c'è un cursore, riparte dalla riga successiva a quella codificata.
+    Legge una riga in più per sapere se esiste la pagina seguente.
+    """
+    if cursor:
+        valori = decode_cursor(cursor, len(order_by))
+        chiave = tuple_(*order_by)
+        query = query.filter(chiave < tuple_(*valori) if desc else chiave > tuple_(*valori))
+    if desc:
+        order_by = [colonna.desc() for colonna in order_by]
+    return query.order_by(*order_by).limit(limit + 1)
+
+
+def build_page(righe, chiave, limit: int, serialize=None) -> dict:
+    """
+    :param righe: risultato di una query passata da apply_keyset
+    :param chiave: funzione che restituisce i valori di ordinamento di una riga
+    :param serialize: conversione opzionale della riga prima della risposta
+    """
+    righe = list(righe)
+    next_cursor = encode_cursor(chiave(righe[limit - 1])) if len(righe) > limit else None
+    righe = righe[:limit]
+    return {
+        "items": [serialize(r) for r in righe] if serialize else righe,
+        "next_cursor": next_cursor,
+    }
+
+
+#--- Risposta in streaming ---
+
+def stream_json(query, serialize, scalars: bool = True) -> StreamingResponse:
+    """
+    Serializza le righe man mano che arrivano da un cursore lato server (yield_per),
+    così la memoria resta costante qualunque sia il numero di righe.
+
+    :param serialize: funzione riga -> stringa JSON
+    :param scalars: True se la query seleziona un'entità ORM, False per righe di colonne
+    """
+    async def generate():
+        #sessione dedicata: deve restare aperta per tutta la durata dello streaming
+        async with AsyncSessionLocal() as db:
+            risultato = await db.stream(query.execution_options(yield_per=STREAM_YIELD_PER))
+            if scalars:
+                risultato = risultato.scalars()
+            yield "["
+            primo = True
+            async for blocco in risultato.partitions():
+                testo = ",".join(serialize(r) for r in blocco)
+                if not primo:
+                    testo = "," + testo
+                primo = False
+                yield testo
+            yield "]"
+
+    return StreamingResponse(generate(), media_type="application/json")
@@ -1,45 +1,95 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.database import SessionLocal
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import Settings, get_settings
+from app.core.database import get_db
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset, build_page, stream_json
 from app.models.models import Person
-from dotenv import load_dotenv
-load_dotenv()
-from app.api.routes import auth, calendar,venues,artist,promoter,bookings
+from app.schemas.schemas import CacheStats, MessageResponse, Page, UserListItem
+from app.services.read_models import USERS
+from app.api.routes import auth, calendar,venues,artist,promoter,bookings,chat,reference,photos
+from app.core.jobs import job_runner
+from app.core.mail import SmtpPool
+from app.core.notify import pg_listener
+from app.services.outbox import OutboxWorker
+from app.services.media import media_worker
+from app.services.passwords import password_hasher
+from app.services.reference import reference_cache
+from app.services.response_cache import response_caches
+from app.services.sanction_service import register_jobs
+from app.services.tokens import delete_expired_refresh_tokens
 
+router = APIRouter()
 
 
-app = FastAPI()
-app.include_router(auth.router, tags=["Autorizzazione"])
-app.include_router(calendar.router, prefix="/calendar", tags=["Calendario"])
-app.include_router(venues.router)
-app.include_router(artist.router)
-app.include_router(promoter.router)
-app.include_router(bookings.router)
+def create_app(settings: Settings | None = None) -> FastAPI:
+    """Costruisce l'app; le risorse (pool SMTP, scheduler, ascolto della chat) nascono e muoiono nel lifespan."""
+    settings = settings or get_settings()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        #worker che spedisce le mail dell'outbox, con il suo pool SMTP
+        app.state.outbox = OutboxWorker(SmtpPool.from_settings(settings))
+        app.state.outbox.start()
+        #job periodici: li esegue solo il worker che vince l'elezione del leader
+        register_jobs(job_runner)
+        job_runner.add_job("refresh_token_cleanup", delete_expired_refresh_tokens, hours=24)
+        job_runner.start()
+        #ascolto dei canali Postgres: eventi della chat, revoche dei token, modifiche ai dati di riferimento
+        pg_listener.start()
+        #dati di riferimento in memoria; se il database non risponde si caricano alla prima richiesta
+        try:
+            await reference_cache.refresh()
+        except Exception as error:
+            print(f"Dati di riferimento non caricati all'avvio: {error}")
+        yield
+        #chiusura delle risorse condivise
+        await pg_listener.stop()
+        await job_runner.stop()
+        await app.state.outbox.stop()
+        password_hasher.shutdown()
+        media_worker.shutdown()
 
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.include_router(auth.router, tags=["Autorizzazione"])
+    app.include_router(calendar.router, prefix="/calendar", tags=["Calendario"])
+    app.include_router(venues.router)
+    app.include_router(artist.router)
+    app.include_router(promoter.router)
+    app.include_router(bookings.router)
+    app.include_router(chat.router)
+    app.include_router(reference.router)
+    app.include_router(photos.router)
+    app.include_router(router)
+    return app
 
-@app.get("/")
+
+@router.get("/", response_model=MessageResponse)
 def read_root():
     return {"message":"Benvenuto in EasyGIG v 1.0"}
 
 
-@app.get("/users")
-def get_users(db:Session = Depends(get_db)):
-    users = db.query(Person).all()
-    results = []
-    for u in users:
-        results.append({
-            "id": u.id,
-            "nome_completo": f"{u.nome} {u.cognome}",
-            "citta": u.city.nome,
-            "organizzazione": u.organization.nome if u.organization else "Nessuna",
-            "tipo": u.tipo_utente
-        })
-        
-        return results
+@router.get("/cache/stats", response_model=dict[str, CacheStats])
+def cache_stats():
+    #contatori per processo: con più worker ognuno ha i suoi
+    return {nome: cache.stats() for nome, cache in response_caches.items()}
+
+
+@router.get("/users", response_model=Page[UserListItem])
+async def get_users(
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Restituisce tutti gli utenti in streaming"),
+    db:AsyncSession = Depends(get_db)
+):
+    #proiezione: solo le colonne della lista, città e organizzazione nella stessa select
+    query = USERS.select()
+    if stream:
+        return stream_json(query.order_by(Person.id), USERS.dump_json, scalars=False)
+
+    righe = (await db.execute(apply_keyset(query, [Person.id], cursor, limit))).all()
+    return build_page(USERS.build_all(righe), lambda u: (u.id,), limit)
+
+
+app = create_app()
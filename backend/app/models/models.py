@@ -1,4 +1,4 @@
-from sqlalchemy import Column,Integer,String,ForeignKey,Boolean,Text,DECIMAL,Enum,CheckConstraint,ForeignKeyConstraint,DATE,Time,DateTime, UniqueConstraint,func
+from sqlalchemy import Column,Integer,String,ForeignKey,Boolean,Text,DECIMAL,Float,Enum,CheckConstraint,ForeignKeyConstraint,DATE,Time,DateTime, UniqueConstraint,Index,func,text
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 import enum
@@ -48,6 +48,11 @@ class StateInvitation(enum.Enum):
     accepted ='accepted'
     expired = 'expired'
     
+class OutboxState(enum.Enum):
+    inAttesa = 'inAttesa'
+    inviata = 'inviata'
+    fallita = 'fallita'
+    
 #TABELLA NATION
 class Nation(Base):
     __tablename__ = "nation"
@@ -68,6 +73,9 @@ class City(Base):
     
     regione = Column(String, nullable=False)
     nazione = Column(String, nullable=False)
+    #coordinate dal gazetteer (scripts/load_gazetteer.py), usate per la ricerca per raggio
+    latitudine = Column(Float, nullable=True)
+    longitudine = Column(Float, nullable=True)
     
     __table_args__ = (
         
@@ -89,6 +97,8 @@ class Address(Base):
     civico = Column(String, nullable=False)
     cap = Column(String, nullable=False)
     citta_id = Column(Integer,ForeignKey('city.id'), nullable=False)
+    latitudine = Column(Float, nullable=True)
+    longitudine = Column(Float, nullable=True)
     
 #TABELLA GENRE
 class Genre(Base):
@@ -123,6 +133,11 @@ class Person(Base):
     link_streaming = Column(String, nullable=True)
     file_path = Column(String, nullable=True)
     reputazione = Column(DECIMAL(3,2), default=0.00)
+    #somma e numero dei voti ricevuti, mantenuti dal trigger aggiorna_reputazione (reputazione = somma / numero)
+    somma_voti = Column(Integer, nullable=False, default=0, server_default='0')
+    numero_voti = Column(Integer, nullable=False, default=0, server_default='0')
+    #cresce a ogni cambio di stato dell'account (ban, sblocco): i token di accesso più vecchi vengono revocati
+    versione_stato = Column(Integer, nullable=False, default=0, server_default='0')
     privacy_accettata = Column(Boolean, nullable=False)
     
     #Relazioni
@@ -131,13 +146,14 @@ class Person(Base):
     organization_id = Column(Integer, ForeignKey('booking_organization.id'), nullable=True)
     organization = relationship("BookingOrganization", back_populates='members')
     city = relationship("City", back_populates="residents")
+    genre = relationship("Genre", back_populates="artists")
     managed_venues = relationship("Venue", back_populates="direttore")
     list_reviews = relationship("Review", back_populates="autore", foreign_keys="[Review.autore_id]")
     reviews = relationship("Review", back_populates="destinatario", foreign_keys="[Review.destinatario_id]")
     sanzioni = relationship('Sanction', back_populates='persona_sanzionata')
     accounts = relationship('StatoAccount', back_populates="account_persona")
     photolist = relationship('Photo', back_populates="person_foto")
-    membro_band = relationship('Invitation', back_populates='persona')
+    membro_band = relationship('Invitation', back_populates='persona', foreign_keys="[Invitation.person_id]")
     
     __table_args__ = (
         CheckConstraint(
@@ -200,6 +216,10 @@ class Venue(Base):
     photolist = relationship('Photo', back_populates='venue_foto')
     calendarlist = relationship('Calendar', back_populates='venue_calendar')
     
+    __table_args__ = (
+        Index('ix_venue_city', 'city_id'),
+    )
+    
     
 #TABELLA FOTO
 class Photo(Base):
@@ -217,6 +237,10 @@ class Photo(Base):
             "(venue_id IS NOT NULL AND person_id IS NULL) OR (venue_id IS NULL AND person_id IS NOT NULL)",
             name="check_photo_owner"
         ),
+        #deduplicazione dei caricamenti: stesso file (sha256) una sola volta per proprietario, anche con richieste concorrenti
+        #(un indice per tipo di proprietario: l'altra colonna è sempre NULL e i NULL non collidono negli indici unici)
+        Index("ux_photo_venue_source", "venue_id", "source", unique=True, postgresql_where=text("venue_id IS NOT NULL")),
+        Index("ux_photo_person_source", "person_id", "source", unique=True, postgresql_where=text("person_id IS NOT NULL")),
     )
     
     
@@ -234,6 +258,11 @@ class Calendar(Base):
     venue_id = Column(Integer, ForeignKey('venue.id'))
     venue_calendar = relationship("Venue", back_populates='calendarlist')
     slots = relationship('Slot', back_populates= 'calendar_event')
+    
+    __table_args__ = (
+        Index('ix_calendar_venue_data', 'venue_id', 'data'),
+        Index('ix_calendar_data', 'data'),
+    )
 
 #TABELLA SLOT
 class Slot(Base):
@@ -248,6 +277,10 @@ class Slot(Base):
     calendar_id = Column(Integer, ForeignKey('calendar.id'), nullable=False)
     calendar_event = relationship("Calendar", back_populates="slots")
     
+    __table_args__ = (
+        Index('ix_slot_calendar_stato', 'calendar_id', 'stato'),
+    )
+    
 #TABELLA BOOKING
 class Booking(Base):
     __tablename__ = 'booking'
@@ -273,6 +306,9 @@ class Booking(Base):
             "(stato_prenotazione != 'annullata') OR (ragione IS NOT NULL)",
             name='ragione_obbligatoria_annullata'
         ),
+        #al massimo una prenotazione attiva per slot (vedi app.services.booking_service)
+        Index('ux_booking_slot_attiva', 'slot_id', unique=True,
+              postgresql_where=text("stato_prenotazione IN ('pendente', 'accettata')")),
     )
 #TABELLA BOOK_CAL
 class book_cal(Base):
@@ -286,11 +322,16 @@ class Chat(Base):
     id = Column(Integer, primary_key=True)
     data_apertura = Column(DateTime, nullable=False, default=func.now())
     ultimo_messaggio = Column(DateTime, nullable=True)
+    #messaggi non ancora letti da ciascun lato: il direttore del locale e la band/il promoter
+    non_letti_direttore = Column(Integer, nullable=False, default=0, server_default='0')
+    non_letti_controparte = Column(Integer, nullable=False, default=0, server_default='0')
     
     #Relazioni
     booking_id = Column(Integer, ForeignKey('booking.id'), nullable=False)
     chat_prenotazioni = relationship('Booking', back_populates="chats")
     messages = relationship('Message', back_populates='chatlist')
+    __table_args__ = (
+        Index('ix_chat_booking', 'booking_id'),)
     
 
 #TABELLA MESSAGE
@@ -305,6 +346,9 @@ class Message(Base):
     chat_id = Column(Integer, ForeignKey('chat.id'), nullable=False)
     mittente_id = Column(Integer, ForeignKey('person.id'), nullable= False)
     chatlist = relationship('Chat', back_populates="messages")
+    __table_args__ = (
+        #storico della chat paginato per id
+        Index('ix_message_chat_id', 'chat_id', 'id'),)
     
 #TABELLA REVIEW
 class Review(Base):
@@ -352,6 +396,9 @@ class Sanction(Base):
     #Relazioni
     person_id = Column(Integer, ForeignKey('person.id'), nullable=False)
     persona_sanzionata = relationship('Person', back_populates="sanzioni")
+    __table_args__ = (
+        #solo i ban in corso: ricostruzione della coda degli sblocchi
+        Index('ix_sanction_fine_ban', 'data_fine_ban', postgresql_where=text("data_fine_ban IS NOT NULL")),)
     
 #TABELLA STATO ACCOUNT
 class StatoAccount(Base):
@@ -363,3 +410,49 @@ class StatoAccount(Base):
     #Relazioni
     person_id = Column(Integer, ForeignKey('person.id'), nullable = False)
     account_persona = relationship("Person", back_populates="accounts")
+    
+#TABELLA EMAIL OUTBOX
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+    id = Column(Integer, primary_key=True)
+    destinatario = Column(String, nullable=False)
+    oggetto = Column(String, nullable=False)
+    corpo = Column(Text, nullable=False)
+    stato = Column(Enum(OutboxState), nullable=False, default='inAttesa') # type: ignore
+    tentativi = Column(Integer, nullable=False, default=0)
+    creata = Column(DateTime, nullable=False, default=func.now())
+    prossimo_tentativo = Column(DateTime, nullable=False, default=func.now())
+    inviata_il = Column(DateTime, nullable=True)
+    ultimo_errore = Column(Text, nullable=True)
+    
+    __table_args__ = (
+        #il worker legge solo le mail in attesa, in ordine di prossimo tentativo
+        Index('ix_email_outbox_attesa', 'prossimo_tentativo', postgresql_where=text("stato = 'inAttesa'")),
+    )
+    
+#TABELLA JOB RUN
+class JobRun(Base):
+    __tablename__ = 'job_run'
+    id = Column(Integer, primary_key=True)
+    job = Column(String, nullable=False)
+    worker = Column(String, nullable=False)
+    inizio = Column(DateTime, nullable=False)
+    fine = Column(DateTime, nullable=False)
+    durata_ms = Column(Integer, nullable=False)
+    righe = Column(Integer, nullable=True)
+    errore = Column(Text, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_job_run_job_inizio', 'job', 'inizio'),
+    )
+    
+#TABELLA REFRESH TOKEN
+class RefreshToken(Base):
+    __tablename__ = 'refresh_token'
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), nullable=False, unique=True) #sha256 del token: il token in chiaro non viene salvato
+    famiglia = Column(String(36), nullable=False, index=True) #catena di rotazioni nata da un login
+    person_id = Column(Integer, ForeignKey('person.id'), nullable=False, index=True)
+    creato = Column(DateTime, nullable=False)
+    scadenza = Column(DateTime, nullable=False)
+    usato = Column(Boolean, nullable=False, default=False)
@@ -1,7 +1,9 @@
-from typing import List, Optional
+from typing import Dict, Generic, List, Literal, Optional, TypeVar
 from pydantic import BaseModel,EmailStr
-from datetime import date, time
-from app.models.models import PersonType,VenueType,OrganizationType
+from datetime import date, datetime, time
+from app.models.models import PersonType,VenueType,OrganizationType,BookingState,BandCategory
+
+T = TypeVar("T")
 
 
 class UserBase(BaseModel):
@@ -43,6 +45,24 @@ class CalendarCreate(BaseModel):
     ora_fine:time
     numero_slot:int
     
+class SlotLayout(BaseModel):
+    orario_inizio: time
+    orario_fine: time
+
+
+#Creazione di più calendari: intervallo di date, giorni della settimana e ricorrenza
+class CalendarBulkCreate(BaseModel):
+    dal: date
+    al: date
+    giorni_settimana: List[int] = [0, 1, 2, 3, 4, 5, 6] #0 = lunedì ... 6 = domenica
+    ogni_n_settimane: int = 1
+    ora_inizio: time
+    ora_fine: time #se precede ora_inizio la serata termina il giorno dopo
+    numero_slot: int = 1
+    slots: Optional[List[SlotLayout]] = None #layout esplicito, alternativo a numero_slot
+    venue_id: Optional[int] = None
+    
+    
 class CalendarSchema(CalendarCreate):
     id: int
 
@@ -81,13 +101,271 @@ class BandUpdate(BaseModel):
     nome: Optional[str] = None
     genere: Optional[str] = None
     numero_membri: Optional[int] = None
+    genere_id: Optional[int] = None
+    cachet: Optional[int] = None
     
     
 class BookingReject(BaseModel):
     ragione:str
     
+
+class BookingBulkAction(BaseModel):
+    booking_ids: List[int]
+    azione: Literal['accetta', 'rifiuta']
+    ragione: Optional[str] = None
+    
     
 class ReviewCreate(BaseModel):
     booking_id:int
     voto: int
-    testo: Optional[str] = None
\ No newline at end of file
+    testo: Optional[str] = None
+    
+    
+class ArtistSearchResult(BaseModel):
+    tipo: str #"band" oppure "artista"
+    id: int
+    nome: str
+    nome_evidenziato: str
+    genere_id: Optional[int] = None
+    categoria: Optional[str] = None
+    citta: Optional[str] = None
+    rank: float
+
+
+
+#Pagina di una lista con paginazione keyset
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+
+class CalendarRead(BaseModel):
+    id: int
+    data: date
+    data_inizio: time
+    data_fine: time
+    slot_disponibili: int
+    venue_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class VenueRead(BaseModel):
+    id: int
+    nome: str
+    email: str
+    telefono: str
+    tipo_sala: VenueType
+    capienza: int
+    strumentazione: str
+    city_id: int
+
+    class Config:
+        from_attributes = True
+
+
+class UserListItem(BaseModel):
+    id: int
+    nome_completo: str
+    citta: str
+    organizzazione: str
+    tipo: Optional[PersonType] = None
+
+
+class BookingRead(BaseModel):
+    id: int
+    data_creazione: datetime
+    message: str
+    scadenza: datetime
+    stato_prenotazione: BookingState
+    ragione: Optional[str] = None
+    iniziato_da: PersonType
+    band_id: Optional[int] = None
+    slot_id: Optional[int] = None
+    promoter_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class OpenSlotRead(BaseModel):
+    slot_id: int
+    orario_inizio: time
+    orario_fine: time
+    calendar_id: int
+    data: date
+    venue_id: int
+    venue_nome: str
+    tipo_sala: VenueType
+    capienza: int
+    city_id: int
+    citta: str
+    regione: str
+
+
+class ChatRead(BaseModel):
+    id: int
+    booking_id: int
+    data_apertura: datetime
+    ultimo_messaggio: Optional[datetime] = None
+    non_letti: int
+
+
+class MessageRead(BaseModel):
+    id: int
+    chat_id: int
+    mittente_id: int
+    testo: str
+    data_invio: datetime
+    letto: Optional[bool] = None
+
+    class Config:
+        from_attributes = True
+
+
+class MessageCreate(BaseModel):
+    testo: str
+
+
+#--- Risposte delle route: solo i campi pubblici, serializzati da Pydantic senza passare dall'ORM ---
+
+class MessageResponse(BaseModel):
+    message: str
+
+
+class RegistrationResponse(MessageResponse):
+    id: int
+    venue_id: Optional[int] = None
+    organization_id: Optional[int] = None
+
+
+class TokenResponse(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int #secondi di validità del token di accesso
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class UserRead(BaseModel):
+    id: int
+    nome: str
+    cognome: str
+    email: str
+    telefono: str
+    tipo_utente: Optional[PersonType] = None
+    link_streaming: Optional[str] = None
+    file_path: Optional[str] = None
+    reputazione: Optional[float] = None
+    city_id: int
+    genere_id: Optional[int] = None
+    organization_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class BandRead(BaseModel):
+    id: int
+    nome: str
+    cachet: int
+    trattabile: bool
+    categoria: BandCategory
+    genere_id: int
+
+    class Config:
+        from_attributes = True
+
+
+class CalendarBulkResult(BaseModel):
+    calendari_creati: int
+    slot_creati: int
+    calendar_ids: List[int]
+
+
+class BookingBulkResult(BaseModel):
+    aggiornate: List[int]
+    ignorate: List[int]
+
+
+class BookingActionResult(MessageResponse):
+    booking_id: Optional[int] = None
+    ragione: Optional[str] = None
+
+
+class ReviewResult(MessageResponse):
+    status: str
+
+
+class GenreRead(BaseModel):
+    id: int
+    nome: str
+
+
+class NationRead(BaseModel):
+    nome: str
+
+
+class RegionRead(BaseModel):
+    nome: str
+    nazione: str
+
+
+class CityRead(BaseModel):
+    id: int
+    nome: str
+    regione: str
+    nazione: str
+    latitudine: Optional[float] = None
+    longitudine: Optional[float] = None
+
+
+#valori ammessi dei campi enum, per i menu a tendina
+class ReferenceEnums(BaseModel):
+    tipo_sala: List[VenueType]
+    categoria_band: List[BandCategory]
+    tipo_organizzazione: List[OrganizationType]
+
+
+class ReferenceRead(BaseModel):
+    generi: List[GenreRead]
+    nazioni: List[NationRead]
+    regioni: List[RegionRead]
+    citta: List[CityRead]
+    enum: ReferenceEnums
+
+
+class PhotoRead(BaseModel):
+    id: int
+    nome: str
+    url: str
+    miniature: Dict[int, str] #lato in pixel -> URL (finché non è pronta, l'URL restituisce l'originale)
+    venue_id: Optional[int] = None
+    person_id: Optional[int] = None
+
+
+#brano dimostrativo di un artista: durata e picchi arrivano dopo il caricamento (pronto=False finché mancano)
+class TrackRead(BaseModel):
+    url: str
+    pronto: bool
+    durata: Optional[float] = None
+    picchi: Optional[List[float]] = None
+
+
+#contatori di una cache delle risposte (condivise: richieste servite dal calcolo di un'altra, contate anche tra i miss)
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    condivise: int
+    invalidazioni: int
+    chiavi: int
+    maxsize: int
+    ttl: float
+
+
+class ChatReadResult(BaseModel):
+    letti: int
@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import TTLCache
+from app.models.models import Person, PersonType, Sanction, StatoAccount, StateAccountType, Venue, pers_band
+from app.core.config import get_settings
+
+settings = get_settings()
+AUTH_CONTEXT_TTL = settings.auth_context_ttl
+AUTH_CONTEXT_MAXSIZE = settings.auth_context_maxsize
+
+#cache per processo: user_id -> AuthContext
+auth_context_cache = TTLCache(maxsize=AUTH_CONTEXT_MAXSIZE, ttl=AUTH_CONTEXT_TTL)
+
+
+@dataclass(frozen=True, slots=True)
+class AuthContext:
+    """Tutto quello che serve per autorizzare una richiesta, senza toccare l'ORM."""
+    user_id: int
+    tipo_utente: PersonType | None
+    stato_account: StateAccountType | None
+    data_fine_ban: datetime | None
+    venue_ids: frozenset[int]
+    band_ids: frozenset[int]
+    versione: int = 0 #versione dello stato dell'account (Person.versione_stato)
+
+    @property
+    def congelato(self) -> bool:
+        return self.stato_account == StateAccountType.congelato
+
+
+async def load_auth_context(db: AsyncSession, user_id: int) -> AuthContext | None:
+    # utente, stato account, fine ban, locali gestiti e band in un'unica query
+    stato = select(StatoAccount.stato).filter(
+        StatoAccount.person_id == Person.id).order_by(StatoAccount.istante.desc()).limit(1).scalar_subquery()
+    fine_ban = select(Sanction.data_fine_ban).filter(
+        Sanction.person_id == Person.id).limit(1).scalar_subquery()
+    venues = select(func.array_agg(Venue.id)).filter(
+        Venue.direttore_id == Person.id).scalar_subquery()
+    bands = select(func.array_agg(pers_band.band_id)).filter(
+        pers_band.person_id == Person.id).scalar_subquery()
+
+    riga = (await db.execute(
+        select(Person.id, Person.tipo_utente, stato, fine_ban, venues, bands, Person.versione_stato)
+        .filter(Person.id == user_id)
+    )).first()
+    if not riga:
+        return None
+    return AuthContext(
+        user_id=riga[0],
+        tipo_utente=riga[1],
+        stato_account=riga[2],
+        data_fine_ban=riga[3],
+        venue_ids=frozenset(riga[4] or ()),
+        band_ids=frozenset(riga[5] or ()),
+        versione=riga[6],
+    )
+
+
+async def get_cached_auth_context(db: AsyncSession, user_id: int) -> AuthContext | None:
+    ctx = auth_context_cache.get(user_id)
+    if ctx is None:
+        ctx = await load_auth_context(db, user_id)
+        if ctx is not None:
+            auth_context_cache.set(user_id, ctx)
+    return ctx
+
+
+def invalidate_auth_context(user_id: int):
+    """Da chiamare quando cambiano stato account, sanzioni, locali o band di un utente."""
+    auth_context_cache.invalidate(user_id)
@@ -0,0 +1,49 @@
+from datetime import date
+from sqlalchemy import extract, func
+from app.models.models import Calendar, City, Slot, SlotType, Venue, VenueType
+from app.services.read_models import OPEN_SLOTS, OpenSlotRow
+
+# Ricerca degli slot liberi su tutti i locali.
+# Il filtro per data lavora su calendar(data) / calendar(venue_id, data) e quello sullo stato
+# su slot(calendar_id, stato): gli indici sono dichiarati nei modelli e creati da scripts/init_db.py.
+
+
+def open_slots_query(
+    dal: date,
+    al: date,
+    giorni_settimana: list[int] | None = None,
+    city_id: int | None = None,
+    regione: str | None = None,
+    tipo_sala: VenueType | None = None,
+    capienza_min: int | None = None,
+):
+    """
+    Slot disponibili tra `dal` e `al` (inclusi) che rispettano i filtri.
+    Restituisce (query, order_by): order_by è crescente e univoco, adatto alla paginazione keyset.
+
+    :param giorni_settimana: 0 = lunedì ... 6 = domenica, come nella creazione dei calendari
+    """
+    query = OPEN_SLOTS.select().filter(
+        Calendar.data >= dal,
+        Calendar.data <= al,
+        Slot.stato == SlotType.disponibile,
+    )
+    if giorni_settimana:
+        #isodow: 1 = lunedì ... 7 = domenica
+        query = query.filter(extract("isodow", Calendar.data).in_([g + 1 for g in giorni_settimana]))
+    if city_id:
+        query = query.filter(Venue.city_id == city_id)
+    if regione:
+        #"lombardia" o "Lombardia": il nome della regione arriva dall'utente
+        query = query.filter(func.lower(City.regione) == regione.strip().lower())
+    if tipo_sala:
+        query = query.filter(Venue.tipo_sala == tipo_sala)
+    if capienza_min:
+        query = query.filter(Venue.capienza >= capienza_min)
+
+    order_by = [Calendar.data, Slot.orario_inizio, Slot.id]
+    return query, order_by
+
+
+def open_slot_key(riga: OpenSlotRow) -> tuple:
+    return (riga.data, riga.orario_inizio, riga.slot_id)
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import case, cast, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import Booking, BookingState, Calendar, Person, Slot, SlotType, Venue
+from app.services.outbox import enqueue_email
+
+# Stati in cui una prenotazione occupa lo slot: devono coincidere con la condizione
+# dell'indice unico parziale ux_booking_slot_attiva dichiarato sul modello Booking.
+STATI_ATTIVI = (BookingState.pendente, BookingState.accettata)
+GIORNI_SCADENZA = 5
+UNIQUE_VIOLATION = "23505"
+
+
+async def reserve_slot(db: AsyncSession, slot_id: int, band_id: int) -> Booking:
+    """
+    Crea una prenotazione pendente sullo slot senza race condition.
+
+    Lo slot viene bloccato con SELECT ... FOR UPDATE SKIP LOCKED: se un'altra richiesta
+    lo sta già prenotando si risponde subito 409 invece di mettersi in coda.
+    L'indice unico parziale sulle prenotazioni attive resta l'ultima garanzia.
+    La notifica al direttore del locale entra nell'outbox nella stessa transazione.
+    """
+    slot = (await db.execute(
+        select(Slot.id, Slot.stato, Person.email)
+        .outerjoin(Calendar, Calendar.id == Slot.calendar_id)
+        .outerjoin(Venue, Venue.id == Calendar.venue_id)
+        .outerjoin(Person, Person.id == Venue.direttore_id)
+        .filter(Slot.id == slot_id)
+        .with_for_update(of=Slot, skip_locked=True)
+    )).first()
+    if not slot:
+        #lo slot non esiste oppure è bloccato da una prenotazione in corso
+        if await db.scalar(select(Slot.id).filter(Slot.id == slot_id)) is None:
+            raise HTTPException(status_code=404, detail="Errore, slot non trovato")
+        raise HTTPException(status_code=409, detail="Errore, Slot già occupato")
+
+    if slot.stato != SlotType.disponibile:
+        raise HTTPException(status_code=409, detail="Errore, Slot già occupato")
+
+    new_book = Booking(
+        slot_id=slot_id,
+        band_id=band_id,
+        stato_prenotazione=BookingState.pendente,
+        scadenza=datetime.now() + timedelta(days=GIORNI_SCADENZA),
+        message="Richiesta di prenotazione"
+    )
+    db.add(new_book)
+    await db.execute(update(Slot).filter(Slot.id == slot_id).values(stato=SlotType.inTrattativa))
+    if slot.email:
+        enqueue_email(
+            db, slot.email, "Hai una nuova Prenotazione su EasyGIG!",
+            f"Ciao! È arrivata una nuova richiesta di prenotazione per lo slot {slot_id}.")
+    try:
+        await db.commit()
+    except IntegrityError as error:
+        await db.rollback()
+        if getattr(error.orig, "sqlstate", None) == UNIQUE_VIOLATION:
+            raise HTTPException(status_code=409, detail="Errore, Slot già occupato")
+        raise HTTPException(status_code=400, detail="Dati della prenotazione non validi")
+    return new_book
+
+
+def slot_state_if(condizione, allora: SlotType, altrimenti: SlotType):
+    """Nuovo stato dello slot scelto in SQL riga per riga (CASE convertito nel tipo enum della colonna)."""
+    return cast(case((condizione, allora.value), else_=altrimenti.value), Slot.stato.type)
+
+
+async def transition_bookings(
+    db: AsyncSession,
+    booking_ids: list[int],
+    stati_ammessi: tuple,
+    nuovo_stato: BookingState,
+    permesso,
+    stato_slot,
+    ragione: str | None = None,
+) -> list[int]:
+    """
+    Porta le prenotazioni da uno degli `stati_ammessi` a `nuovo_stato` in un'unica istruzione:
+    una CTE blocca le prenotazioni valide, poi UPDATE ... RETURNING su booking, slot e
+    calendar.slot_disponibili (che conta gli slot non occupati, come in accetta_prenotazione).
+
+    :param permesso: condizione su Booking/Calendar che l'utente deve soddisfare
+    :param stato_slot: funzione (cte target) -> nuovo stato dello slot
+    :return: gli id aggiornati; le prenotazioni che non rispettano stato o permesso restano invariate
+    """
+    target = (
+        select(
+            Booking.id.label("booking_id"),
+            Slot.id.label("slot_id"),
+            Slot.stato.label("slot_stato"),
+            Calendar.data.label("data"),
+        )
+        .outerjoin(Slot, Slot.id == Booking.slot_id)
+        .outerjoin(Calendar, Calendar.id == Slot.calendar_id)
+        .filter(Booking.id.in_(booking_ids), Booking.stato_prenotazione.in_(stati_ammessi), permesso)
+        .with_for_update(of=Booking)
+        .cte("target")
+    )
+
+    valori = {"stato_prenotazione": nuovo_stato}
+    if ragione is not None:
+        valori["ragione"] = ragione
+    upd_booking = (update(Booking).where(Booking.id == target.c.booking_id)
+                   .values(**valori).returning(Booking.id).cte("upd_booking"))
+    upd_slot = (update(Slot).where(Slot.id == target.c.slot_id)
+                .values(stato=stato_slot(target))
+                .returning(Slot.id, Slot.calendar_id, Slot.stato).cte("upd_slot"))
+
+    #variazione degli slot liberi per calendario: +1 se lo slot si libera, -1 se viene occupato
+    occupato = SlotType.occupato
+    delta = (
+        select(
+            upd_slot.c.calendar_id,
+            func.sum(case((target.c.slot_stato == occupato, 1), else_=0)
+                     - case((upd_slot.c.stato == occupato, 1), else_=0)).label("delta"),
+        )
+        .join(target, target.c.slot_id == upd_slot.c.id)
+        .group_by(upd_slot.c.calendar_id)
+        .subquery()
+    )
+    upd_calendar = (update(Calendar).where(Calendar.id == delta.c.calendar_id, delta.c.delta != 0)
+                    .values(slot_disponibili=Calendar.slot_disponibili + delta.c.delta)
+                    .returning(Calendar.id).cte("upd_calendar"))
+
+    aggiornate = (await db.scalars(select(upd_booking.c.id).add_cte(upd_slot, upd_calendar))).all()
+    await db.commit()
+    return list(aggiornate)
@@ -0,0 +1,156 @@
+import asyncio
+import json
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.notify import pg_listener
+from app.models.models import Booking, Calendar, Chat, Message, Slot, Venue
+from app.services.auth_context import AuthContext
+from app.core.config import get_settings
+
+# Chat delle prenotazioni. I messaggi vengono salvati nelle tabelle chat/message e pubblicati con
+# NOTIFY nella stessa transazione: ogni worker ascolta il canale (app.core.notify) e inoltra
+# l'evento ai WebSocket aperti su quel processo.
+
+CHAT_CHANNEL = "chat_eventi"
+MAX_LUNGHEZZA_MESSAGGIO = 1000 #caratteri: l'evento deve restare sotto il limite di 8000 byte di NOTIFY
+settings = get_settings()
+CHAT_QUEUE_SIZE = settings.chat_queue_size #eventi in attesa per connessione prima di chiuderla
+
+
+@dataclass(frozen=True, slots=True)
+class ChatAccess:
+    chat_id: int
+    direttore_id: int
+    lato_direttore: bool #True se l'utente scrive per conto del locale
+
+    @property
+    def contatore_mio(self):
+        return Chat.non_letti_direttore if self.lato_direttore else Chat.non_letti_controparte
+
+
+def chats_query():
+    #chat -> prenotazione -> slot -> calendario -> locale, per risalire ai partecipanti
+    return (
+        select(Chat, Calendar.venue_id, Venue.direttore_id, Booking.band_id, Booking.promoter_id)
+        .join(Booking, Booking.id == Chat.booking_id)
+        .join(Slot, Slot.id == Booking.slot_id)
+        .join(Calendar, Calendar.id == Slot.calendar_id)
+        .join(Venue, Venue.id == Calendar.venue_id)
+    )
+
+
+def participant_filter(ctx: AuthContext):
+    return (Calendar.venue_id.in_(ctx.venue_ids)
+            | Booking.band_id.in_(ctx.band_ids)
+            | (Booking.promoter_id == ctx.user_id))
+
+
+async def load_chat_access(db: AsyncSession, chat_id: int, ctx: AuthContext) -> ChatAccess | None:
+    """None se la chat non esiste o l'utente non partecipa alla prenotazione."""
+    riga = (await db.execute(chats_query().filter(Chat.id == chat_id, participant_filter(ctx)))).first()
+    if not riga:
+        return None
+    _chat, venue_id, direttore_id, _band_id, _promoter_id = riga
+    return ChatAccess(chat_id=chat_id, direttore_id=direttore_id, lato_direttore=venue_id in ctx.venue_ids)
+
+
+def message_event(id: int, chat_id: int, mittente_id: int, testo: str, data_invio: datetime) -> dict:
+    return {"tipo": "messaggio", "id": id, "chat_id": chat_id, "mittente_id": mittente_id,
+            "testo": testo, "data_invio": data_invio.isoformat()}
+
+
+async def send_message(db: AsyncSession, accesso: ChatAccess, mittente_id: int, testo: str) -> dict:
+    """
+    Salva il messaggio con la procedura invia_messaggio (che lo segna come non letto per l'altro lato:
+    i contatori all'invio li aggiorna solo lei) e lo pubblica dopo il commit.
+    """
+    messaggio_id, data_invio = (await db.execute(
+        text("CALL invia_messaggio(:chat_id, :mittente_id, :testo, NULL, NULL)"),
+        {"chat_id": accesso.chat_id, "mittente_id": mittente_id, "testo": testo}
+    )).one()
+    evento = message_event(messaggio_id, accesso.chat_id, mittente_id, testo, data_invio)
+    await chat_hub.commit_and_publish(db, evento)
+    return evento
+
+
+async def mark_read(db: AsyncSession, accesso: ChatAccess) -> int:
+    """Segna come letti i messaggi dell'altro lato e scala il contatore di quanti ne sono stati letti."""
+    if accesso.lato_direttore:
+        dall_altro_lato = Message.mittente_id != accesso.direttore_id
+    else:
+        dall_altro_lato = Message.mittente_id == accesso.direttore_id
+    letti = (await db.execute(
+        update(Message)
+        .where(Message.chat_id == accesso.chat_id, Message.letto.isnot(True), dall_altro_lato)
+        .values(letto=True)
+        .execution_options(synchronize_session=False)
+    )).rowcount # type: ignore
+    if not letti:
+        await db.rollback()
+        return 0
+
+    #sottraggo i letti invece di azzerare: un messaggio arrivato nel frattempo resta da leggere
+    contatore = accesso.contatore_mio
+    await db.execute(update(Chat).where(Chat.id == accesso.chat_id).values({contatore.key: contatore - letti}))
+    await chat_hub.commit_and_publish(db, {
+        "tipo": "letti", "chat_id": accesso.chat_id, "lato_direttore": accesso.lato_direttore, "letti": letti})
+    return letti
+
+
+class ChatHub:
+    """
+    Iscrizioni locali (chat_id -> code delle connessioni) per gli eventi del canale della chat.
+    Ogni connessione ha una coda limitata: se un client non legge abbastanza in fretta
+    la sua coda viene chiusa (None) invece di far crescere la memoria.
+    """
+
+    def __init__(self, channel: str = CHAT_CHANNEL, queue_size: int = CHAT_QUEUE_SIZE):
+        self.channel = channel
+        self.queue_size = queue_size
+        self._iscritti: dict[int, set[asyncio.Queue]] = defaultdict(set)
+
+    @property
+    def connessioni(self) -> int:
+        return sum(len(code) for code in self._iscritti.values())
+
+    def subscribe(self, chat_id: int) -> asyncio.Queue:
+        coda = asyncio.Queue(maxsize=self.queue_size)
+        self._iscritti[chat_id].add(coda)
+        return coda
+
+    def unsubscribe(self, chat_id: int, coda: asyncio.Queue):
+        code = self._iscritti.get(chat_id)
+        if code is not None:
+            code.discard(coda)
+            if not code:
+                del self._iscritti[chat_id]
+
+    def dispatch(self, testo: str):
+        #un solo json.loads per evento e per processo; alle connessioni va il testo già serializzato
+        chat_id = json.loads(testo)["chat_id"]
+        for coda in list(self._iscritti.get(chat_id, ())):
+            try:
+                coda.put_nowait(testo)
+            except asyncio.QueueFull:
+                self.unsubscribe(chat_id, coda)
+                while not coda.empty():
+                    coda.get_nowait()
+                coda.put_nowait(None)
+
+    async def commit_and_publish(self, db: AsyncSession, evento: dict):
+        testo = json.dumps(evento, ensure_ascii=False, separators=(",", ":"))
+        if db.get_bind().dialect.name == "postgresql":
+            #NOTIFY parte solo se la transazione va a buon fine, e arriva anche a questo processo
+            await db.execute(select(func.pg_notify(self.channel, testo)))
+            await db.commit()
+        else:
+            #senza Postgres c'è un solo processo: consegna diretta dopo il commit
+            await db.commit()
+            self.dispatch(testo)
+
+
+chat_hub = ChatHub()
+pg_listener.add(chat_hub.channel, chat_hub.dispatch)
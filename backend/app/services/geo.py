@@ -0,0 +1,98 @@
+import csv
+import math
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from app.core.config import get_settings
+
+# Posizione dei locali: un locale sta nella sua città (Venue.city_id), quindi regione, nazione e distanza
+# si risolvono sulle città. L'indice tiene in memoria la gerarchia città -> regione -> nazione e una griglia
+# di celle di GEO_CELLA_GRADI gradi con le coordinate delle città: una ricerca per raggio calcola la
+# distanza solo per le città delle celle vicine e passa al database l'elenco dei city_id.
+# L'indice fa parte dei dati di riferimento (app/services/reference.py) e si ricarica con loro.
+
+settings = get_settings()
+GEO_CELLA_GRADI = settings.geo_cell_degrees
+RAGGIO_TERRA_KM = 6371.0088
+KM_PER_GRADO = math.pi * RAGGIO_TERRA_KM / 180
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "gazetteer_it.csv")
+
+
+@dataclass(frozen=True, slots=True)
+class CityPoint:
+    id: int
+    nome: str
+    regione: str
+    nazione: str
+    latitudine: float | None
+    longitudine: float | None
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    #formula dell'haversine
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RAGGIO_TERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def read_gazetteer(path: str = GAZETTEER_PATH) -> list[dict]:
+    """Righe del gazetteer: nome, regione, nazione, latitudine, longitudine."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [{**riga, "latitudine": float(riga["latitudine"]), "longitudine": float(riga["longitudine"])}
+                for riga in csv.DictReader(f)]
+
+
+def chiave(testo: str) -> str:
+    return testo.strip().casefold()
+
+
+class GeoIndex:
+    """Gerarchia e griglia spaziale delle città; immutabile, si ricostruisce per intero."""
+
+    def __init__(self, citta: list[CityPoint], cella: float = GEO_CELLA_GRADI):
+        self.cella = cella
+        self.citta = {c.id: c for c in citta}
+        self.per_nome: dict[str, list[CityPoint]] = defaultdict(list)
+        self.per_regione: dict[str, set[int]] = defaultdict(set)
+        self.per_nazione: dict[str, set[int]] = defaultdict(set)
+        self.griglia: dict[tuple[int, int], list[CityPoint]] = defaultdict(list)
+        for c in citta:
+            self.per_nome[chiave(c.nome)].append(c)
+            self.per_regione[chiave(c.regione)].add(c.id)
+            self.per_nazione[chiave(c.nazione)].add(c.id)
+            if c.latitudine is not None and c.longitudine is not None:
+                self.griglia[self._cella(c.latitudine, c.longitudine)].append(c)
+
+    def _cella(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self.cella), math.floor(lon / self.cella)
+
+    def find_city(self, nome: str) -> CityPoint | None:
+        #a parità di nome preferisco una città con le coordinate
+        candidate = sorted(self.per_nome.get(chiave(nome), ()), key=lambda c: (c.latitudine is None, c.id))
+        return candidate[0] if candidate else None
+
+    def cities_in_region(self, regione: str) -> set[int]:
+        return self.per_regione.get(chiave(regione), set())
+
+    def cities_in_nation(self, nazione: str) -> set[int]:
+        return self.per_nazione.get(chiave(nazione), set())
+
+    def within(self, lat: float, lon: float, raggio_km: float) -> dict[int, float]:
+        """city_id -> distanza in km delle città entro `raggio_km` dal punto."""
+        dlat = raggio_km / KM_PER_GRADO
+        #i gradi di longitudine si accorciano verso i poli
+        coseno = max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        dlon = min(raggio_km / (KM_PER_GRADO * coseno), 180)
+        i_min, j_min = self._cella(lat - dlat, lon - dlon)
+        i_max, j_max = self._cella(lat + dlat, lon + dlon)
+
+        trovate = {}
+        for i in range(i_min, i_max + 1):
+            for j in range(j_min, j_max + 1):
+                for c in self.griglia.get((i, j), ()):
+                    distanza = distance_km(lat, lon, c.latitudine, c.longitudine) # type: ignore
+                    if distanza <= raggio_km:
+                        trovate[c.id] = distanza
+        return trovate
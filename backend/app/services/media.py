@@ -0,0 +1,326 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from app.core.conditional import etag_matches
+from app.core.config import get_settings
+
+# Foto e brani caricati: il corpo della richiesta va su disco a blocchi, senza tenere in memoria il file
+# intero, e prende il nome dal suo sha256 (media/foto/ab/cd/<sha256>.<ext>, media/audio/...): due caricamenti
+# uguali occupano un solo file e l'URL di un file non cambia mai contenuto. Miniature delle foto e picchi
+# dei brani si calcolano dopo la risposta, in un pool di processi dedicato.
+
+settings = get_settings()
+MEDIA_ROOT = os.path.abspath(settings.media_root)
+FOTO_DIR = "foto"
+AUDIO_DIR = "audio"
+UPLOAD_MAX_BYTES = settings.upload_max_bytes
+AUDIO_MAX_BYTES = settings.audio_max_bytes
+WAVEFORM_POINTS = settings.waveform_points
+UPLOAD_BUFFER_BYTES = settings.upload_buffer_bytes
+THUMBNAIL_SIZES = tuple(int(lato) for lato in settings.thumbnail_sizes.split(",") if lato.strip())
+MEDIA_POOL_SIZE = settings.media_pool_size
+MEDIA_ACCEL_REDIRECT = settings.media_accel_redirect
+
+FORMATI_FOTO = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+FORMATI_AUDIO = {"mp3": "audio/mpeg", "wav": "audio/wav", "ogg": "audio/ogg", "flac": "audio/flac", "m4a": "audio/mp4"}
+MEDIA_TYPES = FORMATI_FOTO | FORMATI_AUDIO
+#<sha256>.<ext> per l'originale, <sha256>_<lato>.webp per le miniature
+NOME_FILE = re.compile(r"^([0-9a-f]{64})(?:_(\d+))?\.(jpg|png|webp)$")
+NOME_BRANO = re.compile(r"^([0-9a-f]{64})\.(mp3|wav|ogg|flac|m4a)$")
+
+
+def detect_format(inizio: bytes) -> str | None:
+    #riconosco il formato dai primi byte, non dal Content-Type dichiarato dal client
+    if inizio.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if inizio.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if inizio[:4] == b"RIFF" and inizio[8:12] == b"WEBP":
+        return "webp"
+    if inizio[:4] == b"RIFF" and inizio[8:12] == b"WAVE":
+        return "wav"
+    if inizio.startswith(b"ID3") or (inizio[0] == 0xFF and inizio[1] & 0xE0 == 0xE0): #tag ID3 o frame MPEG
+        return "mp3"
+    if inizio.startswith(b"OggS"):
+        return "ogg"
+    if inizio.startswith(b"fLaC"):
+        return "flac"
+    if inizio[4:8] == b"ftyp":
+        return "m4a"
+    return None
+
+
+def file_path(nome_file: str, cartella: str = FOTO_DIR) -> str:
+    """Percorso relativo a MEDIA_ROOT; due livelli di cartelle per non averne una con milioni di file."""
+    return os.path.join(cartella, nome_file[:2], nome_file[2:4], nome_file)
+
+
+def thumbnail_name(digest: str, lato: int) -> str:
+    return f"{digest}_{lato}.webp"
+
+
+@dataclass(frozen=True, slots=True)
+class StoredFile:
+    digest: str
+    nome_file: str
+    dimensione: int
+    nuovo: bool #False se lo stesso contenuto era già su disco
+
+
+def _write(f, sha, blocco: bytearray):
+    #hash e scrittura nel thread: sha256 rilascia il GIL sui blocchi grandi
+    sha.update(blocco)
+    f.write(blocco)
+
+
+def _discard(f, percorso: str):
+    f.close()
+    if os.path.exists(percorso):
+        os.remove(percorso)
+
+
+def remove_stored(nome_file: str, root: str = MEDIA_ROOT, cartella: str = FOTO_DIR):
+    """Toglie da disco un file salvato da store_upload (per esempio se la sua riga non è stata salvata)."""
+    percorso = os.path.join(root, file_path(nome_file, cartella))
+    if os.path.exists(percorso):
+        os.remove(percorso)
+
+
+def _publish(temporaneo: str, finale: str) -> bool:
+    os.makedirs(os.path.dirname(finale), exist_ok=True)
+    if os.path.exists(finale):
+        os.remove(temporaneo)
+        return False
+    #stesso filesystem: lo spostamento è atomico, chi legge non vede mai un file a metà
+    os.replace(temporaneo, finale)
+    return True
+
+
+def _open_temp(root: str):
+    cartella = os.path.join(root, "tmp")
+    os.makedirs(cartella, exist_ok=True)
+    percorso = os.path.join(cartella, uuid.uuid4().hex)
+    return open(percorso, "wb"), percorso
+
+
+async def store_upload(blocchi, max_bytes: int = UPLOAD_MAX_BYTES, root: str = MEDIA_ROOT,
+                       buffer_bytes: int = UPLOAD_BUFFER_BYTES, formati: dict = FORMATI_FOTO,
+                       cartella: str = FOTO_DIR) -> StoredFile:
+    """
+    Salva il flusso `blocchi` (async iterable di bytes) in `cartella` con il nome del suo sha256.
+    413 oltre `max_bytes`, 415 se il formato non è tra `formati`; in caso di errore non resta nulla su disco.
+    """
+    non_supportato = HTTPException(
+        status_code=415, detail=f"Formato non supportato: sono ammessi {', '.join(f.upper() for f in formati)}")
+    f, temporaneo = await asyncio.to_thread(_open_temp, root)
+    sha = hashlib.sha256()
+    buffer = bytearray()
+    dimensione = 0
+    formato = None
+    try:
+        async for blocco in blocchi:
+            dimensione += len(blocco)
+            if dimensione > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Il file supera il limite di {max_bytes // (1024 * 1024)} MB")
+            buffer += blocco
+            if formato is None and len(buffer) >= 12:
+                formato = detect_format(bytes(buffer[:12]))
+                if formato not in formati:
+                    raise non_supportato
+            if len(buffer) >= buffer_bytes:
+                await asyncio.to_thread(_write, f, sha, buffer)
+                buffer = bytearray()
+        if formato is None:
+            raise non_supportato
+        if buffer:
+            await asyncio.to_thread(_write, f, sha, buffer)
+        await asyncio.to_thread(f.close)
+    except BaseException:
+        await asyncio.to_thread(_discard, f, temporaneo)
+        raise
+
+    digest = sha.hexdigest()
+    nome_file = f"{digest}.{formato}"
+    nuovo = await asyncio.to_thread(_publish, temporaneo, os.path.join(root, file_path(nome_file, cartella)))
+    return StoredFile(digest, nome_file, dimensione, nuovo)
+
+
+#Funzione eseguita nei processi worker (deve essere a livello di modulo per il pickle)
+def make_thumbnails(root: str, nome_file: str, lati: tuple[int, ...]) -> list[str]:
+    """Crea le miniature mancanti dell'originale `nome_file` e restituisce i loro nomi."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        print("Pillow non installato: miniature non generate")
+        return []
+
+    digest = NOME_FILE.match(nome_file).group(1) # type: ignore
+    mancanti = [l for l in lati if not os.path.exists(os.path.join(root, file_path(thumbnail_name(digest, l))))]
+    if not mancanti:
+        return []
+    creati = []
+    with Image.open(os.path.join(root, file_path(nome_file))) as immagine:
+        #per i JPEG la decodifica avviene già ridotta, vicino al lato più grande richiesto
+        immagine.draft("RGB", (max(mancanti), max(mancanti)))
+        immagine = ImageOps.exif_transpose(immagine)
+        for lato in sorted(mancanti, reverse=True):
+            nome = thumbnail_name(digest, lato)
+            finale = os.path.join(root, file_path(nome))
+            miniatura = immagine.copy()
+            miniatura.thumbnail((lato, lato))
+            temporaneo = f"{finale}.{uuid.uuid4().hex}.tmp"
+            miniatura.save(temporaneo, "WEBP", quality=80)
+            os.replace(temporaneo, finale)
+            creati.append(nome)
+    return creati
+
+
+def waveform_name(digest: str) -> str:
+    return f"{digest}_picchi.json"
+
+
+def _peaks(campioni, punti: int) -> list[float]:
+    #ampiezza massima (0..1) di ognuno dei `punti` intervalli in cui si divide il brano
+    if not len(campioni):
+        return []
+    passo = max(1, -(-len(campioni) // punti))
+    return [round(float(max(campioni[i:i + passo])), 3) for i in range(0, len(campioni), passo)]
+
+
+def _read_wav(percorso: str, punti: int) -> tuple[float, int, int, list[float]]:
+    import array
+    import wave
+
+    with wave.open(percorso, "rb") as brano:
+        canali, larghezza, frequenza, frame = (brano.getnchannels(), brano.getsampwidth(),
+                                               brano.getframerate(), brano.getnframes())
+        if larghezza not in (1, 2, 4):
+            raise ValueError(f"WAV a {larghezza * 8} bit non supportato senza soundfile")
+        scala = float(1 << (larghezza * 8 - 1))
+        #un massimo per blocco di frame, letto senza caricare tutto il file
+        frame_per_blocco = max(1, frame // (punti * 8) or 1)
+        massimi = []
+        while dati := brano.readframes(frame_per_blocco):
+            if larghezza == 1: #8 bit senza segno
+                massimi.append(max(abs(b - 128) for b in dati) / 128)
+            else:
+                valori = array.array("h" if larghezza == 2 else "i", dati)
+                massimi.append(max(max(valori), -min(valori)) / scala)
+    return frame / frequenza, canali, frequenza, _peaks(massimi, punti)
+
+
+def _read_soundfile(percorso: str, punti: int) -> tuple[float, int, int, list[float]]:
+    import numpy
+    import soundfile
+
+    info = soundfile.info(percorso)
+    blocco = max(1, info.frames // (punti * 8) or 1)
+    massimi = [float(numpy.abs(b).max()) for b in soundfile.blocks(percorso, blocksize=blocco, always_2d=True)]
+    return info.frames / info.samplerate, info.channels, info.samplerate, _peaks(massimi, punti)
+
+
+#Funzione eseguita nei processi worker (deve essere a livello di modulo per il pickle)
+def analyze_audio(root: str, nome_file: str, punti: int) -> str | None:
+    """
+    Durata e picchi del brano `nome_file`, salvati in <sha256>_picchi.json accanto al file.
+    Con soundfile (libsndfile) qualunque formato che la libreria sa leggere; senza, solo i WAV.
+    """
+    digest = NOME_BRANO.match(nome_file).group(1) # type: ignore
+    finale = os.path.join(root, file_path(waveform_name(digest), AUDIO_DIR))
+    if os.path.exists(finale):
+        return None
+    percorso = os.path.join(root, file_path(nome_file, AUDIO_DIR))
+    try:
+        durata, canali, frequenza, picchi = _read_soundfile(percorso, punti)
+    except ImportError:
+        if not nome_file.endswith(".wav"):
+            print(f"soundfile non installato: picchi di {nome_file} non calcolati")
+            return None
+        durata, canali, frequenza, picchi = _read_wav(percorso, punti)
+
+    temporaneo = f"{finale}.{uuid.uuid4().hex}.tmp"
+    with open(temporaneo, "w") as f:
+        json.dump({"durata": round(durata, 3), "canali": canali, "frequenza": frequenza, "picchi": picchi}, f,
+                  separators=(",", ":"))
+    os.replace(temporaneo, finale)
+    return waveform_name(digest)
+
+
+def read_waveform(digest: str, root: str = MEDIA_ROOT) -> dict | None:
+    percorso = os.path.join(root, file_path(waveform_name(digest), AUDIO_DIR))
+    try:
+        with open(percorso) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class MediaWorker:
+    """
+    Miniature delle foto e picchi dei brani, calcolati in un pool di processi dopo la risposta al caricamento.
+    Un file già in lavorazione non viene rimesso in coda; i risultati già su disco non si rifanno.
+    """
+
+    def __init__(self, workers: int = MEDIA_POOL_SIZE, root: str = MEDIA_ROOT, lati: tuple[int, ...] = THUMBNAIL_SIZES,
+                 punti: int = WAVEFORM_POINTS):
+        self.workers = workers
+        self.root = root
+        self.lati = lati
+        self.punti = punti
+        self._executor: ProcessPoolExecutor | None = None
+        self._in_corso: dict[str, asyncio.Future] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _schedule(self, nome_file: str, funzione, *args) -> asyncio.Future:
+        if nome_file not in self._in_corso:
+            loop = asyncio.get_running_loop()
+            futuro = loop.run_in_executor(self._get_executor(), funzione, self.root, nome_file, *args)
+            self._in_corso[nome_file] = futuro
+            futuro.add_done_callback(lambda f: self._done(nome_file, f))
+        return self._in_corso[nome_file]
+
+    def thumbnails(self, nome_file: str) -> asyncio.Future | None:
+        return self._schedule(nome_file, make_thumbnails, self.lati) if self.lati else None
+
+    def waveform(self, nome_file: str) -> asyncio.Future:
+        return self._schedule(nome_file, analyze_audio, self.punti)
+
+    def _done(self, nome_file: str, futuro: asyncio.Future):
+        self._in_corso.pop(nome_file, None)
+        if not futuro.cancelled() and futuro.exception():
+            print(f"Elaborazione di {nome_file} non riuscita: {futuro.exception()}")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+media_worker = MediaWorker()
+
+
+def media_file_response(request: Request, relativo: str, media_type: str, etag: str, cache_control: str,
+                        root: str = MEDIA_ROOT) -> Response:
+    """
+    Risposta con un file di MEDIA_ROOT: 304 se l'ETag coincide, altrimenti il file intero o le parti
+    chieste con Range (206, gestite da FileResponse). Senza proxy il file intero passa dall'estensione
+    pathsend del server ASGI (sendfile) quando c'è; con MEDIA_ACCEL_REDIRECT lo spedisce nginx, Range compreso.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if MEDIA_ACCEL_REDIRECT:
+        headers["X-Accel-Redirect"] = MEDIA_ACCEL_REDIRECT.rstrip("/") + "/" + relativo.replace(os.sep, "/")
+        return Response(media_type=media_type, headers=headers)
+    return FileResponse(os.path.join(root, relativo), media_type=media_type, headers=headers)
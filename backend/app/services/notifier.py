@@ -1,18 +1,11 @@
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
-import os
-
-conf = ConnectionConfig(
-    MAIL_USERNAME=str(os.getenv('MAIL_USERNAME', '')),
-    MAIL_PASSWORD=str(os.getenv('MAIL_PASSWORD', '')),  # type: ignore
-    MAIL_FROM=str(os.getenv('MAIL_FROM', '')),
-    MAIL_PORT=int(str(os.getenv('MAIL_PORT', '587'))),
-    MAIL_SERVER=str(os.getenv('MAIL_SERVER', '')),
-    MAIL_FROM_NAME="EasyGIG Team",
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
-)
+from dataclasses import dataclass, field
+from jinja2 import Environment
+from markupsafe import Markup
+from app.services.outbox import enqueue_email
+
+# Notifiche ai direttori artistici. Ogni esecuzione dei controlli raccoglie le notifiche in un
+# NotificationDigest, che spedisce (tramite l'outbox) una sola mail per destinatario.
+
 # funzione per calcolare quanti ban ha e rilasciare il risultato nell'html
 
 
@@ -25,86 +18,103 @@ def calculate_ban_duration(current_bans: int):
     return days_to_add
 
 
-async def send_mail(subject: str, recipient: str, body_html: str):
-
-    message = MessageSchema(
-        subject=subject,
-        recipients=[recipient],  # type: ignore
-        body=body_html,
-        subtype=MessageType.html
-    )
-    fm = FastMail(conf)
-    await fm.send_message(message)
-
-
-async def send_strike_notification(email_to: str, director_name: str, strike_count: int, current_bans: int):
-    subject = "Avviso di Strike! - EasyGIG"
-    html = f"""
-    <html>
-        <body>
-            <h2>Ciao {director_name},</h2>
-            <p>Ti informiamo che ti è stato assegnato uno <b>strike</b> per inattività.</p>
-            <p><b>Motivazione:</b> Non hai risposto a una richiesta di prenotazione entro i 5 giorni previsti.</p>
-            <p>Attualmente il tuo totale è di <b>{strike_count}/5</b> strike.</p>
-            <hr>
-            <p><small>Ricorda: al raggiungimento del 5° strike, il tuo account verrà sospeso per {calculate_ban_duration(current_bans)} giorni.</small></p>
-        </body>
-    </html>
-    """
-    await send_mail(subject, email_to, html)
-
-
-async def send_ban_notification(email_to: str, director_name: str, current_bans: int):
-    subject = "Avviso di Ban - EasyGIG"
-    html = f"""
-    <html>
-        <body>
-            <h2>Ciao {director_name},</h2>
-            <p>Ti informiamo che ti è stato assegnato un <b>ban</b>.</p>
-            <p><b>Motivazione:</b> Hai raggiunto la soglia massima di strike</p>
-            <hr>
-            <p><small>Ricorda: il tuo account verrà sospeso per {calculate_ban_duration(current_bans)} giorni.</small></p>
-        </body>
-    </html>
-    """
-    await send_mail(subject, email_to, html)
-
-
-async def send_reminder_notification(
-    email_to: str,
-    director_name: str,
-    band_name: str,
-    data_evento: str,
-    giorni_rimanenti: int
-):
-    subject = f"Promemoria: Una prenotazione scade tra {giorni_rimanenti} giorni!"
-    html = f"""
-    <html>
-        <body>
-            <h2>Ciao {director_name},</h2>
-            <p>Hai una richiesta di prenotazione in sospeso che richiede la tua attenzione.</p>
-            <ul>
-                <li><b>Band:</b> {band_name}</li>
-                <li><b>Data Evento:</b> {data_evento}</li>
-            </ul>
-            <p>Ti restano <b>{giorni_rimanenti} giorni</b> per rispondere prima che la richiesta scada e ti venga assegnato uno <b>strike</b> automatico.</p>
-            <p>Accedi subito a EasyGIG per accettare o rifiutare la prenotazione.</p>
-            <hr>
-            <p><small>Questa è una notifica automatica di cortesia per aiutarti a gestire il tuo locale al meglio.</small></p>
-        </body>
-    </html>
+#Template compilati una sola volta all'import; i valori inseriti vengono escapati
+_env = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
+
+STRIKE_TEMPLATE = _env.from_string("""
+<p>Ti informiamo che ti è stato assegnato uno <b>strike</b> per inattività.</p>
+<p><b>Motivazione:</b> Non hai risposto a una richiesta di prenotazione entro i 5 giorni previsti.</p>
+<p>Attualmente il tuo totale è di <b>{{ strike_count }}/5</b> strike.</p>
+<p><small>Ricorda: al raggiungimento del 5° strike, il tuo account verrà sospeso per {{ giorni_ban }} giorni.</small></p>
+""")
+
+BAN_TEMPLATE = _env.from_string("""
+<p>Ti informiamo che ti è stato assegnato un <b>ban</b> (il {{ numero_ban }}° sul tuo account).</p>
+<p><b>Motivazione:</b> Hai raggiunto la soglia massima di strike</p>
+<p><small>Ricorda: il tuo account verrà sospeso per {{ giorni_ban }} giorni.</small></p>
+""")
+
+REMINDER_TEMPLATE = _env.from_string("""
+<p>Hai una richiesta di prenotazione in sospeso che richiede la tua attenzione.</p>
+<ul>
+    <li><b>Band:</b> {{ band_name }}</li>
+    <li><b>Data Evento:</b> {{ data_evento }}</li>
+</ul>
+<p>Ti restano <b>{{ giorni_rimanenti }} giorni</b> per rispondere prima che la richiesta scada e ti venga assegnato uno <b>strike</b> automatico.</p>
+<p>Accedi subito a EasyGIG per accettare o rifiutare la prenotazione.</p>
+""")
+
+UNBAN_TEMPLATE = _env.from_string("""
+<p>Ora puoi riprendere le attività del tuo locale!</p>
+""")
+
+MAIL_TEMPLATE = _env.from_string("""
+<html>
+    <body>
+        <h2>Ciao {{ nome }},</h2>
+        {% for sezione in sezioni %}
+        {{ sezione }}
+        <hr>
+        {% endfor %}
+        <p><small>Questa è una notifica automatica di EasyGIG.</small></p>
+    </body>
+</html>
+""")
+
+
+@dataclass
+class Destinatario:
+    nome: str
+    oggetti: list[str] = field(default_factory=list)
+    sezioni: list[Markup] = field(default_factory=list)
+
+
+class NotificationDigest:
     """
-    await send_mail(subject, email_to, html)
-
-
-async def send_unban_notification(email_to: str, director_name: str):
-    subject = f"BENTORNATO!"
-    html = f"""
-    <html>
-        <body>
-            <h2>Ciao {director_name},</h2>
-            <p>Ora puoi riprendere le attività del tuo locale!</p>
-        </body>
-    </html>
+    Raccoglie le notifiche di un'esecuzione, raggruppate per indirizzo email.
+    Con una sola notifica la mail mantiene il suo oggetto, con più notifiche diventa un riepilogo.
     """
-    await send_mail(subject, email_to, html)
+
+    def __init__(self):
+        self.destinatari: dict[str, Destinatario] = {}
+
+    def _add(self, email_to: str, nome: str, oggetto: str, template, **dati):
+        destinatario = self.destinatari.setdefault(str(email_to), Destinatario(nome=nome))
+        destinatario.oggetti.append(oggetto)
+        destinatario.sezioni.append(Markup(template.render(**dati)))
+
+    def strike(self, email_to: str, director_name: str, strike_count: int, current_bans: int):
+        self._add(email_to, director_name, "Avviso di Strike! - EasyGIG", STRIKE_TEMPLATE,
+                  strike_count=strike_count, giorni_ban=calculate_ban_duration(current_bans))
+
+    def ban(self, email_to: str, director_name: str, numero_ban: int):
+        #numero_ban comprende il ban appena applicato: la durata dipende da quelli precedenti
+        self._add(email_to, director_name, "Avviso di Ban - EasyGIG", BAN_TEMPLATE,
+                  numero_ban=numero_ban, giorni_ban=calculate_ban_duration(numero_ban - 1))
+
+    def reminder(self, email_to: str, director_name: str, band_name: str, data_evento: str, giorni_rimanenti: int):
+        self._add(email_to, director_name, f"Promemoria: Una prenotazione scade tra {giorni_rimanenti} giorni!",
+                  REMINDER_TEMPLATE, band_name=band_name, data_evento=data_evento, giorni_rimanenti=giorni_rimanenti)
+
+    def unban(self, email_to: str, director_name: str):
+        self._add(email_to, director_name, "BENTORNATO!", UNBAN_TEMPLATE)
+
+    def enqueue(self, db) -> dict:
+        """
+        Scrive nell'outbox una mail per destinatario (senza commit, come enqueue_email).
+        Restituisce il resoconto: destinatari, notifiche raccolte e quante sono state accorpate.
+        """
+        notifiche = 0
+        for email_to, destinatario in self.destinatari.items():
+            n = len(destinatario.oggetti)
+            notifiche += n
+            oggetto = destinatario.oggetti[0] if n == 1 else f"EasyGIG: hai {n} nuove notifiche"
+            corpo = MAIL_TEMPLATE.render(nome=destinatario.nome, sezioni=destinatario.sezioni)
+            enqueue_email(db, email_to, oggetto, corpo)
+        resoconto = {
+            "destinatari": len(self.destinatari),
+            "notifiche": notifiche,
+            "accorpate": notifiche - len(self.destinatari),
+        }
+        self.destinatari = {}
+        return resoconto
@@ -0,0 +1,154 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from app.core.database import AsyncSessionLocal
+from app.core.mail import SmtpPool, build_message, default_sender
+from app.models.models import EmailOutbox, OutboxState
+from app.core.config import get_settings
+
+# Outbox delle email: le route scrivono la mail nella stessa transazione della modifica
+# (enqueue_email) e un worker asincrono la spedisce dopo il commit, con connessioni SMTP
+# riutilizzate, tentativi con backoff esponenziale e stato "fallita" come dead-letter.
+
+settings = get_settings()
+OUTBOX_BATCH_SIZE = settings.outbox_batch_size
+OUTBOX_MAX_ATTEMPTS = settings.outbox_max_attempts
+OUTBOX_BACKOFF_BASE = settings.outbox_backoff_base #secondi prima del secondo tentativo
+OUTBOX_BACKOFF_MAX = settings.outbox_backoff_max
+OUTBOX_POLL_INTERVAL = settings.outbox_poll_interval
+OUTBOX_LEASE = settings.outbox_lease
+
+
+def enqueue_email(db, destinatario: str, oggetto: str, corpo_html: str) -> EmailOutbox:
+    """
+    Aggiunge la mail all'outbox senza fare commit: viene salvata (e poi spedita)
+    solo se la transazione del chiamante va a buon fine. Funziona con sessioni sync e async.
+    """
+    #orari dal clock dell'applicazione, lo stesso usato dal worker per scegliere le mail da spedire
+    adesso = datetime.now()
+    mail = EmailOutbox(destinatario=str(destinatario), oggetto=oggetto, corpo=corpo_html,
+                       creata=adesso, prossimo_tentativo=adesso)
+    db.add(mail)
+    return mail
+
+
+def backoff(tentativi: int) -> timedelta:
+    #30s, 60s, 120s, ... fino a OUTBOX_BACKOFF_MAX, con un po' di jitter per non ripartire tutti insieme
+    secondi = min(OUTBOX_BACKOFF_BASE * 2 ** (tentativi - 1), OUTBOX_BACKOFF_MAX)
+    return timedelta(seconds=secondi * random.uniform(1, 1.1))
+
+
+class OutboxWorker:
+    """
+    Spedisce le mail in attesa a blocchi di `batch_size`.
+    Il blocco viene preso in una transazione breve (FOR UPDATE SKIP LOCKED) che sposta prossimo_tentativo
+    avanti di `lease` secondi: gli altri processi non lo riprendono, e nessuna transazione resta aperta
+    durante gli invii SMTP. L'esito si registra in una seconda transazione; se il processo muore
+    prima, allo scadere del lease le mail tornano disponibili.
+    Il parallelismo è limitato dalla dimensione del pool SMTP.
+    """
+
+    def __init__(
+        self,
+        pool: SmtpPool,
+        session_factory=AsyncSessionLocal,
+        mittente: str | None = None,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        max_tentativi: int = OUTBOX_MAX_ATTEMPTS,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        lease: float = OUTBOX_LEASE,
+    ):
+        self.pool = pool
+        self.session_factory = session_factory
+        self.mittente = mittente
+        self.batch_size = batch_size
+        self.max_tentativi = max_tentativi
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self._stop = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def claim(self) -> tuple[list, datetime]:
+        """Prende un blocco di mail da spedire; restituisce le righe e la scadenza del lease."""
+        async with self.session_factory() as db:
+            mails = (await db.execute(
+                select(EmailOutbox.id, EmailOutbox.destinatario, EmailOutbox.oggetto, EmailOutbox.corpo,
+                       EmailOutbox.tentativi)
+                .filter(EmailOutbox.stato == OutboxState.inAttesa, EmailOutbox.prossimo_tentativo <= datetime.now())
+                .order_by(EmailOutbox.prossimo_tentativo, EmailOutbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )).all()
+            scadenza = datetime.now() + timedelta(seconds=self.lease)
+            if mails:
+                await db.execute(
+                    update(EmailOutbox).where(EmailOutbox.id.in_([m.id for m in mails]))
+                    .values(prossimo_tentativo=scadenza).execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        return mails, scadenza
+
+    async def run_once(self) -> int:
+        """Spedisce un blocco di mail e ne registra l'esito. Restituisce quante mail ha elaborato."""
+        mittente = self.mittente or default_sender()
+        mails, scadenza = await self.claim()
+        if not mails:
+            return 0
+
+        esiti = await asyncio.gather(
+            *(self.pool.send(build_message(mittente, m.destinatario, m.oggetto, m.corpo)) for m in mails),
+            return_exceptions=True,
+        )
+
+        adesso = datetime.now()
+        inviate = [mail.id for mail, esito in zip(mails, esiti) if not isinstance(esito, BaseException)]
+        async with self.session_factory() as db:
+            #solo le righe ancora nel nostro lease: scaduto, la mail può essere già stata ripresa da un altro worker
+            nel_lease = (EmailOutbox.prossimo_tentativo == scadenza)
+            if inviate:
+                await db.execute(
+                    update(EmailOutbox).where(EmailOutbox.id.in_(inviate), nel_lease)
+                    .values(stato=OutboxState.inviata, inviata_il=adesso).execution_options(synchronize_session=False)
+                )
+            for mail, esito in zip(mails, esiti):
+                if not isinstance(esito, BaseException):
+                    continue
+                tentativi = mail.tentativi + 1
+                valori = {"tentativi": tentativi, "ultimo_errore": f"{type(esito).__name__}: {esito}"[:1000]}
+                if tentativi >= self.max_tentativi:
+                    valori["stato"] = OutboxState.fallita
+                else:
+                    valori["prossimo_tentativo"] = adesso + backoff(tentativi)
+                await db.execute(
+                    update(EmailOutbox).where(EmailOutbox.id == mail.id, nel_lease)
+                    .values(valori).execution_options(synchronize_session=False)
+                )
+            await db.commit()
+        return len(mails)
+
+    async def run(self):
+        while not self._stop.is_set():
+            try:
+                elaborate = await self.run_once()
+            except Exception as error:
+                print(f"Errore outbox: {error}")
+                elaborate = 0
+            #se il blocco era pieno ci sono altre mail in coda: riparto subito
+            if elaborate < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        self._stop.clear()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self.pool.close()
+
@@ -0,0 +1,70 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from app.core.config import get_settings
+
+settings = get_settings()
+#Costo di bcrypt: se cambia, gli hash esistenti vengono aggiornati al login successivo
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+PASSWORD_POOL_SIZE = settings.password_pool_size
+PASSWORD_QUEUE_LIMIT = settings.password_queue_limit #operazioni in coda oltre le quali si risponde 503
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+#Funzioni eseguite nei processi worker (devono essere a livello di modulo per il pickle)
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, password_hash: str) -> tuple[bool, str | None]:
+    #restituisce (valida, nuovo_hash); nuovo_hash è valorizzato solo se il costo è cambiato
+    return pwd_context.verify_and_update(password, password_hash)
+
+
+class PasswordHasher:
+    """
+    Esegue hash e verifica delle password in un pool di processi dedicato,
+    così bcrypt non occupa né l'event loop né il threadpool delle route.
+    Oltre `max_pending` operazioni in attesa le nuove richieste ricevono 503.
+    """
+
+    def __init__(self, workers: int = PASSWORD_POOL_SIZE, max_pending: int = PASSWORD_QUEUE_LIMIT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: ProcessPoolExecutor | None = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Server occupato, riprova tra qualche secondo",
+                headers={"Retry-After": "1"}
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(hash_password, password)
+
+    async def verify(self, password: str, password_hash: str) -> tuple[bool, str | None]:
+        return await self._submit(verify_password, password, password_hash)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
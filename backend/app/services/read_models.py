@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from datetime import date, time
+from pydantic import TypeAdapter
+from sqlalchemy import String, func, literal_column, select
+from app.models.models import BookingOrganization, Calendar, City, Person, PersonType, Slot, Venue, VenueType
+
+# Read model delle liste: si selezionano solo le colonne necessarie (con le join dichiarate
+# per ogni endpoint) e ogni riga diventa un oggetto leggero con __slots__, senza ORM.
+
+
+class Projection:
+    """
+    Associa un read model (dataclass con slots) alla select delle sue colonne.
+    Le colonne della select devono seguire l'ordine dei campi del read model.
+    """
+
+    def __init__(self, model, query):
+        self.model = model
+        self.query = query
+        self._adapter = TypeAdapter(model)
+
+    def select(self):
+        return self.query
+
+    def build(self, riga):
+        return self.model(*riga)
+
+    def build_all(self, righe):
+        model = self.model
+        return [model(*riga) for riga in righe]
+
+    def dump_json(self, riga) -> str:
+        #serializzazione diretta della riga, senza validazione (usata nello streaming)
+        return self._adapter.dump_json(self.model(*riga)).decode()
+
+
+@dataclass(frozen=True, slots=True)
+class UserRow:
+    id: int
+    nome_completo: str
+    citta: str
+    organizzazione: str
+    tipo: PersonType | None
+
+
+@dataclass(frozen=True, slots=True)
+class VenueRow:
+    id: int
+    nome: str
+    email: str
+    telefono: str
+    tipo_sala: VenueType
+    capienza: int
+    strumentazione: str
+    city_id: int
+
+
+@dataclass(frozen=True, slots=True)
+class CalendarRow:
+    id: int
+    data: date
+    data_inizio: time
+    data_fine: time
+    slot_disponibili: int
+    venue_id: int | None
+
+
+@dataclass(frozen=True, slots=True)
+class SearchRow:
+    tipo: str
+    id: int
+    nome: str
+    genere_id: int | None
+    categoria: str | None
+    city_id: int | None
+    rank: float
+
+
+@dataclass(frozen=True, slots=True)
+class OpenSlotRow:
+    slot_id: int
+    orario_inizio: time
+    orario_fine: time
+    calendar_id: int
+    data: date
+    venue_id: int
+    venue_nome: str
+    tipo_sala: VenueType
+    capienza: int
+    city_id: int
+    citta: str
+    regione: str
+
+
+#utenti: città (obbligatoria) e organizzazione (facoltativa) nella stessa select
+USERS = Projection(UserRow, select(
+    Person.id,
+    Person.nome + literal_column("' '", String) + Person.cognome,
+    City.nome,
+    func.coalesce(BookingOrganization.nome, "Nessuna"),
+    Person.tipo_utente,
+).join(City, City.id == Person.city_id).outerjoin(BookingOrganization, BookingOrganization.id == Person.organization_id))
+
+VENUES = Projection(VenueRow, select(
+    Venue.id, Venue.nome, Venue.email, Venue.telefono, Venue.tipo_sala, Venue.capienza, Venue.strumentazione, Venue.city_id,
+))
+
+CALENDARS = Projection(CalendarRow, select(
+    Calendar.id, Calendar.data, Calendar.data_inizio, Calendar.data_fine, Calendar.slot_disponibili, Calendar.venue_id,
+))
+
+#slot liberi: slot -> calendario -> locale -> città del locale
+OPEN_SLOTS = Projection(OpenSlotRow, select(
+    Slot.id, Slot.orario_inizio, Slot.orario_fine, Calendar.id, Calendar.data,
+    Venue.id, Venue.nome, Venue.tipo_sala, Venue.capienza, City.id, City.nome, City.regione,
+).join(Calendar, Calendar.id == Slot.calendar_id)
+ .join(Venue, Venue.id == Calendar.venue_id)
+ .join(City, City.id == Venue.city_id))
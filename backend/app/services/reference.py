@@ -0,0 +1,132 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.conditional import strong_etag
+from app.core.config import get_settings
+from app.core.database import AsyncSessionLocal
+from app.core.notify import pg_listener
+from app.models.models import BandCategory, City, Genre, Nation, OrganizationType, Region, VenueType
+from app.services.geo import CityPoint, GeoIndex, chiave
+
+# Dati di riferimento: generi, nazioni, regioni, città e vocabolari enum cambiano quasi mai.
+# Ogni processo ne tiene un'istantanea immutabile, caricata all'avvio, con le risposte degli endpoint
+# /reference già serializzate e il loro ETag. I trigger creati da scripts/init_db.py inviano un NOTIFY
+# su REFERENCE_CHANNEL a ogni modifica delle tabelle: l'istantanea viene ricaricata alla richiesta successiva.
+
+settings = get_settings()
+REFERENCE_TTL = settings.reference_ttl
+REFERENCE_CHANNEL = "dati_riferimento"
+ENUMS = {"tipo_sala": VenueType, "categoria_band": BandCategory, "tipo_organizzazione": OrganizationType}
+
+
+@dataclass(frozen=True, slots=True)
+class Section:
+    """Corpo JSON di un endpoint e il suo ETag forte."""
+    body: bytes
+    etag: str
+
+
+def build_section(dati) -> Section:
+    body = json.dumps(dati, ensure_ascii=False, separators=(",", ":")).encode()
+    return Section(body, strong_etag(body))
+
+
+class ReferenceData:
+    """Istantanea dei dati di riferimento; immutabile, si ricostruisce per intero."""
+
+    def __init__(self, generi: list[tuple[int, str]], nazioni: list[str], regioni: list[tuple[str, str]],
+                 citta: list[CityPoint]):
+        self.generi = dict(generi)
+        self.geo = GeoIndex(citta)
+        self.citta = self.geo.citta
+        self._nomi_citta = sorted((chiave(c.nome), c.id) for c in citta)
+
+        #le righe arrivano già ordinate: stesso contenuto, stesso ETag su tutti i worker
+        dati = {
+            "generi": [{"id": i, "nome": n} for i, n in generi],
+            "nazioni": [{"nome": n} for n in nazioni],
+            "regioni": [{"nome": r, "nazione": n} for r, n in regioni],
+            "citta": [{"id": c.id, "nome": c.nome, "regione": c.regione, "nazione": c.nazione,
+                       "latitudine": c.latitudine, "longitudine": c.longitudine} for c in citta],
+            "enum": {nome: [v.value for v in enum] for nome, enum in ENUMS.items()},
+        }
+        self.sezioni = {nome: build_section(valore) for nome, valore in dati.items()}
+        self.sezioni["tutti"] = build_section(dati)
+
+    def city_name(self, city_id: int | None) -> str | None:
+        citta = self.citta.get(city_id) # type: ignore
+        return citta.nome if citta else None
+
+    def genre_name(self, genere_id: int | None) -> str | None:
+        return self.generi.get(genere_id) # type: ignore
+
+    def cities_matching(self, testo: str) -> list[int]:
+        #stesso significato del vecchio filtro City.nome ILIKE '%testo%'
+        testo = chiave(testo)
+        return sorted(i for nome, i in self._nomi_citta if testo in nome)
+
+
+async def load_reference_data(db: AsyncSession) -> ReferenceData:
+    generi = (await db.execute(select(Genre.id, Genre.nome).order_by(Genre.id))).all()
+    nazioni = (await db.scalars(select(Nation.nome).order_by(Nation.nome))).all()
+    regioni = (await db.execute(select(Region.nome, Region.nazione).order_by(Region.nazione, Region.nome))).all()
+    citta = (await db.execute(select(
+        City.id, City.nome, City.regione, City.nazione, City.latitudine, City.longitudine
+    ).order_by(City.id))).all()
+    return ReferenceData([tuple(g) for g in generi], list(nazioni), [tuple(r) for r in regioni], # type: ignore
+                         [CityPoint(*c) for c in citta])
+
+
+class ReferenceCache:
+    """
+    Un solo ReferenceData per processo. Una modifica notificata lo rende vecchio e la richiesta
+    successiva lo ricarica; il ttl copre le notifiche perse mentre l'ascolto era interrotto.
+    """
+
+    def __init__(self, ttl: float = REFERENCE_TTL):
+        self.ttl = ttl
+        self._dati: ReferenceData | None = None
+        self._caricato = 0.0
+        self._scaduto = False
+        self._generazione = 0 #cresce a ogni modifica notificata
+        self._lock = asyncio.Lock()
+        self.caricamenti = 0
+
+    def _valido(self) -> bool:
+        return self._dati is not None and not self._scaduto and time.monotonic() - self._caricato <= self.ttl
+
+    async def get(self, db: AsyncSession) -> ReferenceData:
+        if not self._valido():
+            async with self._lock:
+                #un'altra richiesta potrebbe averlo già ricaricato mentre aspettavo
+                if not self._valido():
+                    await self._load(db)
+        return self._dati # type: ignore
+
+    async def _load(self, db: AsyncSession):
+        generazione = self._generazione
+        self._dati = await load_reference_data(db)
+        self.caricamenti += 1
+        self._caricato = time.monotonic()
+        #una modifica arrivata durante la lettura potrebbe mancare: resta da ricaricare
+        self._scaduto = generazione != self._generazione
+
+    async def refresh(self):
+        """Caricamento all'avvio, con una sessione propria."""
+        async with self._lock:
+            async with AsyncSessionLocal() as db:
+                await self._load(db)
+
+    def invalidate(self):
+        self._generazione += 1
+        self._scaduto = True
+
+    def on_notify(self, _payload: str):
+        self.invalidate()
+
+
+reference_cache = ReferenceCache()
+pg_listener.add(REFERENCE_CHANNEL, reference_cache.on_notify)
@@ -0,0 +1,75 @@
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+from app.models.models import Person, Review, Score
+
+# La reputazione è mantenuta dal trigger aggiorna_reputazione (scripts/init_db.py) con i contatori
+# somma_voti/numero_voti: qui si ricalcola tutto da zero per trovare e correggere eventuali scarti.
+
+
+def expected_reputation(somma: int, numero: int) -> Decimal:
+    #stesso arrotondamento di ROUND(numeric, 2) in Postgres
+    if not numero:
+        return Decimal("0.00")
+    return (Decimal(somma) / Decimal(numero)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+@dataclass
+class ReconcileReport:
+    persone: int = 0
+    corrette: int = 0
+    scarti: list[tuple] = field(default_factory=list) #(person_id, valori salvati, valori attesi)
+
+    def merge(self, altro: "ReconcileReport"):
+        self.persone += altro.persone
+        self.corrette += altro.corrette
+        self.scarti.extend(altro.scarti)
+
+
+def reconcile_chunk(db: Session, da_id: int, a_id: int, correggi: bool = True) -> ReconcileReport:
+    """
+    Ricalcola somma, numero e media dei voti per le persone con id in [da_id, a_id).
+    Le righe person del blocco restano bloccate fino al commit: un voto inserito nel frattempo
+    aspetta e il suo trigger parte dai valori già corretti.
+    """
+    report = ReconcileReport()
+    salvati = db.execute(
+        select(Person.id, Person.somma_voti, Person.numero_voti, Person.reputazione)
+        .filter(Person.id >= da_id, Person.id < a_id)
+        .with_for_update()
+    ).all()
+    report.persone = len(salvati)
+    if not salvati:
+        db.rollback()
+        return report
+
+    aggregati = {
+        destinatario_id: (somma, numero)
+        for destinatario_id, somma, numero in db.execute(
+            select(Review.destinatario_id, func.sum(Score.voto), func.count(Score.id))
+            .join(Score, Score.review_id == Review.id)
+            .filter(Review.destinatario_id >= da_id, Review.destinatario_id < a_id)
+            .group_by(Review.destinatario_id)
+        )
+    }
+
+    correzioni = []
+    for person_id, somma_voti, numero_voti, reputazione in salvati:
+        somma, numero = aggregati.get(person_id, (0, 0))
+        attesa = expected_reputation(somma, numero)
+        if (somma_voti, numero_voti) != (somma, numero) or Decimal(reputazione or 0) != attesa:
+            report.scarti.append((person_id, (somma_voti, numero_voti, reputazione), (somma, numero, attesa)))
+            correzioni.append({"pid": person_id, "somma": somma, "numero": numero, "reputazione": attesa})
+
+    if correggi and correzioni:
+        db.execute(
+            update(Person.__table__).where(Person.__table__.c.id == bindparam("pid"))
+            .values(somma_voti=bindparam("somma"), numero_voti=bindparam("numero"), reputazione=bindparam("reputazione")),
+            correzioni,
+        )
+        report.corrette = len(correzioni)
+        db.commit()
+    else:
+        db.rollback()
+    return report
@@ -0,0 +1,69 @@
+import json
+from fastapi import Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import SingleFlightCache
+from app.core.config import get_settings
+from app.core.notify import pg_listener
+from app.schemas.schemas import Page
+
+# Cache delle risposte delle ricerche pubbliche, uguali per tutti gli utenti: pagine già serializzate,
+# per chiave di parametri normalizzati. Le scritture sulle righe coinvolte (locali, band, registrazioni)
+# svuotano la cache dell'endpoint su tutti i worker con un NOTIFY su CACHE_CHANNEL.
+
+settings = get_settings()
+RESPONSE_CACHE_TTL = settings.response_cache_ttl
+RESPONSE_CACHE_MAXSIZE = settings.response_cache_maxsize
+CACHE_CHANNEL = "cache_risposte"
+
+response_caches = {
+    "venues": SingleFlightCache(maxsize=RESPONSE_CACHE_MAXSIZE, ttl=RESPONSE_CACHE_TTL),
+    "artists": SingleFlightCache(maxsize=RESPONSE_CACHE_MAXSIZE, ttl=RESPONSE_CACHE_TTL),
+}
+
+
+def on_notify(payload: str):
+    for nome in json.loads(payload):
+        response_caches[nome].invalidate()
+
+
+pg_listener.add(CACHE_CHANNEL, on_notify)
+
+
+async def invalidate_responses(db: AsyncSession, *nomi: str):
+    """Da chiamare prima del commit di una scrittura che cambia i risultati degli endpoint `nomi`."""
+    #subito in questo worker; gli altri (e di nuovo questo) lo fanno al commit, quando arriva il NOTIFY
+    for nome in nomi:
+        response_caches[nome].invalidate()
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(select(func.pg_notify(CACHE_CHANNEL, json.dumps(nomi))))
+
+
+def cache_key(parametri: dict, esatti: tuple = ("cursor",)) -> tuple:
+    """
+    Parametri senza i None, in ordine; i testi (tranne `esatti`) in minuscolo, perché tutti i filtri
+    testuali delle ricerche ignorano le maiuscole (ILIKE, pg_trgm, tsvector 'simple', indice delle città).
+    """
+    chiave = []
+    for nome, valore in sorted(parametri.items()):
+        if valore is None:
+            continue
+        if isinstance(valore, str) and nome not in esatti:
+            valore = valore.lower()
+        elif hasattr(valore, "value"): #enum
+            valore = valore.value
+        chiave.append((nome, valore))
+    return tuple(chiave)
+
+
+async def cached_page(nome: str, parametri: dict, model, compute) -> Response:
+    """
+    Pagina di `model` dalla cache `nome`, calcolata con `compute` (coroutine che restituisce
+    il dizionario di build_page) solo se manca. L'header X-Cache dice HIT, SHARED o MISS.
+    """
+    async def serializza():
+        pagina = await compute()
+        return Page[model].model_validate(pagina, from_attributes=True).model_dump_json().encode()
+
+    body, stato = await response_caches[nome].get_or_compute(cache_key(parametri), serializza)
+    return Response(body, media_type="application/json", headers={"X-Cache": stato})
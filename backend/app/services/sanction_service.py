@@ -1,13 +1,18 @@
+import asyncio
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
-import asyncio  # Necessario per l'invio parallelo
-# Aggiunto joinedload per efficienza
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session, joinedload
-from app.models.models import Sanction, StatoAccount, StateAccountType, Booking, BookingState, SlotType, Person, Venue, Calendar, Slot
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from app.models.models import Sanction, StatoAccount, StateAccountType, Booking, BookingState, SlotType, Person, Venue, Calendar, Slot, Band
+from app.core.deadlines import DeadlineQueue
+from app.core.jobs import job_runner
 from app.core.database import SessionLocal
-from app.services.notifier import send_ban_notification, send_reminder_notification, send_strike_notification,send_unban_notification
+from app.services.notifier import NotificationDigest
 from fastapi import Depends, HTTPException
-from app.api.routes.auth import get_db,get_current_user
+from app.api.routes.auth import get_token_claims
+from app.services.auth_context import invalidate_auth_context
+from app.services.tokens import TokenClaims, revoke_tokens
+from app.core.config import get_settings
 # funzione per calcolare la scadenza della prenotazione
 
 
@@ -24,192 +29,312 @@ def calculate_ban_duration(current_bans):
 # funzione per applicare il ban
 
 
-def apply_ban(db: Session, person_id: int):
+def apply_ban(db: Session, person_id: int, strike_residui: int = 0) -> tuple[datetime, int] | None:
+    """
+    Congela l'account e restituisce fine del ban e ban totali, compreso questo (None se mancano sanzione o stato).
+    Gli strike oltre la soglia (`strike_residui`) restano nel contatore per il ban successivo, al massimo SOGLIA_BAN - 1:
+    un contatore ancora alla soglia farebbe scattare di nuovo tr_check_ban_threshold (un secondo ban nello stesso istante).
+    Cache dei contesti e coda degli sblocchi si aggiornano dopo il commit, con ban_applied.
+    """
     # recupero il record
     sanction_record = db.query(Sanction).filter(
         Sanction.person_id == person_id).first()
-    # recupero lo stato dell'account
+    # recupero lo stato dell'account (il più recente: il trigger del ban ne aggiunge uno ogni volta)
     stato_account = db.query(StatoAccount).filter(
-        StatoAccount.person_id == person_id).first()
+        StatoAccount.person_id == person_id).order_by(StatoAccount.istante.desc(), StatoAccount.id.desc()).first()
 
     # se esistono entrambe aggiorno calcolo la scadenza e aumento il ban di 1
     if sanction_record and stato_account:
         numero_ban = sanction_record.numero_ban
         scadenza = calculate_ban_duration(numero_ban)
 
-        sanction_record.contatorestrike = 0  # type: ignore
+        sanction_record.contatorestrike = min(strike_residui, SOGLIA_BAN - 1)  # type: ignore
         sanction_record.numero_ban += 1  # type: ignore
         sanction_record.data_fine_ban = scadenza  # type: ignore
         stato_account.stato = StateAccountType.congelato  # type: ignore
         stato_account.istante = datetime.now()  # type: ignore
+        #i token di accesso emessi prima del ban non valgono più: il client deve rinnovarli
+        versione = db.scalar(
+            update(Person).where(Person.id == person_id).values(versione_stato=Person.versione_stato + 1)
+            .returning(Person.versione_stato).execution_options(synchronize_session=False)
+        )
+        revoke_tokens(db, person_id, versione) # type: ignore
+        return scadenza, sanction_record.numero_ban  # type: ignore
+    return None
 
-# funzione per il controllo delle prenotazioni
 
+def ban_applied(banditi: list[tuple[int, datetime]]):
+    #solo dopo il commit: prima una richiesta concorrente rimetterebbe in cache il contesto senza ban
+    for person_id, scadenza in banditi:
+        invalidate_auth_context(person_id)
+        unban_queue.schedule(person_id, scadenza)
 
-async def bookings_control(db: Session):
-    ora_attuale = datetime.now()
+# funzione per il controllo delle prenotazioni
 
-    # Carichiamo tutto l'albero delle relazioni in un'unica query
-    bookings_pendenti = db.query(Booking).options(
-        joinedload(Booking.slot_item)
-        .joinedload(Slot.calendar_item)
-        .joinedload(Calendar.venue_calendar)
-        .joinedload(Venue.direttore),
-        joinedload(Booking.bands_bookings)
-    ).filter(
-        Booking.stato_prenotazione == BookingState.pendente
+settings = get_settings()
+EXPIRY_CHUNK_SIZE = settings.expiry_chunk_size #prenotazioni pendenti elaborate per blocco
+GIORNI_RISPOSTA = 5 #giorni a disposizione del direttore per rispondere
+GIORNI_MINIMI_EVENTO = 4 #sotto questa distanza dall'evento la richiesta scade subito
+SOGLIA_BAN = 5
+
+
+def pending_bookings_query():
+    #solo le colonne necessarie, ordinate per direttore così i suoi strike finiscono nello stesso blocco
+    return (
+        select(Booking.id, Booking.data_creazione, Calendar.data, Venue.direttore_id,
+               Person.email, Person.nome, Band.nome.label("band_nome"))
+        .join(Slot, Slot.id == Booking.slot_id)
+        .join(Calendar, Calendar.id == Slot.calendar_id)
+        .join(Venue, Venue.id == Calendar.venue_id)
+        .join(Person, Person.id == Venue.direttore_id)
+        .outerjoin(Band, Band.id == Booking.band_id)
+        .filter(Booking.stato_prenotazione == BookingState.pendente)
+        .order_by(Venue.direttore_id, Booking.id)
+    )
+
+
+def director_chunks(partizioni):
+    """
+    Riunisce le partizioni del cursore in blocchi che finiscono sul cambio di direttore: le righe
+    di un direttore stanno tutte in un blocco, quindi le sue notifiche in una sola mail per esecuzione.
+    """
+    resto = []
+    for partizione in partizioni:
+        righe = resto + list(partizione)
+        #le righe arrivano ordinate per direttore: l'ultimo potrebbe continuare nella prossima partizione
+        taglio = len(righe)
+        while taglio and righe[taglio - 1].direttore_id == righe[-1].direttore_id:
+            taglio -= 1
+        if taglio:
+            yield righe[:taglio]
+        resto = righe[taglio:]
+    if resto:
+        yield resto
+
+
+def expire_chunk(db: Session, righe, ora_attuale: datetime, digest: NotificationDigest, banditi: list) -> dict:
+    """
+    Elabora un blocco di prenotazioni pendenti con poche istruzioni set-based:
+    scadenza delle prenotazioni e rilascio degli slot, strike sommati per direttore, promemoria.
+    I ban applicati finiscono in `banditi` come (person_id, scadenza).
+    """
+    oggi = ora_attuale.date()
+    da_scadere = []
+    direttori = {}
+    direttore_di = {}
+    for r in righe:
+        giorni_inattivita = (ora_attuale - r.data_creazione).days
+        giorni_alla_data = (r.data - oggi).days
+        direttori[r.direttore_id] = r
+        direttore_di[r.id] = r.direttore_id
+        # LOGICA DELLO STRIKE (Giorno 5 o urgenza evento)
+        if giorni_inattivita > GIORNI_RISPOSTA or giorni_alla_data < GIORNI_MINIMI_EVENTO:
+            da_scadere.append(r.id)
+        # LOGICA DEL PROMEMORIA
+        elif giorni_inattivita in [3, 4]:
+            digest.reminder(
+                email_to=r.email,
+                director_name=r.nome,
+                band_name=r.band_nome or "Artista",
+                data_evento=str(r.data),
+                giorni_rimanenti=GIORNI_RISPOSTA - giorni_inattivita
+            )
+
+    resoconto = {"scadute": 0, "strike": 0, "ban": 0}
+    if not da_scadere:
+        return resoconto
+
+    #la condizione sullo stato esclude le prenotazioni gestite nel frattempo dal direttore
+    scadute = db.execute(
+        update(Booking)
+        .where(Booking.id.in_(da_scadere), Booking.stato_prenotazione == BookingState.pendente)
+        .values(stato_prenotazione=BookingState.scaduta, ragione="Timeout risposta 5gg")
+        .returning(Booking.id, Booking.slot_id)
+        .execution_options(synchronize_session=False)
     ).all()
+    resoconto["scadute"] = len(scadute)
+    if not scadute:
+        return resoconto
+
+    db.execute(
+        update(Slot).where(Slot.id.in_([slot_id for _id, slot_id in scadute])).values(stato=SlotType.disponibile)
+        .execution_options(synchronize_session=False)
+    )
+
+    #uno strike per ogni prenotazione scaduta, sommati per direttore: un UPDATE per ogni incremento distinto
+    strike_per_direttore = Counter(direttore_di[booking_id] for booking_id, _slot_id in scadute)
+    per_incremento = defaultdict(list)
+    for direttore_id, n in strike_per_direttore.items():
+        per_incremento[n].append(direttore_id)
+
+    for incremento, direttori_ids in per_incremento.items():
+        sanzioni = db.execute(
+            update(Sanction)
+            .where(Sanction.person_id.in_(direttori_ids))
+            .values(contatorestrike=Sanction.contatorestrike + incremento)
+            .returning(Sanction.person_id, Sanction.contatorestrike, Sanction.numero_ban)
+            .execution_options(synchronize_session=False)
+        ).all()
+        for person_id, contatorestrike, numero_ban in sanzioni:
+            direttore = direttori[person_id]
+            resoconto["strike"] += incremento
+            # Controllo se scatta il BAN
+            if contatorestrike >= SOGLIA_BAN:
+                #strike sommati in blocco: quelli oltre la soglia non vanno persi con l'azzeramento
+                ban = apply_ban(db, person_id, contatorestrike - SOGLIA_BAN)
+                if ban:
+                    scadenza, numero_ban = ban
+                    banditi.append((person_id, scadenza))
+                    resoconto["ban"] += 1
+                    digest.ban(direttore.email, direttore.nome, numero_ban)
+            else:
+                digest.strike(direttore.email, direttore.nome, contatorestrike, numero_ban)
+    return resoconto
+
+
+def bookings_control(db: Session, banditi: list):
+    """
+    Scorre le prenotazioni pendenti con un cursore lato server (yield_per) su una connessione
+    dedicata alla lettura e le elabora a blocchi di circa EXPIRY_CHUNK_SIZE, chiusi sul cambio di direttore:
+    ogni blocco, con le sue mail nell'outbox, viene salvato da solo, quindi un errore annulla solo quel blocco.
+    Sincrona, da eseguire in un thread: i ban dei blocchi salvati si aggiungono a `banditi`.
+    """
+    ora_attuale = datetime.now()
+    totale = Counter()
+
+    with db.get_bind().connect() as lettura:
+        risultato = lettura.execution_options(yield_per=EXPIRY_CHUNK_SIZE).execute(pending_bookings_query())
+        for blocco in director_chunks(risultato.partitions()):
+            digest = NotificationDigest()
+            banditi_blocco = []
+            try:
+                resoconto = expire_chunk(db, blocco, ora_attuale, digest, banditi_blocco)
+                resoconto.update(digest.enqueue(db))
+                db.commit()
+                banditi.extend(banditi_blocco)
+                totale.update(resoconto)
+            except Exception as e:
+                db.rollback()
+                totale["errori"] += len(blocco)
+                print(f"Errore nel blocco di prenotazioni {blocco[0].id}-{blocco[-1].id}: {e}")
+            totale["elaborate"] += len(blocco)
+
+    print(f"Controllo prenotazioni: {totale['elaborate']} pendenti, {totale['scadute']} scadute, "
+          f"{totale['strike']} strike, {totale['ban']} ban, {totale['errori']} in errore; "
+          f"{totale['notifiche']} notifiche in {totale['destinatari']} mail ({totale['accorpate']} accorpate)")
+    return dict(totale)
 
-    tasks_notifiche = []  # Lista per raccogliere le mail da inviare in parallelo
-
-    # itero per ogni prenotazione pendente
-    for booking in bookings_pendenti:
-        try:
-            # Recupero dati e calcolo tempistiche
-            giorni_inattivita = (ora_attuale - booking.data_creazione).days
-            slot = booking.slot_item
-            calendario = slot.calendar_item
-            direttore = calendario.venue_calendar.direttore
-
-            # Calcolo giorni alla data dell'evento
-            data_evento = calendario.data
-            giorni_alla_data = (data_evento - ora_attuale.date()).days
-
-            # LOGICA DELLO STRIKE (Giorno 5 o urgenza evento)
-            if giorni_inattivita > 5 or giorni_alla_data < 4:
-                booking.stato_prenotazione = BookingState.scaduta  # type: ignore
-                slot.stato = SlotType.disponibile
-
-                sanction_record = db.query(Sanction).filter(
-                    Sanction.person_id == direttore.id).first()
-                if sanction_record:
-                    sanction_record.contatorestrike += 1  # type: ignore
-
-                    # Controllo se scatta il BAN
-                    if sanction_record.contatorestrike >= 5:  # type: ignore
-                        apply_ban(db, direttore.id)
-                        # Notifica Ban (aggiunta alla lista task)
-                        tasks_notifiche.append(send_ban_notification(
-                            direttore.email, direttore.nome, sanction_record.numero_ban))  # type: ignore
-                    else:
-                        # Notifica Strike semplice (aggiunta alla lista task)
-                        tasks_notifiche.append(send_strike_notification(
-                            direttore.email, direttore.nome, sanction_record.contatorestrike, sanction_record.numero_ban))  # type: ignore
-
-            # LOGICA DEL PROMEMORIA
-            elif giorni_inattivita in [3, 4]:
-                giorni_rimanenti = 5 - giorni_inattivita
-                # Recuperiamo il nome della band per rendere la mail specifica
-                band_name = booking.bands_bookings.nome if booking.bands_bookings else "Artista"
-
-                # Aggiungiamo il promemoria ai task
-                tasks_notifiche.append(send_reminder_notification(
-                    email_to=direttore.email,
-                    director_name=direttore.nome,
-                    band_name=band_name,
-                    data_evento=str(data_evento),
-                    giorni_rimanenti=giorni_rimanenti
-                ))
-
-        except Exception as e:
-            print(f"Errore prenotazione {booking.id}: {e}")
-            db.rollback()
-
-    # Salvataggio unico per tutte le prenotazioni elaborate
-    db.commit()
+# schedule dell'operazione booking_controls che verrà controllata ogni 24 ore
 
-    # Invio parallelo di tutte le notifiche raccolte
-    if tasks_notifiche:
-        await asyncio.gather(*tasks_notifiche)
 
-# schedule dell'operazione booking_controls che verrà controllata ogni 24 ore
+def _scheduled_control(banditi: list):
+    with SessionLocal() as db:
+        return bookings_control(db, banditi)
 
 
 async def run_scheduled_control():
-    db = SessionLocal()
+    #query e UPDATE sincroni in un thread: il ciclo di eventi del leader continua a servire richieste e heartbeat
+    banditi = []
     try:
-        await bookings_control(db)
+        return await asyncio.to_thread(_scheduled_control, banditi)
     finally:
-        db.close()
-
-scheduler = AsyncIOScheduler()
-scheduler.add_job(
-    run_scheduled_control,
-    'interval',
-    hours=24,
-    id='check_bookings_job',
-    replace_existing=True
-)
-scheduler.start()
+        #cache e coda degli sblocchi non sono thread-safe: si aggiornano qui, anche per i blocchi salvati prima di un errore
+        ban_applied(banditi)
+
+
+def ban_deadlines():
+    #ban ancora in corso, dall'indice parziale su data_fine_ban (ricostruzione della coda all'avvio)
+    with SessionLocal() as db:
+        return db.execute(
+            select(Sanction.data_fine_ban, Sanction.person_id)
+            .filter(Sanction.data_fine_ban != None)
+            .order_by(Sanction.data_fine_ban)
+        ).all()
+
+
+def check_unban(db: Session, person_ids=None) -> list[int]:
+    """
+    Riattiva gli account con il ban scaduto (solo tra `person_ids`, se indicati) e ne restituisce gli id.
+    La condizione su data_fine_ban è ricontrollata nell'UPDATE: un ban prolungato nel frattempo resta.
+    Sincrona, da eseguire in un thread.
+    """
+    ora_attuale = datetime.now()
+    query = (
+        update(Sanction)
+        .where(Sanction.data_fine_ban != None, Sanction.data_fine_ban <= ora_attuale)
+        .values(data_fine_ban=None)
+        .returning(Sanction.person_id)
+        .execution_options(synchronize_session=False)
+    )
+    if person_ids is not None:
+        query = query.where(Sanction.person_id.in_(person_ids))
 
+    try:
+        sbloccati = list(dict.fromkeys(db.scalars(query).all()))
+        if not sbloccati:
+            db.rollback()
+            return []
 
-async def check_unban(db: Session):
-    ora_attuale = datetime.now()
-    # 1. Recuperiamo i ban scaduti caricando subito i dati della persona
-    sanction_records = db.query(Sanction).options(
-        joinedload(Sanction.persona_sanzionata)
-    ).filter(
-        Sanction.data_fine_ban != None,
-        Sanction.data_fine_ban <= ora_attuale
-    ).all()
+        # 1. Riattiviamo gli account in un'unica istruzione (istante aggiornato: lo legge tokens.reload_revocations)
+        db.execute(
+            update(StatoAccount).where(StatoAccount.person_id.in_(sbloccati))
+            .values(stato=StateAccountType.attivo, istante=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
 
-    if not sanction_records:
-        return
+        # 2. Nuova versione dello stato: i token "congelati" vanno rinnovati
+        versioni = db.execute(
+            update(Person).where(Person.id.in_(sbloccati)).values(versione_stato=Person.versione_stato + 1)
+            .returning(Person.id, Person.versione_stato).execution_options(synchronize_session=False)
+        ).all()
+        for person_id, versione in versioni:
+            revoke_tokens(db, person_id, versione)
+
+        # 3. Prepariamo le notifiche di bentornato
+        digest = NotificationDigest()
+        for email, nome in db.execute(select(Person.email, Person.nome).filter(Person.id.in_(sbloccati))):
+            digest.unban(email, nome)
+
+        # 4. Le mail di bentornato partono dall'outbox dopo il commit
+        digest.enqueue(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return sbloccati
 
-    tasks_notifiche = []
 
-    for record in sanction_records:
-        try:
-            direttore = record.persona_sanzionata
-            stato = db.query(StatoAccount).filter(
-                StatoAccount.person_id == record.person_id).first()
+def _due_unbans(person_ids):
+    with SessionLocal() as db:
+        return check_unban(db, person_ids)
 
-            if stato:
-                record.data_fine_ban = None # type: ignore
-                stato.stato = StateAccountType.attivo # type: ignore
-                
-                # 2. Prepariamo la notifica di bentornato
-                tasks_notifiche.append(
-                    send_unban_notification(direttore.email, direttore.nome)
-                )
-        except Exception as e:
-            print(f"Errore durante lo sblocco di {record.person_id}: {e}")
 
-    try:
-        db.commit()
-        # 3. Inviamo tutte le mail insieme
-        if tasks_notifiche:
-            await asyncio.gather(*tasks_notifiche)
-    except Exception as e:
-        print(f"Errore nel salvataggio finale: {e}")
-        db.rollback()
-        
-async def run_scheduled_unban():
-    db = SessionLocal()
-    try:
-        await check_unban(db)
-    finally:
-        db.close()
-        
-        
-scheduler.add_job(
-    run_scheduled_unban,
-    'interval',
-    hours=1,
-    id='hourly_unban_check'
+async def run_due_unbans(person_ids):
+    sbloccati = await asyncio.to_thread(_due_unbans, person_ids)
+    #dopo il commit e sul ciclo di eventi, come per i ban (gli altri worker ricevono la NOTIFY delle revoche)
+    for person_id in sbloccati:
+        invalidate_auth_context(person_id)
+    return len(sbloccati)
+
+
+#ogni ban viene tolto all'orario esatto di data_fine_ban; la coda gira solo sul worker leader
+unban_queue = DeadlineQueue(
+    "unban",
+    carica=ban_deadlines,
+    scadute=lambda person_ids: job_runner.record("unban", lambda: run_due_unbans(person_ids), rilancia=True),
 )
 
-async def check_account_not_frozen(
-    db: Session = Depends(get_db),
-    current_user: Person = Depends(get_current_user)
-):
-    # Recuperiamo lo stato e la sanzione
-    stato_utente = db.query(StatoAccount).filter(StatoAccount.person_id == current_user.id).first()
-    sanction = db.query(Sanction).filter(Sanction.person_id == current_user.id).first()
-
-    # Se l'account è congelato, blocchiamo l'accesso
-    if stato_utente and stato_utente.stato == StateAccountType.congelato: # type: ignore
-        data_fine = sanction.data_fine_ban if sanction else "data da destinarsi"
+
+def register_jobs(runner=job_runner):
+    """Registra i job del runner; chiamata dal lifespan dell'app, i job girano solo sul worker leader."""
+    runner.add_job('check_bookings_job', run_scheduled_control, hours=24)
+    runner.add_task("unban_queue", unban_queue.run)
+
+
+async def check_account_not_frozen(claims: TokenClaims = Depends(get_token_claims)):
+    # Lo stato e la fine del ban arrivano dal token di accesso (revocato se lo stato cambia)
+    if claims.congelato:
+        data_fine = claims.data_fine_ban or "data da destinarsi"
         raise HTTPException(
             status_code= 403,
             detail=f"Accesso negato. Il tuo account è bloccato fino al {data_fine} per inattività nelle prenotazioni."
@@ -0,0 +1,120 @@
+import html
+import re
+from sqlalchemy import Integer, String, cast, false, func, literal, literal_column, null, or_, select, union_all
+from app.models.models import Band, Person, PersonType, pers_band
+from app.services.read_models import SearchRow
+from app.services.reference import ReferenceData
+
+#Le espressioni devono coincidere con quelle degli indici GIN creati da scripts/init_db.py
+TS_CONFIG = literal_column("'simple'::regconfig")
+NOME_COMPLETO = (Person.nome + literal_column("' '", String) + Person.cognome).self_group()
+
+
+def text_rank(q: str, colonna):
+    """
+    Restituisce (filtro, rank) per una colonna di testo.
+    Il filtro usa l'operatore di word similarity di pg_trgm (tollerante ai refusi)
+    oppure il match full-text; il rank somma i due punteggi.
+    """
+    tsquery = func.plainto_tsquery(TS_CONFIG, q)
+    tsvector = func.to_tsvector(TS_CONFIG, colonna)
+    filtro = or_(literal(q).op("<%")(colonna), tsvector.op("@@")(tsquery))
+    rank = func.word_similarity(q, colonna) + func.ts_rank(tsvector, tsquery)
+    return filtro, rank
+
+
+def highlight(testo: str, q: str | None) -> str:
+    """Evidenzia con <mark> le parole della ricerca presenti nel testo (già escapato in HTML)."""
+    if not testo:
+        return testo
+    testo = html.escape(testo)
+    if not q:
+        return testo
+    parole = [re.escape(html.escape(p)) for p in q.split() if p]
+    if not parole:
+        return testo
+    pattern = re.compile("(" + "|".join(parole) + ")", re.IGNORECASE)
+    return pattern.sub(r"<mark>\1</mark>", testo)
+
+
+def search_query(
+    riferimenti: ReferenceData,
+    q: str | None = None,
+    genere_id: int | None = None,
+    categoria: str | None = None,
+    citta: str | None = None,
+):
+    """
+    Ricerca unica su band e artisti solisti, ordinata per rilevanza.
+    Restituisce (query, order_by): order_by è crescente e univoco, adatto alla paginazione keyset.
+    Le città non entrano nella query: il filtro diventa un elenco di city_id dai dati di riferimento
+    e il nome si aggiunge in search_result.
+    """
+    city_ids = riferimenti.cities_matching(citta) if citta else None
+
+    # --- Band ---
+    filtro_band, rank_band = text_rank(q, Band.nome) if q else (None, literal(0.0))
+    query_band = select(
+        literal("band").label("tipo"),
+        Band.id.label("id"),
+        Band.nome.label("nome"),
+        Band.genere_id.label("genere_id"),
+        cast(Band.categoria, String).label("categoria"),
+        cast(null(), Integer).label("city_id"),
+        rank_band.label("rank"),
+    )
+    if filtro_band is not None:
+        query_band = query_band.filter(filtro_band)
+    if genere_id:
+        query_band = query_band.filter(Band.genere_id == genere_id)
+    if categoria:
+        query_band = query_band.filter(Band.categoria == categoria)
+    if citta:
+        #band con almeno un membro residente nella città
+        query_band = query_band.filter(Band.id.in_(
+            select(pers_band.band_id)
+            .join(Person, Person.id == pers_band.person_id)
+            .filter(Person.city_id.in_(city_ids)) # type: ignore
+        ))
+
+    # --- Artisti solisti ---
+    filtro_artisti, rank_artisti = text_rank(q, NOME_COMPLETO) if q else (None, literal(0.0))
+    query_artists = select(
+        literal("artista").label("tipo"),
+        Person.id.label("id"),
+        NOME_COMPLETO.label("nome"),
+        Person.genere_id.label("genere_id"),
+        cast(null(), String).label("categoria"),
+        Person.city_id.label("city_id"),
+        rank_artisti.label("rank"),
+    ).filter(Person.tipo_utente == PersonType.artista)
+    if filtro_artisti is not None:
+        query_artists = query_artists.filter(filtro_artisti)
+    if genere_id:
+        query_artists = query_artists.filter(Person.genere_id == genere_id)
+    if categoria:
+        query_artists = query_artists.filter(false()) #la categoria esiste solo per le band
+    if citta:
+        query_artists = query_artists.filter(Person.city_id.in_(city_ids)) # type: ignore
+
+    risultati = union_all(query_band, query_artists).subquery()
+    #rank decrescente espresso come -rank crescente, così l'ordinamento resta una tupla crescente
+    order_by = [-risultati.c.rank, risultati.c.nome, risultati.c.tipo, risultati.c.id]
+    return select(risultati), order_by
+
+
+def search_key(riga: SearchRow) -> tuple:
+    return (-riga.rank, riga.nome, riga.tipo, riga.id)
+
+
+def search_result(riga: SearchRow, q: str | None, riferimenti: ReferenceData) -> dict:
+    return {
+        "tipo": riga.tipo,
+        "id": riga.id,
+        "nome": riga.nome,
+        "nome_evidenziato": highlight(riga.nome, q),
+        "genere_id": riga.genere_id,
+        "categoria": riga.categoria,
+        "citta": riferimenti.city_name(riga.city_id),
+        "rank": float(riga.rank or 0),
+    }
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import secrets
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import jwt
+from fastapi import HTTPException
+from jwt import ExpiredSignatureError, PyJWTError
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import get_settings
+from app.core.database import AsyncSessionLocal
+from app.core.notify import pg_listener
+from app.models.models import Person, PersonType, RefreshToken, StateAccountType, StatoAccount
+from app.services.auth_context import AuthContext, invalidate_auth_context, load_auth_context
+
+# Token di accesso brevi (JWT) con ruolo, stato dell'account e versione dello stato: bastano per
+# autorizzare la richiesta senza interrogare il database. I refresh token sono opachi, salvati come
+# hash e ruotati a ogni uso. Quando lo stato di un account cambia (ban, sblocco) la sua versione
+# cresce e ogni worker mette i token più vecchi nell'insieme delle revoche (NOTIFY su REVOCHE_CHANNEL).
+
+settings = get_settings()
+ALGORITHM = "HS256"
+ACCESS_TOKEN_MINUTES = settings.access_token_minutes
+REFRESH_TOKEN_DAYS = settings.refresh_token_days
+REVOCHE_CHANNEL = "revoche_token"
+
+
+@dataclass(frozen=True, slots=True)
+class TokenClaims:
+    """Contenuto di un token di accesso valido."""
+    user_id: int
+    tipo_utente: PersonType | None
+    stato_account: StateAccountType | None
+    data_fine_ban: datetime | None
+    versione: int
+    scadenza: float = 0 #"exp" del token (timestamp): serve a chi tiene aperta una connessione oltre la richiesta
+
+    @property
+    def congelato(self) -> bool:
+        return self.stato_account == StateAccountType.congelato
+
+    def ancora_valido(self) -> bool:
+        """Per le connessioni lunghe (WebSocket): il token non è scaduto né revocato dopo essere stato letto."""
+        return time.time() < self.scadenza and not token_revocations.is_revoked(self.user_id, self.versione)
+
+
+class TokenRevocations:
+    """
+    user_id -> versione minima ancora valida, per processo.
+    Una voce serve solo finché esistono token emessi prima della revoca: dopo la durata
+    di un token di accesso viene dimenticata, quindi la memoria resta limitata agli account cambiati di recente.
+    """
+
+    def __init__(self, durata: float = ACCESS_TOKEN_MINUTES * 60):
+        self.durata = durata
+        self._minime: dict[int, tuple[int, float]] = {}
+
+    def __len__(self):
+        return len(self._minime)
+
+    def revoke(self, user_id: int, versione: int):
+        adesso = time.monotonic()
+        attuale = self._minime.get(user_id)
+        if attuale is None or versione >= attuale[0]:
+            #reinserisco la voce in fondo, così il dizionario resta in ordine di revoca
+            self._minime.pop(user_id, None)
+            self._minime[user_id] = (versione, adesso)
+        #le voci sono in ordine di inserimento: tolgo quelle scadute in testa
+        while self._minime:
+            vecchio, (_, istante) = next(iter(self._minime.items()))
+            if adesso - istante < self.durata:
+                break
+            del self._minime[vecchio]
+
+    def is_revoked(self, user_id: int, versione: int) -> bool:
+        voce = self._minime.get(user_id)
+        return voce is not None and versione < voce[0]
+
+    def on_notify(self, payload: str):
+        #arriva dopo il commit su ogni worker: anche il contesto in cache di questo processo è superato
+        evento = json.loads(payload)
+        self.revoke(evento["user_id"], evento["versione"])
+        invalidate_auth_context(evento["user_id"])
+
+
+token_revocations = TokenRevocations()
+pg_listener.add(REVOCHE_CHANNEL, token_revocations.on_notify)
+
+
+async def reload_revocations() -> int:
+    """
+    Rimette tra le revoche gli account il cui stato è cambiato negli ultimi ACCESS_TOKEN_MINUTES: le NOTIFY
+    arrivate prima dell'avvio o durante una riconnessione dell'ascolto sono perse. Restituisce gli account letti.
+    """
+    limite = datetime.now() - timedelta(minutes=ACCESS_TOKEN_MINUTES)
+    cambiati = select(StatoAccount.person_id).filter(StatoAccount.istante >= limite)
+    async with AsyncSessionLocal() as db:
+        righe = (await db.execute(
+            select(Person.id, Person.versione_stato).filter(Person.id.in_(cambiati), Person.versione_stato > 0)
+        )).all()
+    for user_id, versione in righe:
+        token_revocations.revoke(user_id, versione)
+        invalidate_auth_context(user_id)
+    return len(righe)
+
+
+#all'avvio (prima connessione dell'ascolto) e a ogni riconnessione
+pg_listener.on_connect(reload_revocations)
+
+
+def revoke_tokens(db: Session, user_id: int, versione: int):
+    """Revoca su tutti i worker i token di accesso con versione minore di `versione` (al commit di `db`)."""
+    if db.get_bind().dialect.name == "postgresql":
+        payload = json.dumps({"user_id": user_id, "versione": versione})
+        db.execute(select(func.pg_notify(REVOCHE_CHANNEL, payload)))
+    else:
+        #senza Postgres c'è un solo processo: revoca immediata
+        token_revocations.revoke(user_id, versione)
+
+
+#--- token di accesso ---
+
+def create_access_token(ctx: AuthContext) -> str:
+    adesso = datetime.now(timezone.utc)
+    payload = {
+        "sub": str(ctx.user_id),
+        "typ": "access",
+        "ruolo": ctx.tipo_utente.value if ctx.tipo_utente else None,
+        "stato": ctx.stato_account.value if ctx.stato_account else None,
+        "ver": ctx.versione,
+        "iat": adesso,
+        "exp": adesso + timedelta(minutes=ACCESS_TOKEN_MINUTES),
+    }
+    if ctx.data_fine_ban:
+        payload["fine_ban"] = ctx.data_fine_ban.isoformat()
+    return jwt.encode(payload, key=settings.secret_key, algorithm=ALGORITHM)
+
+
+def decode_access_token(token: str) -> TokenClaims:
+    try:
+        payload = jwt.decode(token, key=settings.secret_key, algorithms=[ALGORITHM])
+        if payload.get("typ") != "access":
+            raise ValueError("non è un token di accesso")
+        claims = TokenClaims(
+            user_id=int(payload["sub"]),
+            tipo_utente=PersonType(payload["ruolo"]) if payload.get("ruolo") else None,
+            stato_account=StateAccountType(payload["stato"]) if payload.get("stato") else None,
+            data_fine_ban=datetime.fromisoformat(payload["fine_ban"]) if payload.get("fine_ban") else None,
+            versione=int(payload["ver"]),
+            scadenza=float(payload["exp"]),
+        )
+    except ExpiredSignatureError:
+        # Errore specifico: il token ha superato la data "exp"
+        raise HTTPException(status_code=401, detail="Token scaduto, rinnova l'accesso")
+    except (PyJWTError, KeyError, ValueError):
+        # Errore specifico: il token è malformato o la firma non corrisponde
+        raise HTTPException(status_code=401, detail="Credenziali di autenticazione non valide")
+    if token_revocations.is_revoked(claims.user_id, claims.versione):
+        raise HTTPException(status_code=401, detail="Lo stato dell'account è cambiato, rinnova l'accesso")
+    return claims
+
+
+#--- refresh token ---
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def issue_tokens(db: AsyncSession, ctx: AuthContext, famiglia: str | None = None) -> dict:
+    """Nuova coppia di token; il refresh token viene salvato (come hash) nella `famiglia` indicata o in una nuova."""
+    refresh_token = secrets.token_urlsafe(32)
+    adesso = datetime.now()
+    db.add(RefreshToken(
+        token_hash=hash_token(refresh_token),
+        famiglia=famiglia or str(uuid.uuid4()),
+        person_id=ctx.user_id,
+        creato=adesso,
+        scadenza=adesso + timedelta(days=REFRESH_TOKEN_DAYS),
+        usato=False,
+    ))
+    await db.commit()
+    return {
+        "access_token": create_access_token(ctx),
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_MINUTES * 60,
+    }
+
+
+async def rotate_refresh_token(db: AsyncSession, refresh_token: str) -> dict:
+    """
+    Consuma il refresh token e ne emette uno nuovo nella stessa famiglia, con ruolo e stato letti dal database.
+    Un token già usato che viene ripresentato è stato copiato: l'intera famiglia viene revocata.
+    """
+    token_hash = hash_token(refresh_token)
+    riga = (await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == token_hash, RefreshToken.usato.is_(False),
+               RefreshToken.scadenza > datetime.now())
+        .values(usato=True)
+        .returning(RefreshToken.person_id, RefreshToken.famiglia)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if not riga:
+        famiglia = await db.scalar(
+            select(RefreshToken.famiglia).filter(RefreshToken.token_hash == token_hash, RefreshToken.usato.is_(True)))
+        if famiglia:
+            await db.execute(delete(RefreshToken).where(RefreshToken.famiglia == famiglia))
+            await db.commit()
+        raise HTTPException(status_code=401, detail="Sessione scaduta, effettua nuovamente il login")
+
+    ctx = await load_auth_context(db, riga.person_id)
+    if not ctx:
+        await db.rollback()
+        raise HTTPException(status_code=401, detail="Errore, utente non trovato")
+    return await issue_tokens(db, ctx, riga.famiglia)
+
+
+async def revoke_refresh_family(db: AsyncSession, refresh_token: str):
+    """Logout: elimina tutta la catena di rotazioni del refresh token."""
+    famiglia = select(RefreshToken.famiglia).filter(RefreshToken.token_hash == hash_token(refresh_token))
+    await db.execute(delete(RefreshToken).where(RefreshToken.famiglia.in_(famiglia.scalar_subquery())))
+    await db.commit()
+
+
+async def delete_expired_refresh_tokens() -> int:
+    #job periodico: i token usati restano fino alla scadenza per riconoscere i riutilizzi
+    async with AsyncSessionLocal() as db:
+        eliminati = (await db.execute(
+            delete(RefreshToken).where(RefreshToken.scadenza <= datetime.now())
+        )).rowcount # type: ignore
+        await db.commit()
+    return eliminati
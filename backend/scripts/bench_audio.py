@@ -0,0 +1,55 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import array
+import math
+import shutil
+import tempfile
+import time
+import wave
+from app.services.media import AUDIO_DIR, analyze_audio, file_path
+
+# Quello che il player deve scaricare per disegnare un brano: il file audio intero contro il JSON
+# con durata e picchi calcolato una volta al caricamento (analyze_audio, WAV letto senza soundfile).
+
+
+def scrivi_wav(percorso: str, secondi: int):
+    frequenza = 44100
+    onda = array.array("h", [int(20000 * math.sin(i / 20)) for i in range(frequenza * 2)]).tobytes()
+    with wave.open(percorso, "wb") as brano:
+        brano.setnchannels(2)
+        brano.setsampwidth(2)
+        brano.setframerate(frequenza)
+        for _ in range(secondi):
+            brano.writeframes(onda)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Picchi precalcolati contro il brano intero")
+    parser.add_argument("--secondi", type=int, default=180)
+    parser.add_argument("--punti", type=int, default=800)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="easygig_media_")
+    try:
+        nome_file = "0" * 64 + ".wav"
+        percorso = os.path.join(root, file_path(nome_file, AUDIO_DIR))
+        os.makedirs(os.path.dirname(percorso))
+        scrivi_wav(percorso, args.secondi)
+
+        print(f"--- BENCHMARK PICCHI: WAV stereo 16 bit da {args.secondi} s ---")
+        start = time.perf_counter()
+        picchi = analyze_audio(root, nome_file, args.punti)
+        print(f"calcolo al caricamento: {(time.perf_counter() - start) * 1000:8.1f} ms (una volta, nel pool)")
+        json_picchi = os.path.join(os.path.dirname(percorso), picchi) # type: ignore
+        print(f"brano intero:           {os.path.getsize(percorso) / (1024 * 1024):8.1f} MB")
+        print(f"durata e picchi:        {os.path.getsize(json_picchi) / 1024:8.1f} KB")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import statistics
+import time
+from app.models.models import PersonType, StateAccountType
+from app.services.auth_context import AuthContext, load_auth_context
+from app.services.tokens import TokenRevocations, create_access_token, decode_access_token, token_revocations
+
+# Costo dell'autorizzazione di una richiesta: verifica del token di accesso (firma, claim e insieme delle
+# revoche, tutto in memoria) contro la lettura del contesto dal database che serviva con il vecchio token.
+# Con --db misura anche load_auth_context su Postgres per --utente.
+
+
+def misura(funzione, ripetizioni: int) -> float:
+    start = time.perf_counter()
+    for _ in range(ripetizioni):
+        funzione()
+    return (time.perf_counter() - start) * 1_000_000 / ripetizioni
+
+
+async def misura_db(user_id: int, ripetizioni: int) -> list[float]:
+    from app.core.database import AsyncSessionLocal
+
+    tempi = []
+    async with AsyncSessionLocal() as db:
+        for _ in range(ripetizioni):
+            start = time.perf_counter()
+            await load_auth_context(db, user_id)
+            tempi.append((time.perf_counter() - start) * 1_000_000)
+    return tempi
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo della verifica dei token di accesso")
+    parser.add_argument("--ripetizioni", type=int, default=20000)
+    parser.add_argument("--revocati", type=int, default=10000, help="account nell'insieme delle revoche")
+    parser.add_argument("--db", action="store_true", help="misura anche la query del contesto su Postgres")
+    parser.add_argument("--utente", type=int, default=1)
+    args = parser.parse_args()
+
+    ctx = AuthContext(user_id=1, tipo_utente=PersonType.promoter, stato_account=StateAccountType.attivo,
+                      data_fine_ban=None, venue_ids=frozenset(), band_ids=frozenset(), versione=3)
+    token = create_access_token(ctx)
+
+    print(f"--- BENCHMARK TOKEN: {args.ripetizioni} verifiche, {args.revocati} account revocati ---")
+    for user_id in range(2, args.revocati + 2):
+        token_revocations.revoke(user_id, 1)
+    print(f"verifica token di accesso:  {misura(lambda: decode_access_token(token), args.ripetizioni):7.1f} us")
+
+    revoche = TokenRevocations()
+    for user_id in range(args.revocati):
+        revoche.revoke(user_id, 1)
+    controllo = misura(lambda: revoche.is_revoked(args.revocati // 2, 0), args.ripetizioni)
+    print(f"controllo delle revoche:    {controllo:7.3f} us")
+    inserimento = misura(lambda: revoche.revoke(args.revocati // 2, 2), args.ripetizioni)
+    print(f"revoca (con pulizia):       {inserimento:7.3f} us")
+
+    if args.db:
+        tempi = asyncio.run(misura_db(args.utente, min(args.ripetizioni, 1000)))
+        print(f"load_auth_context (Postgres): mediana {statistics.median(tempi):.1f} us, "
+              f"p99 {sorted(tempi)[int(len(tempi) * 0.99) - 1]:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
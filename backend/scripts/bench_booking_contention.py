@@ -0,0 +1,113 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+from datetime import date, datetime, time as ora, timedelta
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select, update
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.models import Band, Booking, BookingState, Calendar, Slot, SlotType, Venue
+from app.services.booking_service import STATI_ATTIVI, reserve_slot
+
+# Benchmark di contesa su POST /calendar/{slot_id} contro il Postgres configurato in .env.
+# "prima": SELECT della prenotazione attiva e poi INSERT (vecchia logica della route)
+# "dopo":  app.services.booking_service.reserve_slot (FOR UPDATE SKIP LOCKED + indice unico parziale)
+# Con l'indice unico parziale già creato la vecchia logica non produce più prenotazioni doppie
+# ma IntegrityError (un 500 per il client): il confronto resta utile su esiti e throughput.
+# Crea un calendario di prova sul primo locale, usa la prima band e al termine cancella tutto.
+
+
+async def prenota_prima(slot_id, band_id):
+    async with AsyncSessionLocal() as db:
+        slot = await db.get(Slot, slot_id)
+        active_booking = await db.scalar(select(Booking.id).filter(
+            Booking.slot_id == slot_id, Booking.stato_prenotazione.notin_(['rifiutata', 'annullata'])))
+        if not slot:
+            raise HTTPException(status_code=404)
+        if active_booking:
+            raise HTTPException(status_code=409)
+        db.add(Booking(slot_id=slot_id, band_id=band_id, stato_prenotazione=BookingState.pendente,
+                       scadenza=datetime.now() + timedelta(days=5), message="Richiesta di prenotazione"))
+        await db.commit()
+
+
+async def prenota_dopo(slot_id, band_id):
+    async with AsyncSessionLocal() as db:
+        await reserve_slot(db, slot_id, band_id)
+
+
+async def esegui(funzione, slot_ids, n_richieste, band_id):
+    async def una(i):
+        try:
+            await funzione(slot_ids[i % len(slot_ids)], band_id)
+            return "ok"
+        except HTTPException as error:
+            return str(error.status_code)
+        except Exception as error:
+            return type(error).__name__
+
+    start = time.perf_counter()
+    esiti = await asyncio.gather(*(una(i) for i in range(n_richieste)))
+    return Counter(esiti), time.perf_counter() - start
+
+
+async def prenotazioni_doppie(slot_ids):
+    async with AsyncSessionLocal() as db:
+        per_slot = (select(Booking.slot_id).filter(
+            Booking.slot_id.in_(slot_ids), Booking.stato_prenotazione.in_(STATI_ATTIVI))
+            .group_by(Booking.slot_id).having(func.count() > 1))
+        return await db.scalar(select(func.count()).select_from(per_slot.subquery()))
+
+
+async def reset(slot_ids):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Booking).filter(Booking.slot_id.in_(slot_ids)))
+        await db.execute(update(Slot).filter(Slot.id.in_(slot_ids)).values(stato=SlotType.disponibile))
+        await db.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Contesa sulla prenotazione degli slot")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--slots", type=int, default=200, help="slot per lo scenario a molti slot")
+    args = parser.parse_args()
+
+    async with AsyncSessionLocal() as db:
+        venue_id = await db.scalar(select(Venue.id).order_by(Venue.id).limit(1))
+        band_id = await db.scalar(select(Band.id).order_by(Band.id).limit(1))
+        if venue_id is None or band_id is None:
+            print("Servono almeno un locale e una band nel database")
+            return
+        calendar_id = await db.scalar(insert(Calendar).values(
+            data=date.today() + timedelta(days=365), data_inizio=ora(18), data_fine=ora(23),
+            slot_disponibili=args.slots, venue_id=venue_id).returning(Calendar.id))
+        slot_ids = list(await db.scalars(insert(Slot).returning(Slot.id), [
+            {"calendar_id": calendar_id, "orario_inizio": ora(18), "orario_fine": ora(19), "stato": SlotType.disponibile}
+            for _ in range(args.slots)]))
+        await db.commit()
+
+    try:
+        print(f"--- BENCHMARK CONTESA PRENOTAZIONI: {args.requests} richieste parallele ---")
+        for scenario, ids in [("uno slot", slot_ids[:1]), (f"{len(slot_ids)} slot", slot_ids)]:
+            for nome, funzione in [("prima", prenota_prima), ("dopo", prenota_dopo)]:
+                await reset(slot_ids)
+                esiti, elapsed = await esegui(funzione, ids, args.requests, band_id)
+                doppie = await prenotazioni_doppie(ids)
+                print(f"{scenario:10s} {nome:6s} {elapsed:6.2f}s {args.requests / elapsed:8.0f} req/s "
+                      f"esiti={dict(esiti)} slot con prenotazioni doppie={doppie}")
+    finally:
+        await reset(slot_ids)
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Slot).filter(Slot.calendar_id == calendar_id))
+            await db.execute(delete(Calendar).filter(Calendar.id == calendar_id))
+            await db.commit()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, time as ora, timedelta
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.models.models import (Base, Booking, BookingState, Calendar, City, Person, PersonType, Sanction, Slot, SlotType,
+                               StateAccountType, StatoAccount, Venue, VenueType)
+from app.services.sanction_service import EXPIRY_CHUNK_SIZE, bookings_control
+
+# Memoria e tempo del controllo delle prenotazioni scadute (sanction_service.bookings_control)
+# al crescere delle prenotazioni pendenti: il picco di memoria deve restare piatto.
+# Di default usa un file SQLite temporaneo in modalità WAL; con --url un database Postgres VUOTO di prova.
+
+
+def seed(engine, pendenti, direttori=200):
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(City), [{"id": 1, "nome": "Milano", "regione": "Lombardia", "nazione": "Italia"}])
+        conn.execute(insert(Person), [{
+            "id": d, "nome": f"Direttore{d}", "cognome": "Prova", "telefono": f"+39 333{d:07d}",
+            "email": f"direttore{d}@easygig.it", "tipo_utente": PersonType.direttoreArtistico,
+            "privacy_accettata": True, "city_id": 1,
+        } for d in range(1, direttori + 1)])
+        conn.execute(insert(Sanction), [{"person_id": d, "contatorestrike": 0, "numero_ban": 0,
+                                         "soglia_warning": 3, "soglia_ban": 5} for d in range(1, direttori + 1)])
+        conn.execute(insert(StatoAccount), [{"person_id": d, "stato": StateAccountType.attivo, "istante": datetime.now()}
+                                            for d in range(1, direttori + 1)])
+        conn.execute(insert(Venue), [{
+            "id": d, "nome": f"Locale {d}", "email": f"locale{d}@easygig.it", "telefono": f"+39 02{d:07d}",
+            "tipo_sala": VenueType.misto, "capienza": 200, "strumentazione": "Mixer", "city_id": 1, "direttore_id": d,
+        } for d in range(1, direttori + 1)])
+        conn.execute(insert(Calendar), [{
+            "id": d, "data": date.today() + timedelta(days=60), "data_inizio": ora(18), "data_fine": ora(23),
+            "slot_disponibili": pendenti // direttori + 1, "venue_id": d,
+        } for d in range(1, direttori + 1)])
+        adesso = datetime.now()
+        for inizio in range(1, pendenti + 1, 10000):
+            ids = range(inizio, min(inizio + 10000, pendenti + 1))
+            conn.execute(insert(Slot), [{"id": i, "calendar_id": i % direttori + 1, "orario_inizio": ora(18),
+                                         "orario_fine": ora(19), "stato": SlotType.inTrattativa} for i in ids])
+            #un terzo scade, un terzo riceve il promemoria, il resto non viene toccato
+            conn.execute(insert(Booking), [{"id": i, "slot_id": i, "message": "Richiesta di prenotazione",
+                                            "scadenza": adesso, "stato_prenotazione": BookingState.pendente,
+                                            "data_creazione": adesso - timedelta(days=(7, 3, 1)[i % 3])} for i in ids])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Controllo prenotazioni scadute a blocchi")
+    parser.add_argument("--pendenti", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--url", default=None)
+    args = parser.parse_args()
+
+    print(f"--- BENCHMARK SCADENZE: blocchi da {EXPIRY_CHUNK_SIZE} ---")
+    for pendenti in args.pendenti:
+        if args.url:
+            engine = create_engine(args.url)
+            Base.metadata.drop_all(engine)
+        else:
+            percorso = os.path.join(tempfile.mkdtemp(), "scadenze.db")
+            engine = create_engine(f"sqlite:///{percorso}")
+            with engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        seed(engine, pendenti)
+
+        with sessionmaker(bind=engine)() as db:
+            tracemalloc.start()
+            start = time.perf_counter()
+            resoconto = bookings_control(db, [])
+            elapsed = time.perf_counter() - start
+            _, picco = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        engine.dispose()
+        print(f"{pendenti:9d} pendenti: {elapsed:7.1f}s, picco {picco / 1024 / 1024:6.1f} MB, "
+              f"scadute {resoconto.get('scadute', 0)}, mail {resoconto.get('destinatari', 0)}")
+
+
+if __name__ == "__main__":
+    main()
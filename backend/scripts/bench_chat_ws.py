@@ -0,0 +1,113 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+# Test di carico della chat: apre migliaia di WebSocket inattivi sulla stessa chat, poi invia
+# messaggi e misura in quanto tempo arrivano a tutte le connessioni (fan-out via LISTEN/NOTIFY).
+# L'app deve essere già avviata (es. uvicorn app.main:app --workers 4); serve il pacchetto `websockets`
+# e un limite di file aperti adeguato (ulimit -n) sia per il server sia per questo script.
+# Con --pid (anche più di uno, uno per worker) riporta la memoria residente dei processi del server.
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for riga in f:
+            if riga.startswith("VmRSS:"):
+                return int(riga.split()[1]) / 1024
+    return 0.0
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Test di carico della chat via WebSocket")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000", help="indirizzo del server")
+    parser.add_argument("--chat", type=int, required=True, help="id di una chat di prova")
+    parser.add_argument("--token", required=True, help="JWT di un partecipante della chat")
+    parser.add_argument("--connessioni", type=int, default=5000)
+    parser.add_argument("--messaggi", type=int, default=20)
+    parser.add_argument("--lotto", type=int, default=200, help="connessioni aperte in parallelo")
+    parser.add_argument("--pid", type=int, nargs="*", default=[], help="pid dei worker del server")
+    args = parser.parse_args()
+
+    try:
+        import websockets
+    except ImportError:
+        sys.exit("Installare il pacchetto websockets (pip install websockets)")
+
+    indirizzo = f"{args.url}/chats/{args.chat}/ws?token={args.token}"
+    memoria_prima = {pid: rss_mb(pid) for pid in args.pid}
+
+    print(f"--- TEST DI CARICO CHAT: {args.connessioni} connessioni inattive, {args.messaggi} messaggi ---")
+    start = time.perf_counter()
+    connessioni = []
+    errori = 0
+    for inizio in range(0, args.connessioni, args.lotto):
+        n = min(args.lotto, args.connessioni - inizio)
+        esiti = await asyncio.gather(*(websockets.connect(indirizzo, max_queue=None) for _ in range(n)),
+                                     return_exceptions=True)
+        for esito in esiti:
+            if isinstance(esito, BaseException):
+                errori += 1
+            else:
+                connessioni.append(esito)
+    print(f"{len(connessioni)} connessioni aperte in {time.perf_counter() - start:.1f}s, {errori} fallite")
+    for pid in args.pid:
+        aumento = rss_mb(pid) - memoria_prima[pid]
+        print(f"   worker {pid}: +{aumento:.1f} MB ({aumento * 1024 / max(len(connessioni), 1):.1f} KB per connessione in media)")
+
+    #lascio le connessioni inattive per un po': il server non deve consumare CPU né connessioni al database
+    await asyncio.sleep(5)
+
+    mittente = connessioni[0]
+    ricevuti: dict[int, list[float]] = {}
+
+    async def ascolta(ws):
+        try:
+            async for testo in ws:
+                evento = json.loads(testo)
+                if evento.get("tipo") == "messaggio":
+                    ricevuti.setdefault(evento["id"], []).append(time.perf_counter())
+        except websockets.ConnectionClosed:
+            pass
+
+    ascoltatori = [asyncio.create_task(ascolta(ws)) for ws in connessioni]
+    latenze = []
+    for i in range(args.messaggi):
+        inviato = time.perf_counter()
+        await mittente.send(json.dumps({"tipo": "messaggio", "testo": f"Messaggio di prova {i}"}))
+        #aspetto che il messaggio arrivi a tutte le connessioni (o al massimo 10 secondi)
+        limite = inviato + 10
+        while time.perf_counter() < limite:
+            arrivi = [t for t in ricevuti.values() if t and t[0] >= inviato]
+            if arrivi and len(arrivi[-1]) >= len(connessioni):
+                break
+            await asyncio.sleep(0.01)
+        arrivi = [t for t in ricevuti.values() if t and t[0] >= inviato]
+        if arrivi:
+            tempi = arrivi[-1]
+            latenze.append(((tempi[len(tempi) // 2] - inviato) * 1000, (tempi[-1] - inviato) * 1000, len(tempi)))
+
+    for ws in connessioni:
+        await ws.close()
+    for task in ascoltatori:
+        task.cancel()
+
+    if latenze:
+        mediane = [l[0] for l in latenze]
+        ultime = [l[1] for l in latenze]
+        consegne = [l[2] for l in latenze]
+        print(f"fan-out: metà delle connessioni in {statistics.median(mediane):.1f} ms, "
+              f"tutte in {statistics.median(ultime):.1f} ms (peggiore {max(ultime):.1f} ms), "
+              f"consegne per messaggio min {min(consegne)}/{len(connessioni)}")
+    else:
+        print("Nessun messaggio ricevuto")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+from app.core.database import SQLALCHEMY_DATABSE_URL, AsyncSessionLocal, async_engine
+from app.models.models import Booking, Slot
+
+# Benchmark del layer database contro un Postgres locale.
+# "prima": engine sincrono con pool di default, query eseguite nel threadpool (40 thread come Starlette)
+# "dopo":  engine asyncpg con il pool configurato in app.core.database
+# Ogni richiesta ripete il pattern di lettura di POST /calendar/{slot_id}: slot + prenotazione attiva.
+
+
+def pick_slot_ids(Session, limit=500):
+    with Session() as db:
+        ids = db.scalars(select(Slot.id).limit(limit)).all()
+    return ids or [0]
+
+
+def sync_request(Session, slot_id):
+    with Session() as db:
+        db.get(Slot, slot_id)
+        db.scalar(select(Booking.id).filter(
+            Booking.slot_id == slot_id, Booking.stato_prenotazione.notin_(['rifiutata', 'annullata'])))
+
+
+async def async_request(slot_id):
+    async with AsyncSessionLocal() as db:
+        await db.get(Slot, slot_id)
+        await db.scalar(select(Booking.id).filter(
+            Booking.slot_id == slot_id, Booking.stato_prenotazione.notin_(['rifiutata', 'annullata'])))
+
+
+async def run_sync(n_requests, concurrency, slot_ids):
+    engine = create_engine(SQLALCHEMY_DATABSE_URL) #pool di default (5 + 10 overflow)
+    Session = sessionmaker(bind=engine)
+    executor = ThreadPoolExecutor(max_workers=40)
+    loop = asyncio.get_running_loop()
+    semaforo = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaforo:
+            await loop.run_in_executor(executor, sync_request, Session, slot_ids[i % len(slot_ids)])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    engine.dispose()
+    return elapsed
+
+
+async def run_async(n_requests, concurrency, slot_ids):
+    semaforo = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaforo:
+            await async_request(slot_ids[i % len(slot_ids)])
+
+    #riscaldamento del pool
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - start
+    await async_engine.dispose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark richieste/secondo: engine sincrono vs asyncpg")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    slot_ids = pick_slot_ids(sessionmaker(bind=create_engine(SQLALCHEMY_DATABSE_URL)))
+
+    print(f"--- BENCHMARK DB: {args.requests} richieste, concorrenza {args.concurrency} ---")
+    t_sync = asyncio.run(run_sync(args.requests, args.concurrency, slot_ids))
+    print(f"prima (sync + threadpool): {args.requests / t_sync:8.1f} req/s  ({t_sync:.2f}s)")
+    t_async = asyncio.run(run_async(args.requests, args.concurrency, slot_ids))
+    print(f"dopo  (asyncpg + pool):    {args.requests / t_async:8.1f} req/s  ({t_async:.2f}s)")
+    print(f"speedup: x{t_sync / t_async:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import statistics
+import time
+from app.services.geo import CityPoint, GeoIndex, distance_km
+
+# Ricerca per raggio: griglia spaziale dell'indice geografico contro il calcolo della distanza per ogni
+# locale (quello che farebbe una query con la formula dell'haversine riga per riga). Dati sintetici:
+# città sparse sul territorio italiano e locali distribuiti tra le città. Nessun database.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ricerca per raggio: griglia contro distanza per riga")
+    parser.add_argument("--citta", type=int, default=8000, help="circa i comuni italiani")
+    parser.add_argument("--locali", type=int, default=200000)
+    parser.add_argument("--raggio", type=float, default=50)
+    parser.add_argument("--ricerche", type=int, default=200)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    citta = [CityPoint(i, f"Citta{i}", f"Regione{i % 20}", "Italia",
+                       rnd.uniform(37.0, 46.5), rnd.uniform(7.0, 18.5)) for i in range(args.citta)]
+    locali = [(v, rnd.randrange(args.citta)) for v in range(args.locali)]
+    centri = [(rnd.uniform(38.0, 46.0), rnd.uniform(8.0, 17.0)) for _ in range(args.ricerche)]
+
+    print(f"--- BENCHMARK RAGGIO: {args.citta} città, {args.locali} locali, {args.raggio} km, {args.ricerche} ricerche ---")
+    start = time.perf_counter()
+    indice = GeoIndex(citta)
+    print(f"costruzione dell'indice: {(time.perf_counter() - start) * 1000:.1f} ms, {len(indice.griglia)} celle")
+
+    tempi_griglia, tempi_righe, trovati = [], [], []
+    for lat, lon in centri:
+        start = time.perf_counter()
+        vicine = indice.within(lat, lon, args.raggio)
+        #la query finale filtra i locali con Venue.city_id IN (...)
+        tempi_griglia.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        posizioni = indice.citta
+        per_riga = {v for v, c in locali
+                    if distance_km(lat, lon, posizioni[c].latitudine, posizioni[c].longitudine) <= args.raggio} # type: ignore
+        tempi_righe.append((time.perf_counter() - start) * 1000)
+
+        assert per_riga == {v for v, c in locali if c in vicine}
+        trovati.append(len(per_riga))
+
+    griglia = statistics.median(tempi_griglia)
+    righe = statistics.median(tempi_righe)
+    print(f"griglia:          mediana {griglia:8.3f} ms per ricerca")
+    print(f"distanza per riga: mediana {righe:8.1f} ms per ricerca (x{righe / griglia:.0f})")
+    print(f"locali trovati in media: {statistics.mean(trovati):.0f}")
+
+
+if __name__ == "__main__":
+    main()
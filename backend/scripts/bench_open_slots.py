@@ -0,0 +1,124 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app.core.pagination import DEFAULT_PAGE_SIZE, apply_keyset
+from app.models.models import Base, Calendar, City, Nation, Person, Region, Slot, Venue, VenueType
+from app.services.availability import open_slots_query
+
+# Latenza della ricerca degli slot liberi (GET /venues/availability) su un dataset sintetico
+# di circa un milione di slot. Serve un database Postgres VUOTO di prova (--url): le tabelle
+# vengono create con i loro indici e popolate con generate_series.
+# Obiettivo: p95 della prima pagina sotto TARGET_MS.
+
+TARGET_MS = 50
+REGIONI = ["Lombardia", "Piemonte", "Veneto", "Emilia-Romagna", "Toscana", "Lazio", "Campania", "Puglia", "Sicilia", "Sardegna"]
+INIZIO = date(2026, 1, 1)
+
+
+def seed(engine, venues, giorni, slot_per_giorno):
+    tabelle = [t.__table__ for t in (Nation, Region, City, Person, Venue, Calendar, Slot)]
+    Base.metadata.create_all(engine, tables=tabelle)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO nation (nome) VALUES ('Italia')"))
+        conn.execute(text("INSERT INTO region (nome, nazione) SELECT unnest(:regioni), 'Italia'"), {"regioni": REGIONI})
+        conn.execute(text("""
+            INSERT INTO city (id, nome, regione, nazione)
+            SELECT g, 'Città ' || g, (:regioni)[1 + g % cardinality(:regioni)], 'Italia'
+            FROM generate_series(1, 200) g
+        """), {"regioni": REGIONI})
+        conn.execute(text("""
+            INSERT INTO person (id, nome, cognome, telefono, email, tipo_utente, privacy_accettata, city_id)
+            SELECT g, 'Nome' || g, 'Cognome' || g, '+39 333' || lpad(g::text, 7, '0'), 'direttore' || g || '@easygig.it',
+                   'direttoreArtistico', true, 1 + g % 200
+            FROM generate_series(1, :n) g
+        """), {"n": venues})
+        conn.execute(text("""
+            INSERT INTO venue (id, nome, email, telefono, tipo_sala, capienza, strumentazione, city_id, direttore_id)
+            SELECT g, 'Locale ' || g, 'locale' || g || '@easygig.it', '+39 02' || lpad(g::text, 7, '0'),
+                   (:tipi)[1 + g % 4]::venuetype, 50 + (g * 37) % 950, 'Mixer, casse', 1 + (g * 7) % 200, g
+            FROM generate_series(1, :n) g
+        """), {"n": venues, "tipi": [t.value for t in VenueType]})
+        conn.execute(text("""
+            INSERT INTO calendar (venue_id, data, data_inizio, data_fine, slot_disponibili)
+            SELECT v, CAST(:inizio AS date) + d, '20:00', '23:30', :slot
+            FROM generate_series(1, :n) v, generate_series(0, :giorni - 1) d
+        """), {"n": venues, "giorni": giorni, "slot": slot_per_giorno, "inizio": INIZIO})
+        #circa un terzo degli slot risulta già occupato o in trattativa
+        conn.execute(text("""
+            INSERT INTO slot (calendar_id, orario_inizio, orario_fine, stato)
+            SELECT c.id, make_time(20 + s, 0, 0), make_time(20 + s, 45, 0),
+                   (ARRAY['disponibile', 'disponibile', 'occupato', 'inTrattativa'])[1 + (c.id + s) % 4]::slottype
+            FROM calendar c, generate_series(0, :slot - 1) s
+        """), {"slot": slot_per_giorno})
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def filtri_casuali(giorni):
+    dal = INIZIO + timedelta(days=random.randrange(giorni - 31))
+    filtri = {"dal": dal, "al": dal + timedelta(days=30)}
+    scelta = random.random()
+    if scelta < 0.3:
+        filtri["regione"] = random.choice(REGIONI)
+        filtri["giorni_settimana"] = [4]
+        filtri["capienza_min"] = 300
+    elif scelta < 0.6:
+        filtri["city_id"] = random.randint(1, 200)
+    elif scelta < 0.8:
+        filtri["tipo_sala"] = random.choice(list(VenueType))
+        filtri["capienza_min"] = 500
+    return filtri
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenza della ricerca degli slot liberi")
+    parser.add_argument("--url", required=True, help="database Postgres vuoto di prova")
+    parser.add_argument("--venues", type=int, default=2000)
+    parser.add_argument("--giorni", type=int, default=250)
+    parser.add_argument("--slot", type=int, default=2, help="slot per giorno di calendario")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--no-seed", action="store_true", help="riusa i dati già presenti")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    if not args.no_seed:
+        start = time.perf_counter()
+        seed(engine, args.venues, args.giorni, args.slot)
+        print(f"Dataset creato in {time.perf_counter() - start:.1f}s")
+
+    with Session(engine) as db:
+        totale = db.scalar(text("SELECT count(*) FROM slot"))
+        print(f"--- BENCHMARK SLOT LIBERI: {totale} slot, {args.queries} ricerche ---")
+
+        query, order_by = open_slots_query(**filtri_casuali(args.giorni))
+        piano = db.execute(text("EXPLAIN " + str(apply_keyset(query, order_by, None, DEFAULT_PAGE_SIZE).compile(
+            engine, compile_kwargs={"literal_binds": True})))).scalars().all()
+        print("Piano di esempio:")
+        for riga in piano:
+            print("   " + riga)
+
+        tempi = []
+        for _ in range(args.queries):
+            query, order_by = open_slots_query(**filtri_casuali(args.giorni))
+            start = time.perf_counter()
+            db.execute(apply_keyset(query, order_by, None, DEFAULT_PAGE_SIZE)).all()
+            tempi.append((time.perf_counter() - start) * 1000)
+
+    tempi.sort()
+    p50 = statistics.median(tempi)
+    p95 = tempi[int(len(tempi) * 0.95) - 1]
+    print(f"p50 {p50:.1f} ms | p95 {p95:.1f} ms | max {tempi[-1]:.1f} ms")
+    print(f"Obiettivo p95 < {TARGET_MS} ms: {'OK' if p95 < TARGET_MS else 'NON RAGGIUNTO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+from fastapi import FastAPI
+from app.services.passwords import PasswordHasher, pwd_context
+
+# Benchmark del login: latenza p50/p99 di una route qualsiasi mentre sono in corso molti login.
+# "prima": bcrypt eseguito nel threadpool delle route (route sincrone, come prima della migrazione)
+# "dopo":  bcrypt nel pool di processi limitato di app.services.passwords (route asincrone)
+# Non serve il database: il login è simulato con la sola verifica della password.
+
+
+def build_app_threadpool(password_hash):
+    app = FastAPI()
+
+    @app.post("/login")
+    def login():
+        return {"ok": pwd_context.verify("password-di-prova", password_hash)}
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    return app
+
+
+def build_app_processpool(password_hash, hasher):
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login():
+        valida, _ = await hasher.verify("password-di-prova", password_hash)
+        return {"ok": valida}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def percentile(valori, p):
+    valori = sorted(valori)
+    indice = min(len(valori) - 1, int(round(p / 100 * (len(valori) - 1))))
+    return valori[indice]
+
+
+async def run(app, logins_in_volo, n_ping, durata_login):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        stop = asyncio.Event()
+        completati = 0
+        rifiutati = 0
+
+        async def login_loop():
+            nonlocal completati, rifiutati
+            while not stop.is_set():
+                risposta = await client.post("/login")
+                if risposta.status_code == 503:
+                    rifiutati += 1
+                    await asyncio.sleep(0.01)
+                else:
+                    completati += 1
+
+        workers = [asyncio.create_task(login_loop()) for _ in range(logins_in_volo)]
+        await asyncio.sleep(0.5) #lascio partire i login
+
+        #ping a intervalli regolari fino allo scadere della durata (in caso di starvation se ne completano meno)
+        latenze = []
+        start = time.perf_counter()
+        while len(latenze) < n_ping and time.perf_counter() - start < durata_login:
+            t0 = time.perf_counter()
+            await client.get("/ping")
+            latenze.append((time.perf_counter() - t0) * 1000)
+            await asyncio.sleep(durata_login / n_ping)
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        await asyncio.gather(*workers)
+
+    return {
+        "p50": statistics.median(latenze),
+        "p99": percentile(latenze, 99),
+        "login_s": completati / (elapsed + 0.5),
+        "rifiutati": rifiutati,
+        "ping": len(latenze),
+    }
+
+
+def report(nome, r):
+    print(f"{nome:28s} ping p50 {r['p50']:8.2f} ms | p99 {r['p99']:8.2f} ms | "
+          f"login/s {r['login_s']:7.1f} | 503 {r['rifiutati']} | ping completati {r['ping']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenza delle altre route durante una raffica di login")
+    parser.add_argument("--logins", type=int, default=100, help="login concorrenti in volo")
+    parser.add_argument("--pings", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--queue-limit", type=int, default=64)
+    args = parser.parse_args()
+
+    password_hash = pwd_context.hash("password-di-prova")
+    print(f"--- BENCHMARK LOGIN: {args.logins} login in volo, {args.pings} ping in {args.seconds}s ---")
+
+    report("prima (threadpool)", asyncio.run(
+        run(build_app_threadpool(password_hash), args.logins, args.pings, args.seconds)))
+
+    hasher = PasswordHasher(workers=args.workers, max_pending=args.queue_limit)
+    try:
+        report("dopo (pool di processi)", asyncio.run(
+            run(build_app_processpool(password_hash, hasher), args.logins, args.pings, args.seconds)))
+    finally:
+        hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
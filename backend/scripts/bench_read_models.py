@@ -0,0 +1,123 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+import tracemalloc
+from datetime import date, time as ora
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session, joinedload
+from app.models.models import Base, BookingOrganization, Calendar, City, OrganizationType, Person, PersonType, Venue, VenueType
+from app.services.read_models import CALENDARS, USERS, VENUES
+
+# Confronto numero di query / memoria allocata / tempo per le liste di utenti, locali e calendari:
+# entità ORM (con lazy load per riga, come la vecchia GET /users, o con joinedload) contro le proiezioni
+# di app.services.read_models. Di default usa un database SQLite in memoria popolato con dati sintetici;
+# con --url si può puntare a un database Postgres VUOTO di prova (le tabelle vengono create e popolate).
+
+
+def seed(engine, n):
+    tabelle = [t.__table__ for t in (City, BookingOrganization, Person, Venue, Calendar)]
+    Base.metadata.create_all(engine, tables=tabelle)
+    with Session(engine) as db:
+        db.add_all([City(id=i, nome=f"Città {i}", regione="Lombardia", nazione="Italia") for i in range(1, 201)])
+        db.add_all([BookingOrganization(id=i, nome=f"Agenzia {i}", tipo_booking=OrganizationType.agenzia) for i in range(1, 101)])
+        db.flush()
+        db.add_all([Person(
+            id=i, nome=f"Nome{i}", cognome=f"Cognome{i}", telefono=f"+39 333{i:07d}", email=f"utente{i}@easygig.it",
+            tipo_utente=PersonType.promoter, privacy_accettata=True, city_id=(i % 200) + 1,
+            organization_id=(i % 100) + 1 if i % 3 else None,
+        ) for i in range(1, n + 1)])
+        db.flush()
+        db.add_all([Venue(
+            id=i, nome=f"Locale {i}", email=f"locale{i}@easygig.it", telefono=f"+39 02{i:07d}",
+            tipo_sala=VenueType.misto, capienza=100 + i % 500, strumentazione="Mixer, casse", city_id=(i % 200) + 1,
+            direttore_id=i,
+        ) for i in range(1, n + 1)])
+        db.add_all([Calendar(
+            id=i, data=date(2026, 1 + i % 12, 1 + i % 28), data_inizio=ora(20), data_fine=ora(23, 30),
+            slot_disponibili=3, venue_id=(i % n) + 1,
+        ) for i in range(1, n + 1)])
+        db.commit()
+
+
+def misura(engine, funzione):
+    query_eseguite = 0
+
+    def conta(*_args):
+        nonlocal query_eseguite
+        query_eseguite += 1
+
+    event.listen(engine, "before_cursor_execute", conta)
+    with Session(engine) as db:
+        tracemalloc.start()
+        start = time.perf_counter()
+        righe = funzione(db)
+        elapsed = time.perf_counter() - start
+        _, picco = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    event.remove(engine, "before_cursor_execute", conta)
+    return len(righe), query_eseguite, picco / 1024 / 1024, elapsed * 1000
+
+
+#--- percorsi a confronto ---
+
+def users_lazy(db):
+    #vecchia GET /users: città e organizzazione caricate in lazy load riga per riga (N+1)
+    return [(u.id, f"{u.nome} {u.cognome}", u.city.nome, u.organization.nome if u.organization else "Nessuna", u.tipo_utente)
+            for u in db.scalars(select(Person)).all()]
+
+
+def users_joined(db):
+    return [(u.id, f"{u.nome} {u.cognome}", u.city.nome, u.organization.nome if u.organization else "Nessuna", u.tipo_utente)
+            for u in db.scalars(select(Person).options(joinedload(Person.city), joinedload(Person.organization))).all()]
+
+
+def users_projection(db):
+    return USERS.build_all(db.execute(USERS.select()).all())
+
+
+def venues_orm(db):
+    return db.scalars(select(Venue)).all()
+
+
+def venues_projection(db):
+    return VENUES.build_all(db.execute(VENUES.select()).all())
+
+
+def calendars_orm(db):
+    return db.scalars(select(Calendar)).all()
+
+
+def calendars_projection(db):
+    return CALENDARS.build_all(db.execute(CALENDARS.select()).all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ORM vs proiezioni sulle liste")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--url", default="sqlite://")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    seed(engine, args.rows)
+
+    print(f"--- BENCHMARK READ MODEL: {args.rows} righe ---")
+    print(f"{'percorso':28s} {'righe':>7s} {'query':>7s} {'picco MB':>9s} {'ms':>9s}")
+    for nome, funzione in [
+        ("users ORM lazy (prima)", users_lazy),
+        ("users ORM joinedload", users_joined),
+        ("users proiezione", users_projection),
+        ("venues ORM", venues_orm),
+        ("venues proiezione", venues_projection),
+        ("calendars ORM", calendars_orm),
+        ("calendars proiezione", calendars_projection),
+    ]:
+        righe, query_eseguite, picco, ms = misura(engine, funzione)
+        print(f"{nome:28s} {righe:7d} {query_eseguite:7d} {picco:9.2f} {ms:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import time
+from pydantic import TypeAdapter
+from app.core.conditional import etag_matches
+from app.schemas.schemas import CityRead
+from app.services.geo import CityPoint
+from app.services.reference import ReferenceData
+
+# Costo di una richiesta a /reference/cities senza contare la query: serializzazione delle righe
+# a ogni richiesta (quello che farebbe un endpoint senza cache) contro il corpo già pronto nella cache
+# e contro la risposta 304 quando il client ripresenta l'ETag. Dati sintetici, nessun database.
+
+
+def misura(funzione, ripetizioni: int) -> float:
+    start = time.perf_counter()
+    for _ in range(ripetizioni):
+        funzione()
+    return (time.perf_counter() - start) * 1_000_000 / ripetizioni
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo degli endpoint dei dati di riferimento")
+    parser.add_argument("--citta", type=int, default=8000, help="circa i comuni italiani")
+    parser.add_argument("--ripetizioni", type=int, default=200)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    citta = [CityPoint(i, f"Citta{i}", f"Regione{i % 20}", "Italia", rnd.uniform(37, 46.5), rnd.uniform(7, 18.5))
+             for i in range(args.citta)]
+    regioni = sorted({(c.regione, c.nazione) for c in citta})
+
+    start = time.perf_counter()
+    dati = ReferenceData([(1, "Rock"), (2, "Jazz")], ["Italia"], regioni, citta)
+    print(f"--- BENCHMARK DATI DI RIFERIMENTO: {args.citta} città ---")
+    print(f"costruzione dell'istantanea: {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"{len(dati.sezioni['citta'].body) / 1024:.0f} KiB di città")
+
+    adapter = TypeAdapter(list[CityRead])
+
+    def serializza():
+        #senza cache: righe -> modelli Pydantic -> JSON a ogni richiesta
+        return adapter.dump_json([CityRead(id=c.id, nome=c.nome, regione=c.regione, nazione=c.nazione,
+                                           latitudine=c.latitudine, longitudine=c.longitudine) for c in citta])
+
+    sezione = dati.sezioni["citta"]
+    print(f"serializzazione per richiesta: {misura(serializza, args.ripetizioni) / 1000:8.2f} ms")
+    print(f"corpo dalla cache:             {misura(lambda: dati.sezioni['citta'].body, args.ripetizioni * 100):8.3f} us")
+    print(f"controllo If-None-Match (304): {misura(lambda: etag_matches(sezione.etag, sezione.etag), args.ripetizioni * 100):8.3f} us")
+    print(f"filtro città dalla cache:      {misura(lambda: dati.cities_matching('citta12'), args.ripetizioni):8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import statistics
+import time
+from sqlalchemy import create_engine, text
+from app.models.models import Base
+from scripts.init_db import REPUTAZIONE_SQL
+
+# Costo di una scrittura di voto (INSERT su score con il trigger della reputazione) al crescere
+# delle recensioni già ricevute dal destinatario.
+# "prima": il vecchio trigger che ricalcola AVG(voto) su tutti i voti del destinatario
+# "dopo":  il trigger con i contatori somma_voti/numero_voti (REPUTAZIONE_SQL di init_db)
+# Serve un database Postgres VUOTO di prova (--url).
+
+TRIGGER_PRIMA = """
+    CREATE OR REPLACE FUNCTION aggiorna_reputazione() RETURNS TRIGGER AS $$
+    DECLARE v_destinatario_id INTEGER; v_nuova_media DECIMAL(3, 2);
+    BEGIN
+        IF (TG_OP = 'DELETE') THEN
+            SELECT destinatario_id INTO v_destinatario_id FROM review WHERE id = OLD.review_id;
+        ELSE
+            SELECT destinatario_id INTO v_destinatario_id FROM review WHERE id = NEW.review_id;
+        END IF;
+        SELECT COALESCE(AVG(s.voto), 0) INTO v_nuova_media
+        FROM score s JOIN review r ON s.review_id = r.id
+        WHERE r.destinatario_id = v_destinatario_id;
+        UPDATE person SET reputazione = v_nuova_media WHERE id = v_destinatario_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS tr_aggiorna_reputazione ON score;
+    CREATE TRIGGER tr_aggiorna_reputazione AFTER INSERT OR UPDATE OR DELETE ON score FOR EACH ROW EXECUTE FUNCTION aggiorna_reputazione();
+"""
+
+
+def seed(engine, recensioni, scritture):
+    """Il destinatario (persona 2) ha già `recensioni` voti; altre `scritture` recensioni aspettano il voto."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    totale = recensioni + scritture
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO city (id, nome, regione, nazione) VALUES (1, 'Milano', 'Lombardia', 'Italia')"))
+        conn.execute(text("""
+            INSERT INTO person (id, nome, cognome, telefono, email, tipo_utente, privacy_accettata, city_id)
+            VALUES (1, 'Promoter', 'Prova', '+39 3330000001', 'promoter@easygig.it', 'promoter', true, 1),
+                   (2, 'Direttore', 'Prova', '+39 3330000002', 'direttore@easygig.it', 'direttoreArtistico', true, 1)
+        """))
+        conn.execute(text("""
+            INSERT INTO venue (id, nome, email, telefono, tipo_sala, capienza, strumentazione, city_id, direttore_id)
+            VALUES (1, 'Locale', 'locale@easygig.it', '+39 020000001', 'misto', 200, 'Mixer', 1, 2)
+        """))
+        conn.execute(text("""
+            INSERT INTO calendar (id, venue_id, data, data_inizio, data_fine, slot_disponibili)
+            VALUES (1, 1, '2026-01-01', '20:00', '23:30', 1)
+        """))
+        conn.execute(text("INSERT INTO slot (id, calendar_id, orario_inizio, orario_fine, stato) VALUES (1, 1, '20:00', '21:00', 'occupato')"))
+        conn.execute(text("""
+            INSERT INTO booking (id, data_creazione, message, scadenza, stato_prenotazione, iniziato_da, slot_id, promoter_id)
+            SELECT g, now(), 'Richiesta', now(), 'rifiutata', 'promoter', 1, 1 FROM generate_series(1, :n) g
+        """), {"n": totale})
+        conn.execute(text("""
+            INSERT INTO review (id, data_creazione, description, autore_id, destinatario_id, booking_id)
+            SELECT g, now(), 'Recensione', 1, 2, g FROM generate_series(1, :n) g
+        """), {"n": totale})
+        #i voti già presenti entrano senza trigger; i contatori partono allineati
+        conn.execute(text("INSERT INTO score (data_creazione, voto, review_id) SELECT now(), g % 6, g FROM generate_series(1, :n) g"),
+                     {"n": recensioni})
+        conn.execute(text("""
+            UPDATE person SET somma_voti = (SELECT COALESCE(SUM(voto), 0) FROM score),
+                              numero_voti = (SELECT count(*) FROM score) WHERE id = 2
+        """))
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def misura(engine, trigger_sql, recensioni, scritture):
+    seed(engine, recensioni, scritture)
+    with engine.begin() as conn:
+        conn.execute(text(trigger_sql))
+    tempi = []
+    with engine.connect() as conn:
+        for review_id in range(recensioni + 1, recensioni + scritture + 1):
+            start = time.perf_counter()
+            conn.execute(text("INSERT INTO score (data_creazione, voto, review_id) VALUES (now(), 4, :r)"), {"r": review_id})
+            conn.commit()
+            tempi.append((time.perf_counter() - start) * 1000)
+        reputazione = conn.scalar(text("SELECT reputazione FROM person WHERE id = 2"))
+    return statistics.median(tempi), reputazione
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo di scrittura dei voti al crescere delle recensioni")
+    parser.add_argument("--url", required=True, help="database Postgres vuoto di prova")
+    parser.add_argument("--recensioni", type=int, nargs="+", default=[100, 10000, 100000, 1000000])
+    parser.add_argument("--scritture", type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    print(f"--- BENCHMARK REPUTAZIONE: {args.scritture} voti scritti, mediana per scrittura ---")
+    for recensioni in args.recensioni:
+        prima, rep_prima = misura(engine, TRIGGER_PRIMA, recensioni, args.scritture)
+        dopo, rep_dopo = misura(engine, REPUTAZIONE_SQL, recensioni, args.scritture)
+        print(f"{recensioni:9d} recensioni: prima {prima:7.2f} ms | dopo {dopo:5.2f} ms | "
+              f"reputazione {rep_prima} / {rep_dopo}")
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
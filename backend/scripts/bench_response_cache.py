@@ -0,0 +1,53 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import time
+from app.core.cache import SingleFlightCache
+
+# Raffica di richieste identiche su una ricerca pubblica: senza cache ognuna rifà la query,
+# con la cache a volo singolo la prima calcola e le altre aspettano il suo risultato.
+# La query è simulata con una pausa di --query-ms (nessun database).
+
+
+async def raffica(richieste: int, query_ms: float, cache: SingleFlightCache | None) -> tuple[float, int]:
+    calcoli = 0
+
+    async def calcola():
+        nonlocal calcoli
+        calcoli += 1
+        await asyncio.sleep(query_ms / 1000)
+        return b'{"items":[],"next_cursor":null}'
+
+    async def richiesta():
+        if cache is None:
+            return await calcola()
+        return (await cache.get_or_compute(("nome", "rock"), calcola))[0]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(richiesta() for _ in range(richieste)))
+    return (time.perf_counter() - start) * 1000, calcoli
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache delle risposte con richieste concorrenti")
+    parser.add_argument("--richieste", type=int, default=500)
+    parser.add_argument("--query-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    print(f"--- BENCHMARK CACHE RISPOSTE: {args.richieste} richieste identiche, query da {args.query_ms} ms ---")
+    tempo, calcoli = asyncio.run(raffica(args.richieste, args.query_ms, None))
+    print(f"senza cache:        {tempo:8.1f} ms, {calcoli} query")
+    cache = SingleFlightCache()
+    tempo, calcoli = asyncio.run(raffica(args.richieste, args.query_ms, cache))
+    print(f"con cache (fredda): {tempo:8.1f} ms, {calcoli} query, {cache.condivise} richieste condivise")
+    tempo, calcoli = asyncio.run(raffica(args.richieste, args.query_ms, cache))
+    print(f"con cache (calda):  {tempo:8.1f} ms, {calcoli} query")
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
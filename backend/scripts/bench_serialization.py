@@ -0,0 +1,123 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import statistics
+import time
+from datetime import date, datetime, time as ora, timedelta
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from app.core.pagination import build_page
+from app.models.models import Booking, BookingState, Person, PersonType, VenueType
+from app.schemas.schemas import BookingRead, OpenSlotRead, Page, UserListItem, UserRead
+from app.services.read_models import OpenSlotRow, UserRow
+
+# Costo di serializzazione delle risposte per endpoint, su payload grandi e senza database.
+# "prima": jsonable_encoder + json.dumps, il percorso di FastAPI quando la route non dichiara un response_model
+# "orjson": jsonable_encoder + orjson (quello che faceva ORJSONResponse), se orjson è installato
+# "dopo":  validazione e dump_json del response_model, il percorso veloce di FastAPI (pydantic-core)
+# Con --max-us-per-riga lo script termina con errore se "dopo" supera la soglia: utile per le regressioni.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def users(n):
+    return build_page([UserRow(i, f"Nome{i} Cognome{i}", "Milano", "EasyGIG Booking", PersonType.promoter)
+                       for i in range(n)], lambda u: (u.id,), n)
+
+
+def my_bookings(n):
+    adesso = datetime(2026, 5, 1, 18, 30)
+    return build_page([Booking(id=i, data_creazione=adesso, message="Richiesta di prenotazione per la serata",
+                               scadenza=adesso + timedelta(days=5), stato_prenotazione=BookingState.pendente,
+                               iniziato_da=PersonType.artista, band_id=i % 50, slot_id=i, promoter_id=None)
+                       for i in range(n)], lambda b: (b.id,), n)
+
+
+def availability(n):
+    return build_page([OpenSlotRow(i, ora(20), ora(21), i // 2, date(2026, 6, 1) + timedelta(days=i % 90), i % 300,
+                                   f"Locale {i % 300}", VenueType.platea, 150, i % 200, "Milano", "Lombardia")
+                       for i in range(n)], lambda s: (s.data, s.orario_inizio, s.slot_id), n)
+
+
+def profiles(n):
+    #GET /me e PUT /artists/me: un utente per risposta, qui misurato su n risposte
+    return [Person(id=i, nome=f"Nome{i}", cognome="Cognome", email=f"utente{i}@easygig.it", telefono=f"+39 333{i:07d}",
+                   tipo_utente=PersonType.artista, password_hash="$2b$12$" + "x" * 53, link_streaming=None,
+                   file_path=None, reputazione=Decimal("4.25"), privacy_accettata=True, city_id=1)
+            for i in range(n)]
+
+
+ENDPOINTS = [
+    ("GET /users", users, Page[UserListItem], False),
+    ("GET /bookings/my-bookings", my_bookings, Page[BookingRead], False),
+    ("GET /venues/availability", availability, Page[OpenSlotRead], False),
+    ("GET /me", profiles, UserRead, True),
+]
+
+
+def misura(funzione, ripetizioni):
+    tempi = []
+    for _ in range(ripetizioni):
+        start = time.perf_counter()
+        funzione()
+        tempi.append(time.perf_counter() - start)
+    return statistics.median(tempi) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo di serializzazione delle risposte per endpoint")
+    parser.add_argument("--righe", type=int, default=10000, help="elementi per payload")
+    parser.add_argument("--ripetizioni", type=int, default=5)
+    parser.add_argument("--max-us-per-riga", type=float, default=None, help="soglia per 'dopo' in microsecondi per riga")
+    args = parser.parse_args()
+
+    print(f"--- BENCHMARK SERIALIZZAZIONE: {args.righe} righe per payload, mediana di {args.ripetizioni} ---")
+    superate = []
+    for nome, costruisci, modello, singoli in ENDPOINTS:
+        payload = costruisci(args.righe)
+        adapter = TypeAdapter(modello)
+
+        #le risposte di un solo oggetto vengono serializzate una per volta, come farebbe la route
+        elementi = payload if singoli else [payload]
+
+        def prima():
+            for elemento in elementi:
+                json.dumps(jsonable_encoder(elemento)).encode()
+
+        def con_orjson():
+            for elemento in elementi:
+                orjson.dumps(jsonable_encoder(elemento)) # type: ignore
+
+        def dopo():
+            for elemento in elementi:
+                adapter.dump_json(adapter.validate_python(elemento, from_attributes=True))
+
+        t_prima = misura(prima, args.ripetizioni)
+        t_orjson = misura(con_orjson, args.ripetizioni) if orjson else None
+        t_dopo = misura(dopo, args.ripetizioni)
+        per_riga = t_dopo * 1000 / args.righe
+        orjson_testo = f"orjson {t_orjson:8.1f} ms | " if t_orjson is not None else ""
+        print(f"{nome:28s} prima {t_prima:8.1f} ms | {orjson_testo}dopo {t_dopo:7.1f} ms "
+              f"({per_riga:.2f} us/riga, x{t_prima / t_dopo:.1f})")
+        if args.max_us_per_riga is not None and per_riga > args.max_us_per_riga:
+            superate.append(nome)
+
+    #il response_model esclude i campi interni: nessuna risposta deve contenere password_hash
+    profilo = profiles(1)[0]
+    assert "password_hash" in json.dumps(jsonable_encoder(profilo))
+    assert b"password_hash" not in TypeAdapter(UserRead).dump_json(UserRead.model_validate(profilo))
+
+    if superate:
+        sys.exit(f"Soglia di {args.max_us_per_riga} us/riga superata da: {', '.join(superate)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import importlib.util
+import json
+import socket
+import statistics
+import subprocess
+import time
+import urllib.request
+
+# Tempo di avvio di un worker: import a freddo di app.main, creazione dell'app e prima richiesta.
+# Ogni misura gira in un processo Python nuovo, come dopo un riavvio o un nuovo worker dell'autoscaling.
+# Con --uvicorn misura anche il tempo da lancio del processo uvicorn alla prima risposta su "/".
+# Con --max-import-ms lo script termina con errore se l'import supera la soglia: utile per le regressioni.
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#moduli che non devono essere caricati dal solo import dell'app
+PIGRI = ["fastapi_mail", "apscheduler", "aiosmtplib"]
+
+FIGLIO = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import app.main
+importato = time.perf_counter()
+app = app.main.create_app()
+creata = time.perf_counter()
+
+import httpx
+
+async def richieste():
+    #ASGI diretto, senza lifespan: le risorse di sfondo non bloccano la prima risposta
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        t0 = time.perf_counter()
+        prima = await client.get("/")
+        t1 = time.perf_counter()
+        await client.get("/")
+        t2 = time.perf_counter()
+    assert prima.status_code == 200, prima.status_code
+    return t1 - t0, t2 - t1
+
+prima, seconda = asyncio.run(richieste())
+print(json.dumps({
+    "import_ms": (importato - start) * 1000,
+    "create_ms": (creata - importato) * 1000,
+    "prima_ms": prima * 1000,
+    "seconda_ms": seconda * 1000,
+    "caricati": [m for m in %r if m in sys.modules],
+}))
+""" % (PIGRI,)
+
+
+def misura_processo() -> dict:
+    esito = subprocess.run([sys.executable, "-c", FIGLIO], cwd=BACKEND, capture_output=True, text=True)
+    if esito.returncode != 0:
+        sys.exit(f"Errore nel processo di misura:\n{esito.stderr}")
+    return json.loads(esito.stdout.strip().splitlines()[-1])
+
+
+def porta_libera() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def misura_uvicorn(timeout: float) -> float:
+    porta = porta_libera()
+    start = time.perf_counter()
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(porta), "--log-level", "warning"],
+        cwd=BACKEND, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if processo.poll() is not None:
+                sys.exit(f"uvicorn è terminato con codice {processo.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{porta}/", timeout=1) as risposta:
+                    if risposta.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.01)
+        sys.exit("uvicorn non ha risposto in tempo")
+    finally:
+        processo.terminate()
+        processo.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo di avvio a freddo dell'app")
+    parser.add_argument("--ripetizioni", type=int, default=5)
+    parser.add_argument("--uvicorn", action="store_true", help="misura anche lancio di uvicorn -> prima risposta")
+    parser.add_argument("--timeout", type=float, default=30, help="secondi di attesa per uvicorn")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="soglia per l'import di app.main")
+    args = parser.parse_args()
+
+    print(f"--- BENCHMARK AVVIO: mediana di {args.ripetizioni} processi ---")
+    misure = [misura_processo() for _ in range(args.ripetizioni)]
+    for chiave, nome in [("import_ms", "import app.main"), ("create_ms", "create_app()"),
+                         ("prima_ms", "prima richiesta"), ("seconda_ms", "seconda richiesta")]:
+        valori = [m[chiave] for m in misure]
+        print(f"{nome:20s} {statistics.median(valori):8.1f} ms (min {min(valori):.1f}, max {max(valori):.1f})")
+
+    caricati = misure[0]["caricati"]
+    if caricati:
+        print(f"ATTENZIONE: moduli caricati all'import che dovrebbero essere pigri: {', '.join(caricati)}")
+    else:
+        print(f"Moduli pigri non caricati all'import: {', '.join(PIGRI)}")
+
+    if args.uvicorn:
+        if importlib.util.find_spec("uvicorn") is None:
+            sys.exit("Installare uvicorn per la misura con --uvicorn")
+        tempi = [misura_uvicorn(args.timeout) for _ in range(args.ripetizioni)]
+        print(f"{'uvicorn -> 200':20s} {statistics.median(tempi):8.1f} ms (min {min(tempi):.1f}, max {max(tempi):.1f})")
+
+    import_ms = statistics.median(m["import_ms"] for m in misure)
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        sys.exit(f"Import di app.main in {import_ms:.1f} ms, oltre la soglia di {args.max_import_ms} ms")
+
+
+if __name__ == "__main__":
+    main()
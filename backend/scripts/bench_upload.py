@@ -0,0 +1,64 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import hashlib
+import shutil
+import tempfile
+import time
+import tracemalloc
+from app.services.media import store_upload
+
+# Caricamento di una foto: salvataggio a blocchi su disco (store_upload) contro la lettura dell'intero
+# corpo in memoria prima di scriverlo. Misura tempo e picco di memoria Python (tracemalloc) per file.
+
+
+async def blocchi(dimensione: int, blocco: int):
+    dati = b"\xff\xd8\xff" + os.urandom(blocco - 3)
+    inviati = 0
+    while inviati < dimensione:
+        yield dati
+        inviati += len(dati)
+        await asyncio.sleep(0)
+
+
+async def tutto_in_memoria(sorgente, root: str):
+    corpo = b"".join([b async for b in sorgente])
+    with open(os.path.join(root, hashlib.sha256(corpo).hexdigest()), "wb") as f:
+        f.write(corpo)
+
+
+def misura(coroutine_factory) -> tuple[float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    asyncio.run(coroutine_factory())
+    durata = (time.perf_counter() - start) * 1000
+    _, picco = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return durata, picco / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caricamento delle foto: a blocchi contro tutto in memoria")
+    parser.add_argument("--mb", type=int, default=10)
+    parser.add_argument("--blocco-kb", type=int, default=64, help="dimensione dei blocchi in arrivo dal server ASGI")
+    args = parser.parse_args()
+
+    dimensione = args.mb * 1024 * 1024
+    blocco = args.blocco_kb * 1024
+    root = tempfile.mkdtemp(prefix="easygig_media_")
+    try:
+        print(f"--- BENCHMARK CARICAMENTO: file da {args.mb} MB in blocchi da {args.blocco_kb} KB ---")
+        durata, picco = misura(lambda: tutto_in_memoria(blocchi(dimensione, blocco), root))
+        print(f"tutto in memoria: {durata:7.1f} ms, picco {picco:6.1f} MB")
+        durata, picco = misura(lambda: store_upload(blocchi(dimensione, blocco), max_bytes=dimensione * 2, root=root))
+        print(f"a blocchi:        {durata:7.1f} ms, picco {picco:6.1f} MB")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
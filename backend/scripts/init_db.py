@@ -7,6 +7,73 @@ from app.core.database import engine
 from sqlalchemy import text
 import app.models.models as models
 
+#Reputazione: separata dal resto perché la usa anche scripts/bench_reputation.py
+REPUTAZIONE_SQL = """
+    -- Reputazione (somma e numero dei voti aggiornati a ogni modifica, senza ricalcolare la media)
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'person' AND column_name = 'somma_voti') THEN
+            ALTER TABLE person ADD COLUMN somma_voti INTEGER NOT NULL DEFAULT 0;
+            ALTER TABLE person ADD COLUMN numero_voti INTEGER NOT NULL DEFAULT 0;
+            -- Allineamento iniziale dei contatori (una sola volta, quando le colonne vengono create)
+            UPDATE person p SET somma_voti = a.somma, numero_voti = a.numero
+            FROM (SELECT r.destinatario_id, SUM(s.voto) AS somma, COUNT(*) AS numero
+                  FROM score s JOIN review r ON s.review_id = r.id GROUP BY r.destinatario_id) a
+            WHERE p.id = a.destinatario_id;
+        END IF;
+    END $$;
+
+    CREATE OR REPLACE FUNCTION applica_voto(p_destinatario_id INTEGER, p_delta_somma INTEGER, p_delta_numero INTEGER) RETURNS VOID AS $$
+    BEGIN
+        -- Nel SET le colonne hanno ancora il valore precedente
+        UPDATE person SET
+            somma_voti = somma_voti + p_delta_somma,
+            numero_voti = numero_voti + p_delta_numero,
+            reputazione = CASE WHEN numero_voti + p_delta_numero > 0
+                               THEN ROUND((somma_voti + p_delta_somma)::numeric / (numero_voti + p_delta_numero), 2)
+                               ELSE 0 END
+        WHERE id = p_destinatario_id;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION aggiorna_reputazione() RETURNS TRIGGER AS $$
+    DECLARE v_destinatario_id INTEGER;
+    BEGIN
+        -- Tolgo il vecchio voto e aggiungo il nuovo al destinatario della recensione collegata
+        IF (TG_OP IN ('DELETE', 'UPDATE')) THEN
+            SELECT destinatario_id INTO v_destinatario_id FROM review WHERE id = OLD.review_id;
+            PERFORM applica_voto(v_destinatario_id, -OLD.voto, -1);
+        END IF;
+        IF (TG_OP IN ('INSERT', 'UPDATE')) THEN
+            SELECT destinatario_id INTO v_destinatario_id FROM review WHERE id = NEW.review_id;
+            PERFORM applica_voto(v_destinatario_id, NEW.voto, 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    DROP TRIGGER IF EXISTS tr_aggiorna_reputazione ON score;
+    CREATE TRIGGER tr_aggiorna_reputazione AFTER INSERT OR DELETE OR UPDATE OF voto, review_id ON score FOR EACH ROW EXECUTE FUNCTION aggiorna_reputazione();
+"""
+
+
+#Prenotazioni attive doppie sullo stesso slot, da annullare prima di creare ux_booking_slot_attiva
+ANNULLA_PRENOTAZIONI_DOPPIE_SQL = """
+    UPDATE booking SET stato_prenotazione = 'annullata', ragione = 'Prenotazione doppia sullo stesso slot'
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY slot_id
+                ORDER BY stato_prenotazione = 'accettata' DESC, data_creazione, id
+            ) AS posizione
+            FROM booking
+            WHERE slot_id IS NOT NULL AND stato_prenotazione IN ('pendente', 'accettata')
+        ) attive
+        WHERE posizione > 1
+    )
+"""
+
 
 def init_db():
     print("--- INIZIO INIZIALIZZAZIONE DATABASE ---")
@@ -15,6 +82,19 @@ def init_db():
     models.Base.metadata.create_all(bind=engine)
     print("   Tabelle create con successo.")
 
+    #ux_booking_slot_attiva non si crea se uno slot ha già più prenotazioni attive: resta quella accettata
+    #o, a parità, la più vecchia; le altre vengono annullate (stessa scelta a ogni esecuzione)
+    with engine.begin() as conn:
+        annullate = conn.execute(text(ANNULLA_PRENOTAZIONI_DOPPIE_SQL)).rowcount
+    if annullate:
+        print(f"   Annullate {annullate} prenotazioni attive doppie sullo stesso slot.")
+
+    #create_all non aggiunge indici a tabelle già esistenti: li creo qui se mancano
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    print("   Indici verificati.")
+
     print("2. Inserimento Trigger e Procedure (SQL)...")
 
     sql_commands = text("""
@@ -66,7 +146,7 @@ def init_db():
     -- Init Status (Creazione automatica Sanction e StatoAccount)
     CREATE OR REPLACE FUNCTION init_user_status() RETURNS TRIGGER AS $$
     BEGIN
-        INSERT INTO sanction (contatorestrike, soglia_warning, soglia_ban, person_id) VALUES (0, 3, 5, NEW.id);
+        INSERT INTO sanction (contatorestrike, numero_ban, soglia_warning, soglia_ban, person_id) VALUES (0, 0, 3, 5, NEW.id);
         INSERT INTO stato_account (stato, istante, person_id) VALUES ('attivo', CURRENT_TIMESTAMP, NEW.id);
         RETURN NEW;
     END;
@@ -75,30 +155,7 @@ def init_db():
     DROP TRIGGER IF EXISTS tr_init_person ON person;
     CREATE TRIGGER tr_init_person AFTER INSERT ON person FOR EACH ROW EXECUTE FUNCTION init_user_status();
 
-    -- Reputazione (Calcolo media voti)
-    CREATE OR REPLACE FUNCTION aggiorna_reputazione() RETURNS TRIGGER AS $$
-    DECLARE v_destinatario_id INTEGER; v_nuova_media DECIMAL(3, 2);
-    BEGIN
-        -- Recuperiamo il destinatario dalla recensione collegata allo score
-        IF (TG_OP = 'DELETE') THEN
-            SELECT destinatario_id INTO v_destinatario_id FROM review WHERE id = OLD.review_id; 
-        ELSE
-            SELECT destinatario_id INTO v_destinatario_id FROM review WHERE id = NEW.review_id; 
-        END IF;
-        
-        -- Calcoliamo la media
-        SELECT COALESCE(AVG(s.voto), 0) INTO v_nuova_media
-        FROM score s JOIN review r ON s.review_id = r.id
-        WHERE r.destinatario_id = v_destinatario_id;
-        
-        UPDATE person SET reputazione = v_nuova_media WHERE id = v_destinatario_id;
-        RETURN NULL;
-    END;
-    $$ LANGUAGE plpgsql;
-    
-    DROP TRIGGER IF EXISTS tr_aggiorna_reputazione ON score;
-    CREATE TRIGGER tr_aggiorna_reputazione AFTER INSERT OR UPDATE OR DELETE ON score FOR EACH ROW EXECUTE FUNCTION aggiorna_reputazione();
-
+    """ + REPUTAZIONE_SQL + """
     -- Ban Automatico (BEFORE UPDATE per evitare ricorsione)
     CREATE OR REPLACE FUNCTION trigger_ban_automatico() RETURNS TRIGGER AS $$
     BEGIN
@@ -216,13 +273,69 @@ def init_db():
     END;
     $$;
 
-    -- Invia Messaggio
-    CREATE OR REPLACE PROCEDURE invia_messaggio(p_chat INTEGER, p_mittente INTEGER, p_testo TEXT) LANGUAGE plpgsql AS $$
+    -- Contatori dei messaggi non letti per lato della chat (direttore del locale / band o promoter)
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'chat' AND column_name = 'non_letti_direttore') THEN
+            ALTER TABLE chat ADD COLUMN non_letti_direttore INTEGER NOT NULL DEFAULT 0;
+            ALTER TABLE chat ADD COLUMN non_letti_controparte INTEGER NOT NULL DEFAULT 0;
+            UPDATE chat c SET
+                non_letti_direttore = (SELECT COUNT(*) FROM message m
+                                       WHERE m.chat_id = c.id AND m.letto IS NOT TRUE AND m.mittente_id <> v.direttore_id),
+                non_letti_controparte = (SELECT COUNT(*) FROM message m
+                                         WHERE m.chat_id = c.id AND m.letto IS NOT TRUE AND m.mittente_id = v.direttore_id)
+            FROM booking b JOIN slot s ON b.slot_id = s.id JOIN calendar ca ON s.calendar_id = ca.id JOIN venue v ON ca.venue_id = v.id
+            WHERE b.id = c.booking_id;
+        END IF;
+    END $$;
+
+    -- Versione dello stato dell'account, copiata nei token di accesso (cresce a ogni ban e sblocco)
+    ALTER TABLE person ADD COLUMN IF NOT EXISTS versione_stato INTEGER NOT NULL DEFAULT 0;
+
+    -- Deduplicazione delle foto: sostituito dagli indici unici ux_photo_venue_source e ux_photo_person_source
+    DROP INDEX IF EXISTS ix_photo_source;
+
+    -- Coordinate di città e indirizzi (valorizzate da scripts/load_gazetteer.py)
+    ALTER TABLE city ADD COLUMN IF NOT EXISTS latitudine DOUBLE PRECISION;
+    ALTER TABLE city ADD COLUMN IF NOT EXISTS longitudine DOUBLE PRECISION;
+    ALTER TABLE address ADD COLUMN IF NOT EXISTS latitudine DOUBLE PRECISION;
+    ALTER TABLE address ADD COLUMN IF NOT EXISTS longitudine DOUBLE PRECISION;
+
+    -- Dati di riferimento: ogni modifica avvisa le API, che ricaricano la loro cache in memoria
+    CREATE OR REPLACE FUNCTION notifica_dati_riferimento() RETURNS TRIGGER AS $$
+    BEGIN
+        PERFORM pg_notify('dati_riferimento', TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS tr_notifica_genre ON genre;
+    CREATE TRIGGER tr_notifica_genre AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON genre FOR EACH STATEMENT EXECUTE FUNCTION notifica_dati_riferimento();
+    DROP TRIGGER IF EXISTS tr_notifica_nation ON nation;
+    CREATE TRIGGER tr_notifica_nation AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON nation FOR EACH STATEMENT EXECUTE FUNCTION notifica_dati_riferimento();
+    DROP TRIGGER IF EXISTS tr_notifica_region ON region;
+    CREATE TRIGGER tr_notifica_region AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON region FOR EACH STATEMENT EXECUTE FUNCTION notifica_dati_riferimento();
+    DROP TRIGGER IF EXISTS tr_notifica_city ON city;
+    CREATE TRIGGER tr_notifica_city AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON city FOR EACH STATEMENT EXECUTE FUNCTION notifica_dati_riferimento();
+
+    -- Invia Messaggio (il messaggio diventa "non letto" per l'altro lato della chat). Unico punto che aggiorna
+    -- i non letti all'invio, usato da app.services.chat.send_message: id e data tornano nei parametri INOUT
+    DROP PROCEDURE IF EXISTS invia_messaggio(INTEGER, INTEGER, TEXT);
+    CREATE OR REPLACE PROCEDURE invia_messaggio(p_chat INTEGER, p_mittente INTEGER, p_testo TEXT,
+                                                INOUT p_id INTEGER DEFAULT NULL, INOUT p_data TIMESTAMP DEFAULT NULL)
+    LANGUAGE plpgsql AS $$
     BEGIN
         INSERT INTO message (data_invio, testo, letto, chat_id, mittente_id) 
-        VALUES (CURRENT_TIMESTAMP, p_testo, FALSE, p_chat, p_mittente);
+        VALUES (CURRENT_TIMESTAMP, p_testo, FALSE, p_chat, p_mittente)
+        RETURNING id, data_invio INTO p_id, p_data;
         
-        UPDATE chat SET ultimo_messaggio = CURRENT_TIMESTAMP WHERE id = p_chat;
+        UPDATE chat c SET
+            ultimo_messaggio = CURRENT_TIMESTAMP,
+            non_letti_direttore = c.non_letti_direttore + CASE WHEN v.direttore_id = p_mittente THEN 0 ELSE 1 END,
+            non_letti_controparte = c.non_letti_controparte + CASE WHEN v.direttore_id = p_mittente THEN 1 ELSE 0 END
+        FROM booking b JOIN slot s ON b.slot_id = s.id JOIN calendar ca ON s.calendar_id = ca.id JOIN venue v ON ca.venue_id = v.id
+        WHERE c.id = p_chat AND b.id = c.booking_id;
     END;
     $$;
 
@@ -260,6 +373,24 @@ def init_db():
         END LOOP;
     END;
     $$;
+
+
+    /* ==============================================
+       SEZIONE 6: INDICI DI RICERCA (pg_trgm + full-text)
+       ============================================== */
+
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+    -- Band: trigrammi (ricerca tollerante ai refusi) e tsvector (ranking)
+    CREATE INDEX IF NOT EXISTS ix_band_nome_trgm ON band USING gin (nome gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS ix_band_nome_fts ON band USING gin (to_tsvector('simple'::regconfig, nome));
+
+    -- Artisti: nome completo "nome cognome"
+    CREATE INDEX IF NOT EXISTS ix_person_nome_completo_trgm ON person USING gin ((nome || ' ' || cognome) gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS ix_person_nome_completo_fts ON person USING gin (to_tsvector('simple'::regconfig, nome || ' ' || cognome));
+
+    -- Città (filtro per nome)
+    CREATE INDEX IF NOT EXISTS ix_city_nome_trgm ON city USING gin (nome gin_trgm_ops);
     """)
 
     # 3. Esecuzione dei comandi SQL
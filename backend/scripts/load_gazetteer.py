@@ -0,0 +1,74 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+from sqlalchemy import bindparam, create_engine, insert, select, update
+from app.core.database import SQLALCHEMY_DATABSE_URL
+from app.models.models import Address, City, Nation, Region
+from app.services.geo import GAZETTEER_PATH, chiave, read_gazetteer
+
+# Carica il gazetteer (nome, regione, nazione, coordinate) nelle tabelle nation/region/city:
+# aggiorna le coordinate delle città esistenti, aggiunge quelle mancanti (salvo --solo-aggiorna)
+# e copia le coordinate della città sugli indirizzi che non le hanno ancora.
+# I trigger sulle tabelle avvisano le API (NOTIFY), che ricaricano i dati di riferimento senza riavvio.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carica le coordinate delle città dal gazetteer")
+    parser.add_argument("--file", default=GAZETTEER_PATH)
+    parser.add_argument("--url", default=SQLALCHEMY_DATABSE_URL)
+    parser.add_argument("--solo-aggiorna", action="store_true", help="non aggiunge città nuove")
+    args = parser.parse_args()
+
+    righe = read_gazetteer(args.file)
+    engine = create_engine(args.url)
+    with engine.begin() as conn:
+        nazioni = {chiave(n): n for n in conn.scalars(select(Nation.nome))}
+        regioni = {(chiave(r), chiave(n)): (r, n) for r, n in conn.execute(select(Region.nome, Region.nazione))}
+        citta = {(chiave(c), chiave(r), chiave(n)): i
+                 for i, c, r, n in conn.execute(select(City.id, City.nome, City.regione, City.nazione))}
+
+        aggiornate, nuove = [], []
+        for riga in righe:
+            id_citta = citta.get((chiave(riga["nome"]), chiave(riga["regione"]), chiave(riga["nazione"])))
+            if id_citta is not None:
+                aggiornate.append({"b_id": id_citta, "lat": riga["latitudine"], "lon": riga["longitudine"]})
+            elif not args.solo_aggiorna:
+                #uso i nomi già presenti nel database per rispettare le chiavi esterne
+                nazione = nazioni.setdefault(chiave(riga["nazione"]), riga["nazione"])
+                regione, nazione = regioni.setdefault((chiave(riga["regione"]), chiave(nazione)),
+                                                      (riga["regione"], nazione))
+                nuove.append({**riga, "regione": regione, "nazione": nazione})
+
+        nazioni_nuove = {r["nazione"] for r in nuove} - set(conn.scalars(select(Nation.nome)))
+        if nazioni_nuove:
+            conn.execute(insert(Nation), [{"nome": n} for n in sorted(nazioni_nuove)])
+        regioni_nuove = {(r["regione"], r["nazione"]) for r in nuove} - set(
+            tuple(r) for r in conn.execute(select(Region.nome, Region.nazione)))
+        if regioni_nuove:
+            conn.execute(insert(Region), [{"nome": r, "nazione": n} for r, n in sorted(regioni_nuove)])
+        if nuove:
+            conn.execute(insert(City), nuove)
+        if aggiornate:
+            conn.execute(
+                update(City).where(City.id == bindparam("b_id"))
+                .values(latitudine=bindparam("lat"), longitudine=bindparam("lon")),
+                aggiornate,
+            )
+
+        #gli indirizzi senza coordinate prendono quelle della loro città
+        lat_citta = select(City.latitudine).where(City.id == Address.citta_id).scalar_subquery()
+        lon_citta = select(City.longitudine).where(City.id == Address.citta_id).scalar_subquery()
+        indirizzi = conn.execute(
+            update(Address).where(Address.latitudine.is_(None), lat_citta.is_not(None))
+            .values(latitudine=lat_citta, longitudine=lon_citta)
+        ).rowcount
+
+    print(f"Gazetteer: {len(righe)} righe, {len(aggiornate)} città aggiornate, {len(nuove)} aggiunte "
+          f"({len(nazioni_nuove)} nazioni e {len(regioni_nuove)} regioni nuove), {indirizzi} indirizzi completati")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from app.core.database import SQLALCHEMY_DATABSE_URL
+from app.models.models import Person
+from app.services.reputation import ReconcileReport, reconcile_chunk
+
+# Ricalcola da zero somma_voti, numero_voti e reputazione di tutte le persone, a blocchi di id
+# elaborati in parallelo, e riporta gli scarti rispetto ai valori mantenuti dal trigger.
+# Con --dry-run non corregge nulla.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Riallineamento della reputazione")
+    parser.add_argument("--url", default=SQLALCHEMY_DATABSE_URL)
+    parser.add_argument("--chunk", type=int, default=5000, help="persone per blocco")
+    parser.add_argument("--workers", type=int, default=4, help="blocchi elaborati in parallelo")
+    parser.add_argument("--dry-run", action="store_true", help="riporta gli scarti senza correggerli")
+    parser.add_argument("--mostra", type=int, default=20, help="scarti da stampare")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url, pool_size=args.workers, max_overflow=0)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        minimo, massimo = db.execute(select(func.min(Person.id), func.max(Person.id))).one()
+    if minimo is None:
+        print("Nessuna persona da controllare.")
+        return
+
+    def blocco(da_id):
+        with Session() as db:
+            return reconcile_chunk(db, da_id, da_id + args.chunk, correggi=not args.dry_run)
+
+    print(f"--- RIALLINEAMENTO REPUTAZIONE: id {minimo}-{massimo}, blocchi da {args.chunk}, {args.workers} in parallelo ---")
+    start = time.perf_counter()
+    totale = ReconcileReport()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for report in executor.map(blocco, range(minimo, massimo + 1, args.chunk)):
+            totale.merge(report)
+    elapsed = time.perf_counter() - start
+
+    for person_id, salvati, attesi in sorted(totale.scarti)[:args.mostra]:
+        print(f"   persona {person_id}: salvati (somma, numero, media) {salvati} -> attesi {attesi}")
+    print(f"{totale.persone} persone controllate in {elapsed:.1f}s: {len(totale.scarti)} con scarti, "
+          f"{totale.corrette} corrette{' (dry run)' if args.dry_run else ''}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
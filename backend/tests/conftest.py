@@ -0,0 +1,122 @@
+import os
+from datetime import date, timedelta
+from types import SimpleNamespace
+import pytest
+
+# Fixture condivise. I test che hanno bisogno di Postgres (trigger, procedure, indici parziali, pg_trgm)
+# girano solo se TEST_DB_NAME indica un database DI PROVA: il suo schema viene ricreato da zero con
+# scripts/init_db.py. Host e password sono quelli del .env (DB_HOST, DB_PASSWORD).
+#   TEST_DB_NAME=easygig_test python -m pytest -q
+
+TEST_DB_NAME = os.environ.get("TEST_DB_NAME")
+if TEST_DB_NAME:
+    #prima di importare app: engine e sessioni globali puntano al database di prova
+    os.environ["DB_NAME"] = TEST_DB_NAME
+
+
+@pytest.fixture(scope="session")
+def pg_schema():
+    if not TEST_DB_NAME:
+        pytest.skip("TEST_DB_NAME non impostato: test su Postgres saltati")
+    from sqlalchemy import text
+    from sqlalchemy.pool import NullPool
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app.core.database import AsyncSessionLocal, engine
+    from app.core.config import get_settings
+    from scripts.init_db import init_db
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE; CREATE SCHEMA public"))
+    init_db()
+    #ogni test gira in un suo event loop (asyncio.run): niente pool condiviso tra loop diversi
+    AsyncSessionLocal.configure(bind=create_async_engine(get_settings().async_database_url, poolclass=NullPool))
+    return engine
+
+
+@pytest.fixture
+def pg(pg_schema):
+    """Database di prova vuoto (tabelle svuotate, contatori degli id ripartiti) e cache di processo pulite."""
+    import asyncio
+    from sqlalchemy import text
+    from app.core.notify import pg_listener
+    from app.models.models import Base
+    from app.services.auth_context import auth_context_cache
+    from app.services.reference import reference_cache
+    from app.services.response_cache import response_caches
+    from app.services.tokens import token_revocations
+
+    tabelle = ", ".join(t.name for t in Base.metadata.sorted_tables)
+    with pg_schema.begin() as conn:
+        conn.execute(text(f"TRUNCATE {tabelle} RESTART IDENTITY CASCADE"))
+    auth_context_cache.clear()
+    token_revocations._minime.clear()
+    reference_cache.invalidate()
+    for cache in response_caches.values():
+        cache.invalidate()
+    #l'evento di arresto dell'ascolto resta legato all'event loop del test che lo ha avviato
+    pg_listener._stop = asyncio.Event()
+    return pg_schema
+
+
+@pytest.fixture
+def dati(pg):
+    """
+    Dati minimi: Milano e Monza (Lombardia), Torino (Piemonte); un direttore con un locale a Milano e
+    un calendario tra 30 giorni con 3 slot liberi; un artista con la sua band; un promoter.
+    """
+    from sqlalchemy import text
+
+    giorno = date.today() + timedelta(days=30)
+    with pg.begin() as conn:
+        conn.execute(text("INSERT INTO nation (nome) VALUES ('Italia')"))
+        conn.execute(text("INSERT INTO region (nome, nazione) VALUES ('Lombardia', 'Italia'), ('Piemonte', 'Italia')"))
+        conn.execute(text("""
+            INSERT INTO city (id, nome, regione, nazione, latitudine, longitudine) VALUES
+            (1, 'Milano', 'Lombardia', 'Italia', 45.4642, 9.1900),
+            (2, 'Monza', 'Lombardia', 'Italia', 45.5845, 9.2744),
+            (3, 'Torino', 'Piemonte', 'Italia', 45.0703, 7.6869)
+        """))
+        conn.execute(text("INSERT INTO genre (id, nome) VALUES (1, 'Rock')"))
+        #i trigger creano sanction e stato_account di ogni persona
+        conn.execute(text("""
+            INSERT INTO person (id, nome, cognome, telefono, email, tipo_utente, link_streaming, privacy_accettata, city_id) VALUES
+            (1, 'Dario', 'Direttore', '+39 3330000001', 'direttore@easygig.it', 'direttoreArtistico', NULL, true, 1),
+            (2, 'Anna', 'Artista', '+39 3330000002', 'artista@easygig.it', 'artista', 'https://example.com/anna', true, 1),
+            (3, 'Piero', 'Promoter', '+39 3330000003', 'promoter@easygig.it', 'promoter', NULL, true, 2)
+        """))
+        conn.execute(text("SELECT setval('person_id_seq', 3)"))
+        #band e membro nella stessa transazione (vincolo differito)
+        conn.execute(text("INSERT INTO band (id, nome, cachet, trattabile, categoria, genere_id) VALUES (1, 'I Prova', 500, true, 'inedita', 1)"))
+        conn.execute(text("INSERT INTO pers_band (person_id, band_id) VALUES (2, 1)"))
+        conn.execute(text("""
+            INSERT INTO venue (id, nome, email, telefono, tipo_sala, capienza, strumentazione, city_id, direttore_id)
+            VALUES (1, 'Locale Prova', 'locale@easygig.it', '+39 020000001', 'misto', 200, 'Mixer', 1, 1)
+        """))
+        conn.execute(text("""
+            INSERT INTO calendar (id, venue_id, data, data_inizio, data_fine, slot_disponibili)
+            VALUES (1, 1, :giorno, '20:00', '23:00', 3)
+        """), {"giorno": giorno})
+        conn.execute(text("""
+            INSERT INTO slot (id, calendar_id, orario_inizio, orario_fine, stato) VALUES
+            (1, 1, '20:00', '21:00', 'disponibile'), (2, 1, '21:00', '22:00', 'disponibile'), (3, 1, '22:00', '23:00', 'disponibile')
+        """))
+        for tabella in ("city", "genre", "band", "venue", "calendar", "slot"):
+            conn.execute(text(f"SELECT setval('{tabella}_id_seq', (SELECT max(id) FROM {tabella}))"))
+    return SimpleNamespace(direttore_id=1, artista_id=2, promoter_id=3, band_id=1, venue_id=1,
+                           calendar_id=1, slot_ids=[1, 2, 3], giorno=giorno)
+
+
+@pytest.fixture
+def autorizzazione(pg):
+    """user_id -> header Authorization con un token di accesso valido, costruito dal contesto sul database."""
+    import asyncio
+    from app.core.database import AsyncSessionLocal
+    from app.services.auth_context import load_auth_context
+    from app.services.tokens import create_access_token
+
+    def intestazione(user_id: int) -> dict:
+        async def carica():
+            async with AsyncSessionLocal() as db:
+                return await load_auth_context(db, user_id)
+        return {"Authorization": f"Bearer {create_access_token(asyncio.run(carica()))}"}
+    return intestazione
@@ -0,0 +1,108 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+# Prenotazioni degli slot su Postgres (vedi conftest.py per TEST_DB_NAME).
+
+
+def prenota(slot_id, band_id, richieste=1):
+    from app.core.database import AsyncSessionLocal
+    from app.services.booking_service import reserve_slot
+
+    async def una():
+        async with AsyncSessionLocal() as db:
+            try:
+                return (await reserve_slot(db, slot_id, band_id)).id
+            except HTTPException as error:
+                return error.status_code
+
+    async def tutte():
+        return await asyncio.gather(*(una() for _ in range(richieste)))
+    return asyncio.run(tutte())
+
+
+def test_prenotazioni_concorrenti_una_sola_passa(dati):
+    esiti = prenota(dati.slot_ids[0], dati.band_id, richieste=8)
+    assert esiti.count(409) == 7
+
+
+def test_indice_unico_ultima_garanzia(pg, dati):
+    slot_id = dati.slot_ids[1]
+    prenotazione_id, = prenota(slot_id, dati.band_id)
+    #stato dello slot rimesso a mano su disponibile: il lock passa, l'indice parziale no
+    with pg.begin() as conn:
+        conn.execute(text("UPDATE slot SET stato = 'disponibile' WHERE id = :id"), {"id": slot_id})
+    assert prenota(slot_id, dati.band_id) == [409]
+    with pg.connect() as conn:
+        assert conn.scalar(text("SELECT count(*) FROM booking WHERE slot_id = :id"), {"id": slot_id}) == 1
+        assert conn.scalar(text("SELECT id FROM booking WHERE slot_id = :id"), {"id": slot_id}) == prenotazione_id
+
+
+def test_init_db_annulla_le_prenotazioni_doppie(pg, dati):
+    from scripts.init_db import init_db
+
+    #database creato prima dell'indice unico, con più prenotazioni attive sullo stesso slot
+    with pg.begin() as conn:
+        conn.execute(text("DROP INDEX ux_booking_slot_attiva"))
+        conn.execute(text("""
+            INSERT INTO booking (id, data_creazione, message, scadenza, stato_prenotazione, iniziato_da, band_id, slot_id) VALUES
+            (1, now() - interval '3 days', 'Prima', now(), 'pendente', 'artista', 1, 1),
+            (2, now() - interval '2 days', 'Seconda', now(), 'pendente', 'artista', 1, 1),
+            (3, now() - interval '3 days', 'Pendente', now(), 'pendente', 'artista', 1, 2),
+            (4, now() - interval '1 days', 'Accettata', now(), 'accettata', 'artista', 1, 2),
+            (5, now() - interval '1 days', 'Unica', now(), 'pendente', 'artista', 1, 3)
+        """))
+
+    init_db()
+
+    with pg.connect() as conn:
+        stati = dict(conn.execute(text("SELECT id, stato_prenotazione FROM booking")).all())
+        assert conn.scalar(text("SELECT count(*) FROM pg_indexes WHERE indexname = 'ux_booking_slot_attiva'")) == 1
+    #resta la più vecchia, ma un'accettata vince sempre su una pendente
+    assert stati == {1: "pendente", 2: "annullata", 3: "annullata", 4: "accettata", 5: "pendente"}
+
+
+def stato(pg):
+    with pg.connect() as conn:
+        prenotazioni = dict(conn.execute(text("SELECT id, stato_prenotazione FROM booking")).all())
+        slot = dict(conn.execute(text("SELECT id, stato FROM slot")).all())
+        liberi = conn.scalar(text("SELECT slot_disponibili FROM calendar WHERE id = 1"))
+        chat = conn.scalars(text("SELECT booking_id FROM chat ORDER BY booking_id")).all()
+    return prenotazioni, slot, liberi, chat
+
+
+def test_transizioni_in_blocco(pg, dati, autorizzazione):
+    from app.main import app
+
+    client = TestClient(app)
+    direttore, artista, promoter = (autorizzazione(dati.direttore_id), autorizzazione(dati.artista_id),
+                                    autorizzazione(dati.promoter_id))
+    assert prenota(dati.slot_ids[0], dati.band_id) + prenota(dati.slot_ids[1], dati.band_id) \
+        + prenota(dati.slot_ids[2], dati.band_id) == [1, 2, 3]
+
+    #99 non esiste: viene ignorata senza fermare le altre
+    accettate = client.post("/bookings/bulk", json={"booking_ids": [1, 2, 99], "azione": "accetta"}, headers=direttore)
+    assert accettate.json() == {"aggiornate": [1, 2], "ignorate": [99]}
+    prenotazioni, slot, liberi, chat = stato(pg)
+    assert (prenotazioni[1], prenotazioni[2], slot[1], slot[2]) == ("accettata", "accettata", "occupato", "occupato")
+    assert liberi == 1 and chat == [1, 2]
+
+    #la 2 è già accettata: si rifiuta solo la 3, e il suo slot torna libero
+    rifiutate = client.post("/bookings/bulk", json={"booking_ids": [2, 3], "azione": "rifiuta", "ragione": "Data piena"},
+                            headers=direttore)
+    assert rifiutate.json() == {"aggiornate": [3], "ignorate": [2]}
+    prenotazioni, slot, liberi, _chat = stato(pg)
+    assert (prenotazioni[3], slot[3], liberi) == ("rifiutata", "disponibile", 1)
+
+    #solo il direttore accetta o rifiuta: per la band la prenotazione non è gestibile
+    assert client.post("/bookings/bulk", json={"booking_ids": [1], "azione": "accetta"}, headers=artista).json() \
+        == {"aggiornate": [], "ignorate": [1]}
+
+    #annullamento dalla band: lo slot si libera e il calendario recupera il posto
+    assert client.post("/bookings/1/cancel", json={"ragione": "Imprevisto"}, headers=artista).status_code == 200
+    prenotazioni, slot, liberi, _chat = stato(pg)
+    assert (prenotazioni[1], slot[1], liberi) == ("annullata", "disponibile", 2)
+    assert client.post("/bookings/1/cancel", json={"ragione": "Di nuovo"}, headers=artista).status_code == 400
+    assert client.post("/bookings/2/cancel", json={"ragione": "Non mia"}, headers=promoter).status_code == 403
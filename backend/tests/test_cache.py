@@ -0,0 +1,52 @@
+import asyncio
+import time
+from app.core.cache import SingleFlightCache, TTLCache
+
+
+def test_lru_scarta_la_chiave_meno_usata():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a") #"a" diventa la più recente
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_scaduto_e_invalidazione():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("breve", 1, ttl=0.01)
+    cache.set("lunga", 2)
+    time.sleep(0.02)
+    assert cache.get("breve") is None
+    cache.invalidate("lunga")
+    assert cache.get("lunga") is None
+    assert cache.misses == 2
+
+
+def test_single_flight_e_invalidazione():
+    cache = SingleFlightCache(maxsize=10, ttl=60)
+    calcoli = []
+
+    async def calcola():
+        calcoli.append(1)
+        await asyncio.sleep(0.01)
+        return len(calcoli)
+
+    async def scenario():
+        concorrenti = await asyncio.gather(*(cache.get_or_compute("k", calcola) for _ in range(5)))
+        dopo = await cache.get_or_compute("k", calcola)
+        #invalidazione durante il calcolo: il valore vecchio non viene salvato
+        in_corso = asyncio.create_task(cache.get_or_compute("k2", calcola))
+        await asyncio.sleep(0)
+        cache.invalidate()
+        await in_corso
+        return concorrenti, dopo, await cache.get_or_compute("k2", calcola)
+
+    concorrenti, dopo, ricalcolato = asyncio.run(scenario())
+    assert [v for v, _ in concorrenti] == [1] * 5
+    assert sorted(s for _, s in concorrenti) == ["MISS"] + ["SHARED"] * 4
+    assert dopo == (1, "HIT")
+    assert ricalcolato == (3, "MISS")
+    assert cache.stats()["condivise"] == 4
@@ -0,0 +1,49 @@
+from datetime import date, time
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from app.api.routes.calendar import dateRicorrenti, generaOrariSlot
+
+# Calcolo degli slot, date ricorrenti e creazione dei calendari di una stagione.
+
+
+def test_slot_di_una_serata_oltre_la_mezzanotte():
+    orari = generaOrariSlot(date(2026, 3, 6), time(22), time(2), 4)
+    assert orari == [(time(22), time(23)), (time(23), time(0)), (time(0), time(1)), (time(1), time(2))]
+
+
+def test_slot_di_durata_non_intera():
+    orari = generaOrariSlot(date(2026, 3, 6), time(20), time(21), 3)
+    assert orari == [(time(20), time(20, 20)), (time(20, 20), time(20, 40)), (time(20, 40), time(21))]
+
+
+def test_date_ricorrenti_ogni_due_settimane():
+    #venerdì e sabato, una settimana sì e una no a partire da quella di `dal` (mercoledì 4 marzo 2026)
+    date_valide = dateRicorrenti(date(2026, 3, 4), date(2026, 3, 29), [4, 5], ogni_n_settimane=2)
+    assert date_valide == [date(2026, 3, 6), date(2026, 3, 7), date(2026, 3, 20), date(2026, 3, 21)]
+
+
+def test_calendari_di_una_stagione(pg, dati, autorizzazione):
+    from app.main import app
+
+    client = TestClient(app)
+    stagione = {"dal": "2026-03-02", "al": "2026-03-29", "giorni_settimana": [4, 5],
+                "ora_inizio": "22:00", "ora_fine": "01:00", "numero_slot": 3}
+    risposta = client.post("/calendar/bulk", json=stagione, headers=autorizzazione(dati.direttore_id))
+    assert risposta.status_code == 200, risposta.text
+    risultato = risposta.json()
+    assert risultato["calendari_creati"] == 8 and risultato["slot_creati"] == 24
+
+    with pg.connect() as conn:
+        calendari = conn.execute(text("SELECT id, data, venue_id, slot_disponibili FROM calendar WHERE id = ANY(:ids) ORDER BY id"),
+                                 {"ids": risultato["calendar_ids"]}).all()
+        orari = conn.execute(text("SELECT orario_inizio, orario_fine FROM slot WHERE calendar_id = :id ORDER BY id"),
+                             {"id": risultato["calendar_ids"][0]}).all()
+    #id restituiti nello stesso ordine delle date
+    assert [c.data for c in calendari] == sorted(c.data for c in calendari)
+    assert {(c.venue_id, c.slot_disponibili) for c in calendari} == {(dati.venue_id, 3)}
+    assert [tuple(o) for o in orari] == [(time(22), time(23)), (time(23), time(0)), (time(0), time(1))]
+
+    #un locale che non è suo e un utente che non è direttore
+    altro = client.post("/calendar/bulk", json={**stagione, "venue_id": 99}, headers=autorizzazione(dati.direttore_id))
+    artista = client.post("/calendar/bulk", json=stagione, headers=autorizzazione(dati.artista_id))
+    assert altro.status_code == artista.status_code == 403
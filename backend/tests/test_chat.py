@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+
+# Chat delle prenotazioni su Postgres: procedura invia_messaggio e WebSocket (vedi conftest.py per TEST_DB_NAME).
+
+
+def apri_chat(pg, dati) -> int:
+    #la chat la crea il trigger tr_auto_chat quando la prenotazione viene accettata
+    with pg.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO booking (id, data_creazione, message, scadenza, stato_prenotazione, iniziato_da, band_id, slot_id)
+            VALUES (1, now(), 'Richiesta', now() + interval '5 days', 'pendente', 'artista', :band, :slot)
+        """), {"band": dati.band_id, "slot": dati.slot_ids[0]})
+        conn.execute(text("CALL accetta_prenotazione(1)"))
+        return conn.scalar(text("SELECT id FROM chat WHERE booking_id = 1"))
+
+
+def contesto(user_id):
+    from app.core.database import AsyncSessionLocal
+    from app.services.auth_context import load_auth_context
+
+    async def carica():
+        async with AsyncSessionLocal() as db:
+            return await load_auth_context(db, user_id)
+    return asyncio.run(carica())
+
+
+def test_send_message_usa_la_procedura(pg, dati):
+    from app.core.database import AsyncSessionLocal
+    from app.services.chat import load_chat_access, send_message
+
+    chat_id = apri_chat(pg, dati)
+    artista, gestore = contesto(dati.artista_id), contesto(dati.direttore_id)
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            band = await load_chat_access(db, chat_id, artista)
+            direttore = await load_chat_access(db, chat_id, gestore)
+            eventi = [await send_message(db, band, dati.artista_id, "Ciao"),
+                      await send_message(db, band, dati.artista_id, "Ci sei?"),
+                      await send_message(db, direttore, dati.direttore_id, "Sì")]
+        return band, direttore, eventi
+
+    band, direttore, eventi = asyncio.run(scenario())
+    assert not band.lato_direttore and direttore.lato_direttore
+    assert [e["id"] for e in eventi] == [1, 2, 3]
+    assert abs(datetime.fromisoformat(eventi[0]["data_invio"]) - datetime.now()) < timedelta(minutes=1)
+    with pg.connect() as conn:
+        non_letti = conn.execute(text("SELECT non_letti_direttore, non_letti_controparte FROM chat WHERE id = :id"),
+                                 {"id": chat_id}).one()
+    #i contatori li aggiorna solo invia_messaggio: due messaggi per il direttore, uno per la band
+    assert tuple(non_letti) == (2, 1)
+
+
+def test_socket_rifiuta_frame_binari_e_token_revocati(pg, dati):
+    from fastapi.testclient import TestClient
+    from starlette.websockets import WebSocketDisconnect
+    from app.main import app
+    from app.services.tokens import create_access_token, token_revocations
+
+    chat_id = apri_chat(pg, dati)
+    ctx = contesto(dati.artista_id)
+    token = create_access_token(ctx)
+
+    with TestClient(app).websocket_connect(f"/chats/{chat_id}/ws?token={token}") as socket:
+        socket.send_bytes(b"\x00\x01")
+        assert socket.receive_json() == {"tipo": "errore", "detail": "Sono ammessi solo messaggi di testo (JSON)"}
+        socket.send_text("non json")
+        assert socket.receive_json()["tipo"] == "errore"
+
+        #ban o sblocco dopo la connessione: il messaggio successivo chiude il socket
+        token_revocations.revoke(dati.artista_id, ctx.versione + 1)
+        socket.send_json({"tipo": "messaggio", "testo": "Ciao"})
+        with pytest.raises(WebSocketDisconnect) as chiusura:
+            socket.receive_json()
+    assert chiusura.value.code == 1008
+    with pg.connect() as conn:
+        assert conn.scalar(text("SELECT count(*) FROM message")) == 0
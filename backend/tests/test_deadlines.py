@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timedelta
+import app.core.deadlines as deadlines
+from app.core.deadlines import DeadlineQueue
+
+# Coda delle scadenze: ricostruzione, risveglio sulla prima scadenza e nuovi tentativi dopo un errore.
+
+
+def test_pop_due_in_ordine_e_senza_doppioni():
+    coda = DeadlineQueue("prova", carica=list, scadute=None)
+    adesso = datetime.now()
+    coda.schedule(3, adesso - timedelta(seconds=1))
+    coda.schedule(1, adesso - timedelta(seconds=5))
+    coda.schedule(3, adesso - timedelta(seconds=2)) #stessa chiave riprogrammata
+    coda.schedule(2, adesso + timedelta(hours=1))
+
+    assert coda.pop_due(adesso) == [1, 3]
+    assert len(coda) == 1
+    assert 3599 < coda.next_wait(adesso) <= 3600
+    assert DeadlineQueue("vuota", carica=list, scadute=None).next_wait(adesso) is None
+
+
+def test_scadenze_all_orario_e_risveglio_anticipato():
+    adesso = datetime.now()
+    arrivate = []
+
+    async def scadute(chiavi):
+        arrivate.append((chiavi, datetime.now()))
+
+    #una scadenza già passata (es. durante un riavvio) e una tra poco, caricate all'avvio
+    coda = DeadlineQueue("prova", carica=lambda: [(adesso + timedelta(seconds=0.2), 2), (adesso - timedelta(days=1), 1)],
+                         scadute=scadute, max_sleep=30)
+
+    async def scenario():
+        compito = asyncio.create_task(coda.run())
+        await asyncio.sleep(0.05)
+        #una scadenza più vicina della prima in coda sveglia il timer, senza aspettare max_sleep
+        coda.schedule(3, datetime.now() + timedelta(seconds=0.05))
+        await asyncio.sleep(0.4)
+        compito.cancel()
+
+    asyncio.run(scenario())
+    assert [chiavi for chiavi, _quando in arrivate] == [[1], [3], [2]]
+    assert all(quando - adesso < timedelta(seconds=1) for _chiavi, quando in arrivate)
+    assert len(coda) == 0
+
+
+def test_scadenze_in_errore_riprovate(monkeypatch):
+    monkeypatch.setattr(deadlines, "DEADLINE_RETRY", 0.05)
+    tentativi = []
+
+    async def scadute(chiavi):
+        tentativi.append(chiavi)
+        if len(tentativi) == 1:
+            raise RuntimeError("database non raggiungibile")
+
+    coda = DeadlineQueue("prova", carica=lambda: [(datetime.now(), 7)], scadute=scadute, max_sleep=30)
+
+    async def scenario():
+        compito = asyncio.create_task(coda.run())
+        await asyncio.sleep(0.3)
+        compito.cancel()
+
+    asyncio.run(scenario())
+    assert tentativi == [[7], [7]]
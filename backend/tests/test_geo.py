@@ -0,0 +1,45 @@
+import random
+from app.services.geo import CityPoint, GeoIndex, distance_km
+
+# Indice geografico delle città: gerarchia per nome/regione/nazione e ricerca per raggio sulla griglia.
+
+MILANO = CityPoint(1, "Milano", "Lombardia", "Italia", 45.4642, 9.1900)
+MONZA = CityPoint(2, "Monza", "Lombardia", "Italia", 45.5845, 9.2744)
+TORINO = CityPoint(3, "Torino", "Piemonte", "Italia", 45.0703, 7.6869)
+
+
+def test_distanza_haversine():
+    assert distance_km(45.4642, 9.19, 45.4642, 9.19) == 0
+    assert 124 < distance_km(MILANO.latitudine, MILANO.longitudine, TORINO.latitudine, TORINO.longitudine) < 128
+    #simmetrica
+    assert distance_km(0, 0, 10, 10) == distance_km(10, 10, 0, 0)
+
+
+def test_gerarchia_senza_distinzione_di_maiuscole():
+    senza_coordinate = CityPoint(4, "Torino", "Piemonte", "Italia", None, None)
+    indice = GeoIndex([senza_coordinate, MILANO, MONZA, TORINO])
+    assert indice.cities_in_region(" lombardia ") == {1, 2}
+    assert indice.cities_in_nation("ITALIA") == {1, 2, 3, 4}
+    assert indice.cities_in_region("Veneto") == set()
+    #a parità di nome vince la città con le coordinate
+    assert indice.find_city("torino") == TORINO
+    assert indice.find_city("Roma") is None
+
+
+def test_raggio_uguale_alla_ricerca_esaustiva():
+    casuale = random.Random(42)
+    citta = [CityPoint(i, f"C{i}", "R", "N", casuale.uniform(36, 47), casuale.uniform(6, 19)) for i in range(2000)]
+    #celle piccole rispetto al raggio: la ricerca attraversa molte celle della griglia
+    indice = GeoIndex(citta, cella=0.1)
+    for lat, lon, raggio in ((45.46, 9.19, 30), (41.9, 12.5, 150), (38.1, 13.36, 5)):
+        attese = {c.id for c in citta if distance_km(lat, lon, c.latitudine, c.longitudine) <= raggio}
+        trovate = indice.within(lat, lon, raggio)
+        assert set(trovate) == attese
+        assert all(d <= raggio for d in trovate.values())
+
+
+def test_raggio_tra_le_citta_vicine():
+    indice = GeoIndex([MILANO, MONZA, TORINO, CityPoint(4, "Senza", "Lombardia", "Italia", None, None)])
+    vicine = indice.within(MILANO.latitudine, MILANO.longitudine, 20)
+    assert set(vicine) == {1, 2} and vicine[1] == 0 and 13 < vicine[2] < 15
+    assert set(indice.within(MILANO.latitudine, MILANO.longitudine, 130)) == {1, 2, 3}
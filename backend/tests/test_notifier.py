@@ -0,0 +1,49 @@
+from app.services.notifier import NotificationDigest
+
+# Riepilogo delle notifiche: una sola mail per destinatario, con tutte le sezioni raccolte.
+
+
+class SessioneFinta:
+    def __init__(self):
+        self.mail = []
+
+    def add(self, oggetto):
+        self.mail.append(oggetto)
+
+
+def test_una_mail_per_destinatario():
+    digest = NotificationDigest()
+    digest.strike("dario@easygig.it", "Dario", strike_count=3, current_bans=0)
+    digest.reminder("dario@easygig.it", "Dario", "I Prova", "01/12/2026", giorni_rimanenti=2)
+    digest.ban("dario@easygig.it", "Dario", numero_ban=2)
+    digest.unban("bruna@easygig.it", "Bruna")
+    db = SessioneFinta()
+
+    resoconto = digest.enqueue(db)
+
+    assert resoconto == {"destinatari": 2, "notifiche": 4, "accorpate": 2}
+    mail = {m.destinatario: m for m in db.mail}
+    assert len(db.mail) == 2
+    #più notifiche: l'oggetto diventa un riepilogo e il corpo le contiene tutte
+    assert mail["dario@easygig.it"].oggetto == "EasyGIG: hai 3 nuove notifiche"
+    corpo = mail["dario@easygig.it"].corpo
+    assert "<b>3/5</b>" in corpo and "I Prova" in corpo and "il 2° sul tuo account" in corpo
+    #il secondo ban dura 14 giorni, lo strike con nessun ban precedente ne annuncia 7
+    assert "sospeso per 14 giorni" in corpo and "sospeso per 7 giorni" in corpo
+    #una sola notifica mantiene il suo oggetto
+    assert mail["bruna@easygig.it"].oggetto == "BENTORNATO!"
+    assert "Ciao Bruna" in mail["bruna@easygig.it"].corpo
+    #dopo l'invio il riepilogo riparte vuoto
+    assert digest.enqueue(SessioneFinta()) == {"destinatari": 0, "notifiche": 0, "accorpate": 0}
+
+
+def test_valori_escapati_nel_corpo():
+    digest = NotificationDigest()
+    digest.reminder("dario@easygig.it", "<Dario>", "<script>alert(1)</script>", "01/12/2026", giorni_rimanenti=1)
+    db = SessioneFinta()
+    digest.enqueue(db)
+
+    corpo = db.mail[0].corpo
+    assert "<script>" not in corpo and "&lt;script&gt;" in corpo
+    assert "Ciao &lt;Dario&gt;" in corpo
+    assert db.mail[0].oggetto == "Promemoria: Una prenotazione scade tra 1 giorni!"
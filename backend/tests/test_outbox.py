@@ -0,0 +1,134 @@
+import asyncio
+import os
+import socket
+import pytest
+
+pytest.importorskip("aiosmtpd")
+pytest.importorskip("aiosqlite")
+os.environ.setdefault("MAIL_FROM", "noreply@easygig.it")
+
+from aiosmtpd.controller import Controller
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.core.mail import SmtpPool
+from app.models.models import EmailOutbox, OutboxState
+from app.services.outbox import OutboxWorker, enqueue_email
+
+# Il worker dell'outbox contro un server SMTP locale (aiosmtpd) e un database SQLite in memoria.
+
+
+class Raccoglitore:
+    def __init__(self):
+        self.messaggi = []
+        self.connessioni = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connessioni += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messaggi.append(envelope)
+        return "250 OK"
+
+
+def porta_libera():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def prepara_outbox(n):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(EmailOutbox.__table__.create)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        for i in range(n):
+            enqueue_email(db, f"utente{i}@easygig.it", "Prova", f"<p>Messaggio {i}</p>")
+        await db.commit()
+    return session_factory
+
+
+async def stati(session_factory):
+    async with session_factory() as db:
+        return (await db.scalars(select(EmailOutbox).order_by(EmailOutbox.id))).all()
+
+
+def test_invio_con_connessioni_riutilizzate():
+    raccoglitore = Raccoglitore()
+    controller = Controller(raccoglitore, hostname="127.0.0.1", port=porta_libera())
+    controller.start()
+    try:
+        async def scenario():
+            session_factory = await prepara_outbox(20)
+            pool = SmtpPool("127.0.0.1", controller.port, start_tls=False, size=3)
+            worker = OutboxWorker(pool, session_factory, mittente="noreply@easygig.it")
+            assert await worker.run_once() == 20
+            await pool.close()
+            return pool, await stati(session_factory)
+
+        pool, mails = asyncio.run(scenario())
+    finally:
+        controller.stop()
+
+    assert len(raccoglitore.messaggi) == 20
+    assert all(m.stato == OutboxState.inviata for m in mails)
+    #al massimo una connessione per invio parallelo, non una per messaggio
+    assert pool.connessioni_aperte <= 3
+    assert raccoglitore.connessioni <= 3
+
+
+def test_tentativi_e_dead_letter():
+    async def scenario():
+        session_factory = await prepara_outbox(2)
+        pool = SmtpPool("127.0.0.1", porta_libera(), start_tls=False, timeout=2)
+        worker = OutboxWorker(pool, session_factory, mittente="noreply@easygig.it", max_tentativi=2)
+        await worker.run_once()
+        dopo_primo = await stati(session_factory)
+        #il secondo tentativo è rimandato: un nuovo giro non trova nulla da spedire
+        assert await worker.run_once() == 0
+        async with session_factory() as db:
+            for mail in (await db.scalars(select(EmailOutbox))).all():
+                mail.prossimo_tentativo = mail.creata
+            await db.commit()
+        await worker.run_once()
+        return dopo_primo, await stati(session_factory)
+
+    dopo_primo, finali = asyncio.run(scenario())
+    assert all(m.stato == OutboxState.inAttesa and m.tentativi == 1 for m in dopo_primo)
+    assert all(m.stato == OutboxState.fallita and m.tentativi == 2 and m.ultimo_errore for m in finali)
+
+
+class PoolConcorrente:
+    """Pool SMTP finto: durante il primo invio fa girare un secondo worker sulla stessa outbox."""
+
+    def __init__(self):
+        self.inviati = []
+        self.concorrente = None
+        self.presi_dal_concorrente = None
+
+    async def send(self, messaggio):
+        if self.concorrente and self.presi_dal_concorrente is None:
+            self.presi_dal_concorrente = 0
+            self.presi_dal_concorrente = await self.concorrente.run_once()
+        self.inviati.append(messaggio["To"])
+
+    async def close(self):
+        pass
+
+
+def test_mail_in_invio_non_vengono_riprese():
+    async def scenario():
+        session_factory = await prepara_outbox(3)
+        pool = PoolConcorrente()
+        worker = OutboxWorker(pool, session_factory, mittente="noreply@easygig.it") # type: ignore
+        pool.concorrente = OutboxWorker(pool, session_factory, mittente="noreply@easygig.it") # type: ignore
+        elaborate = await worker.run_once()
+        return elaborate, pool, await stati(session_factory)
+
+    elaborate, pool, mails = asyncio.run(scenario())
+    #il blocco è stato preso e salvato prima degli invii: il secondo worker non trova nulla
+    assert elaborate == 3 and pool.presi_dal_concorrente == 0
+    assert sorted(pool.inviati) == [f"utente{i}@easygig.it" for i in range(3)]
+    assert all(m.stato == OutboxState.inviata and m.inviata_il for m in mails)
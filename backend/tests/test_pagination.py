@@ -0,0 +1,59 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import Column, Date, Integer, MetaData, String, Table, create_engine, insert, select
+from app.core.pagination import apply_keyset, build_page, decode_cursor, encode_cursor
+
+# Cursori opachi e paginazione keyset, su SQLite in memoria.
+
+metadata = MetaData()
+righe = Table("righe", metadata, Column("id", Integer, primary_key=True), Column("data", Date), Column("nome", String))
+
+
+@pytest.fixture
+def conn():
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        #date ripetute: l'id rende univoco l'ordinamento
+        conn.execute(insert(righe), [{"id": i, "data": date(2026, 1, 1 + i % 4), "nome": f"riga {i}"} for i in range(1, 24)])
+        yield conn
+
+
+def pagine(conn, limit, desc=False):
+    ordine = [righe.c.data, righe.c.id]
+    cursor, visti = None, []
+    while True:
+        pagina = build_page(conn.execute(apply_keyset(select(righe), ordine, cursor, limit, desc=desc)).all(),
+                            lambda r: (r.data, r.id), limit)
+        assert len(pagina["items"]) <= limit
+        visti += [r.id for r in pagina["items"]]
+        cursor = pagina["next_cursor"]
+        if not cursor:
+            return visti
+
+
+def test_cursore_con_tipi_diversi():
+    valori = [datetime(2026, 3, 1, 21, 30), date(2026, 3, 1), time(21, 30), "Locale", 7, None]
+    assert decode_cursor(encode_cursor(valori), len(valori)) == valori
+    assert decode_cursor(encode_cursor([Decimal("4.50")]), 1) == [4.5]
+
+
+@pytest.mark.parametrize("cursor", ["%%%", encode_cursor([1, 2])[:-3], encode_cursor([1])])
+def test_cursore_non_valido(cursor):
+    with pytest.raises(HTTPException) as errore:
+        decode_cursor(cursor, 2)
+    assert errore.value.status_code == 400
+
+
+@pytest.mark.parametrize("limit", [1, 5, 23, 50])
+def test_pagine_complete_senza_doppioni(conn, limit):
+    tutte = [r.id for r in conn.execute(select(righe).order_by(righe.c.data, righe.c.id))]
+    assert pagine(conn, limit) == tutte
+    assert pagine(conn, limit, desc=True) == tutte[::-1]
+
+
+def test_ultima_pagina_piena_senza_cursore(conn):
+    pagina = build_page(conn.execute(apply_keyset(select(righe), [righe.c.id], None, 23)).all(), lambda r: (r.id,), 23)
+    assert len(pagina["items"]) == 23 and pagina["next_cursor"] is None
@@ -0,0 +1,50 @@
+import asyncio
+from fastapi import HTTPException
+from passlib.hash import bcrypt
+from app.services.passwords import PasswordHasher
+
+# Hash e verifica delle password nel pool di processi dedicato.
+
+
+def test_hash_e_verifica_nel_pool():
+    hasher = PasswordHasher(workers=2)
+
+    async def scenario():
+        password_hash = await hasher.hash("segreta")
+        return password_hash, await asyncio.gather(hasher.verify("segreta", password_hash),
+                                                   hasher.verify("sbagliata", password_hash))
+    try:
+        password_hash, (giusta, sbagliata) = asyncio.run(scenario())
+    finally:
+        hasher.shutdown()
+    assert password_hash.startswith("$2")
+    assert giusta == (True, None)
+    assert sbagliata == (False, None)
+    assert hasher.pending == 0
+
+
+def test_hash_con_costo_vecchio_viene_aggiornato():
+    hasher = PasswordHasher(workers=1)
+    vecchio = bcrypt.using(rounds=4).hash("segreta")
+    try:
+        valida, nuovo_hash = asyncio.run(hasher.verify("segreta", vecchio))
+    finally:
+        hasher.shutdown()
+    assert valida and nuovo_hash and nuovo_hash != vecchio
+    assert bcrypt.verify("segreta", nuovo_hash)
+
+
+def test_coda_piena_risponde_503():
+    hasher = PasswordHasher(workers=1, max_pending=2)
+
+    async def scenario():
+        esiti = await asyncio.gather(*(hasher.hash("segreta") for _ in range(4)), return_exceptions=True)
+        return esiti
+    try:
+        esiti = asyncio.run(scenario())
+    finally:
+        hasher.shutdown()
+    rifiutate = [e for e in esiti if isinstance(e, HTTPException)]
+    assert len(rifiutate) == 2
+    assert all(e.status_code == 503 and e.headers == {"Retry-After": "1"} for e in rifiutate)
+    assert hasher.pending == 0
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import secrets
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import text
+from starlette.requests import Request
+
+# Caricamento delle foto su Postgres: deduplicazione con l'indice unico e file orfani (vedi conftest.py per TEST_DB_NAME).
+
+
+def png_casuale() -> bytes:
+    #basta l'intestazione PNG per il controllo del formato; il resto rende unico lo sha256
+    return b"\x89PNG\r\n\x1a\n" + secrets.token_bytes(64)
+
+
+def richiesta(corpo: bytes) -> Request:
+    async def ricevi():
+        return {"type": "http.request", "body": corpo, "more_body": False}
+    return Request({"type": "http", "method": "POST", "headers": []}, ricevi)
+
+
+def carica(corpo: bytes, person_id: int, richieste: int = 1):
+    from app.api.routes.photos import save_photo
+    from app.core.database import AsyncSessionLocal
+
+    async def una():
+        async with AsyncSessionLocal() as db:
+            risposta = Response(status_code=201)
+            try:
+                foto = await save_photo(richiesta(corpo), risposta, db, "Foto", person_id=person_id)
+            except HTTPException as error:
+                return error.status_code, None
+            return risposta.status_code, foto
+
+    async def tutte():
+        return await asyncio.gather(*(una() for _ in range(richieste)))
+    return asyncio.run(tutte())
+
+
+def percorso(corpo: bytes) -> str:
+    import hashlib
+    from app.services.media import MEDIA_ROOT, file_path
+    return os.path.join(MEDIA_ROOT, file_path(f"{hashlib.sha256(corpo).hexdigest()}.png"))
+
+
+@pytest.fixture
+def file_di_prova():
+    creati = []
+    yield creati
+    for corpo in creati:
+        if os.path.exists(percorso(corpo)):
+            os.remove(percorso(corpo))
+
+
+def test_caricamenti_identici_concorrenti_una_sola_foto(pg, dati, file_di_prova):
+    corpo = png_casuale()
+    file_di_prova.append(corpo)
+
+    esiti = carica(corpo, dati.artista_id, richieste=6)
+
+    #una richiesta crea la foto (201), le altre ricevono la stessa riga (200)
+    assert sorted(stato for stato, _foto in esiti) == [200] * 5 + [201]
+    assert len({foto["id"] for _stato, foto in esiti}) == 1
+    with pg.connect() as conn:
+        assert conn.scalar(text("SELECT count(*) FROM photo")) == 1
+    assert os.path.exists(percorso(corpo))
+
+
+def test_file_rimosso_se_la_foto_non_viene_salvata(pg, dati, file_di_prova):
+    corpo = png_casuale()
+    file_di_prova.append(corpo)
+
+    #proprietario inesistente: la chiave esterna fa fallire il commit
+    assert carica(corpo, 999) == [(400, None)]
+    assert not os.path.exists(percorso(corpo))
+
+    #lo stesso file di un'altra foto salvata invece resta
+    assert carica(corpo, dati.artista_id)[0][0] == 201
+    assert carica(corpo, 999) == [(400, None)]
+    assert os.path.exists(percorso(corpo))
@@ -0,0 +1,62 @@
+import asyncio
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from app.core.conditional import etag_matches, strong_etag
+
+# Dati di riferimento con ETag: 304 finché non cambiano, ricarica dopo il NOTIFY dei trigger.
+
+
+def test_if_none_match():
+    etag = strong_etag(b"[]")
+    assert etag == strong_etag(b"[]") != strong_etag(b"[1]")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"altro", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag) and not etag_matches('"altro"', etag)
+
+
+def test_304_finche_i_dati_non_cambiano(pg, dati):
+    from app.core.notify import pg_listener
+    from app.main import app
+    from app.services.reference import reference_cache
+
+    client = TestClient(app)
+    prima = client.get("/reference/genres")
+    assert prima.status_code == 200 and prima.json() == [{"id": 1, "nome": "Rock"}]
+    etag = prima.headers["etag"]
+    assert "max-age" in prima.headers["cache-control"]
+
+    non_cambiato = client.get("/reference/genres", headers={"If-None-Match": etag})
+    assert non_cambiato.status_code == 304 and non_cambiato.content == b""
+    assert non_cambiato.headers["etag"] == etag
+    #le altre sezioni hanno il loro ETag
+    assert client.get("/reference/cities", headers={"If-None-Match": etag}).status_code == 200
+    assert reference_cache.caricamenti == 1
+
+    #il trigger sulla tabella genre avvisa i worker in ascolto, che ricaricano alla richiesta successiva
+    async def modifica():
+        connesso = asyncio.Event()
+
+        async def in_ascolto():
+            connesso.set()
+
+        pg_listener.on_connect(in_ascolto)
+        pg_listener.start()
+        try:
+            await asyncio.wait_for(connesso.wait(), 10)
+            with pg.begin() as conn:
+                conn.execute(text("INSERT INTO genre (id, nome) VALUES (2, 'Jazz')"))
+            for _ in range(100):
+                if reference_cache._scaduto:
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            await pg_listener.stop()
+            await pg_listener.engine.dispose()
+            pg_listener._on_connect.remove(in_ascolto)
+
+    asyncio.run(modifica())
+    dopo = client.get("/reference/genres", headers={"If-None-Match": etag})
+    assert dopo.status_code == 200 and dopo.headers["etag"] != etag
+    assert [g["nome"] for g in dopo.json()] == ["Rock", "Jazz"]
+    assert reference_cache.caricamenti == 2
@@ -0,0 +1,68 @@
+from decimal import Decimal
+from sqlalchemy import text
+
+# Reputazione mantenuta dal trigger aggiorna_reputazione e riallineata da reconcile_chunk (Postgres, vedi conftest.py).
+
+
+def recensioni(pg, dati):
+    #una prenotazione annullata si può recensire subito: due recensioni all'artista, dal direttore e dal promoter
+    with pg.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO booking (id, data_creazione, message, scadenza, stato_prenotazione, ragione, iniziato_da, band_id, slot_id)
+            VALUES (1, now(), 'Richiesta', now() + interval '5 days', 'annullata', 'Data saltata', 'artista', :band, :slot)
+        """), {"band": dati.band_id, "slot": dati.slot_ids[0]})
+        conn.execute(text("""
+            INSERT INTO review (id, data_creazione, description, autore_id, destinatario_id, booking_id) VALUES
+            (1, now(), 'Puntuali', :direttore, :artista, 1), (2, now(), 'Bravi', :promoter, :artista, 1)
+        """), {"direttore": dati.direttore_id, "promoter": dati.promoter_id, "artista": dati.artista_id})
+
+
+def reputazione(pg, person_id):
+    with pg.connect() as conn:
+        return tuple(conn.execute(text("SELECT somma_voti, numero_voti, reputazione FROM person WHERE id = :id"),
+                                  {"id": person_id}).one())
+
+
+def test_voti_inseriti_modificati_e_cancellati(pg, dati):
+    recensioni(pg, dati)
+    with pg.begin() as conn:
+        conn.execute(text("INSERT INTO score (id, data_creazione, voto, review_id) VALUES (1, now(), 5, 1), (2, now(), 4, 2)"))
+    assert reputazione(pg, dati.artista_id) == (9, 2, Decimal("4.50"))
+
+    with pg.begin() as conn:
+        conn.execute(text("UPDATE score SET voto = 2 WHERE id = 2"))
+    assert reputazione(pg, dati.artista_id) == (7, 2, Decimal("3.50"))
+
+    with pg.begin() as conn:
+        conn.execute(text("DELETE FROM score WHERE id = 1"))
+    assert reputazione(pg, dati.artista_id) == (2, 1, Decimal("2.00"))
+
+    #senza voti la media torna a 0 (niente divisione per zero)
+    with pg.begin() as conn:
+        conn.execute(text("DELETE FROM score"))
+    assert reputazione(pg, dati.artista_id) == (0, 0, Decimal("0.00"))
+    #gli altri non sono toccati
+    assert reputazione(pg, dati.direttore_id) == (0, 0, None)
+
+
+def test_riallineamento_dei_contatori(pg, dati):
+    from app.core.database import SessionLocal
+    from app.services.reputation import reconcile_chunk
+
+    recensioni(pg, dati)
+    with pg.begin() as conn:
+        conn.execute(text("INSERT INTO score (data_creazione, voto, review_id) VALUES (now(), 5, 1), (now(), 4, 2)"))
+        #scarto introdotto a mano, come dopo una modifica fatta con il trigger disattivato
+        conn.execute(text("UPDATE person SET somma_voti = 1, numero_voti = 1, reputazione = 1 WHERE id = :id"),
+                     {"id": dati.artista_id})
+
+    with SessionLocal() as db:
+        prova = reconcile_chunk(db, 1, 10, correggi=False)
+    assert prova.persone == 3 and prova.corrette == 0
+    assert [scarto[0] for scarto in prova.scarti] == [dati.artista_id]
+    assert reputazione(pg, dati.artista_id) == (1, 1, Decimal("1.00"))
+
+    with SessionLocal() as db:
+        report = reconcile_chunk(db, 1, 10)
+    assert report.corrette == 1
+    assert reputazione(pg, dati.artista_id) == (9, 2, Decimal("4.50"))
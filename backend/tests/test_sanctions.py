@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+# Scadenza delle prenotazioni, strike e ban su Postgres, con i trigger di init_db (vedi conftest.py per TEST_DB_NAME).
+
+
+def secondo_locale(pg):
+    #un altro direttore (id 4) con locale e calendario, per avere più direttori nello stesso controllo
+    with pg.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO person (id, nome, cognome, telefono, email, tipo_utente, privacy_accettata, city_id)
+            VALUES (4, 'Bruna', 'Direttrice', '+39 3330000004', 'direttrice@easygig.it', 'direttoreArtistico', true, 2)
+        """))
+        conn.execute(text("""
+            INSERT INTO venue (id, nome, email, telefono, tipo_sala, capienza, strumentazione, city_id, direttore_id)
+            VALUES (2, 'Altro Locale', 'altro@easygig.it', '+39 020000002', 'platea', 100, 'Mixer', 2, 4)
+        """))
+        conn.execute(text("""
+            INSERT INTO calendar (id, venue_id, data, data_inizio, data_fine, slot_disponibili)
+            VALUES (2, 2, CURRENT_DATE + 30, '20:00', '23:00', 10)
+        """))
+    return 2
+
+
+def richieste_scadute(pg, calendar_id, n, band_id):
+    #n richieste pendenti da 7 giorni, ognuna sul suo slot (un solo slot attivo per prenotazione)
+    with pg.begin() as conn:
+        conn.execute(text("""
+            WITH nuovi AS (
+                INSERT INTO slot (calendar_id, orario_inizio, orario_fine, stato)
+                SELECT :calendar_id, '20:00', '21:00', 'inTrattativa' FROM generate_series(1, :n)
+                RETURNING id
+            )
+            INSERT INTO booking (data_creazione, message, scadenza, stato_prenotazione, iniziato_da, band_id, slot_id)
+            SELECT now() - interval '7 days', 'Richiesta', now() - interval '2 days', 'pendente', 'artista', :band_id, id
+            FROM nuovi
+        """), {"calendar_id": calendar_id, "n": n, "band_id": band_id})
+
+
+def controlla():
+    from app.core.database import SessionLocal
+    from app.services.sanction_service import bookings_control
+
+    banditi = []
+    with SessionLocal() as db:
+        resoconto = bookings_control(db, banditi)
+    return resoconto, banditi
+
+
+def test_strike_oltre_la_soglia_un_solo_ban(pg, dati):
+    with pg.begin() as conn:
+        conn.execute(text("UPDATE sanction SET contatorestrike = 4 WHERE person_id = :id"), {"id": dati.direttore_id})
+    richieste_scadute(pg, dati.calendar_id, 7, dati.band_id)
+
+    resoconto, banditi = controlla()
+
+    assert resoconto["scadute"] == 7 and resoconto["ban"] == 1
+    assert [person_id for person_id, _scadenza in banditi] == [dati.direttore_id]
+    with pg.connect() as conn:
+        sanzione = conn.execute(text("SELECT contatorestrike, numero_ban, data_fine_ban FROM sanction WHERE person_id = :id"),
+                                {"id": dati.direttore_id}).one()
+        stati = conn.execute(text("SELECT stato FROM stato_account WHERE person_id = :id ORDER BY istante DESC, id DESC"),
+                             {"id": dati.direttore_id}).scalars().all()
+        versione = conn.scalar(text("SELECT versione_stato FROM person WHERE id = :id"), {"id": dati.direttore_id})
+    #11 strike: 6 oltre la soglia, ne restano al massimo 4 (il prossimo strike fa scattare il secondo ban)
+    assert sanzione.contatorestrike == 4 and sanzione.numero_ban == 1
+    assert sanzione.data_fine_ban > datetime.now() + timedelta(days=6)
+    #il trigger del ban è scattato una volta sola: un unico stato "congelato", il più recente
+    assert stati[0] == "congelato" and stati.count("congelato") == 1
+    assert versione == 1
+
+
+def test_strike_residui_sotto_la_soglia(pg, dati):
+    with pg.begin() as conn:
+        conn.execute(text("UPDATE sanction SET contatorestrike = 3 WHERE person_id = :id"), {"id": dati.direttore_id})
+    richieste_scadute(pg, dati.calendar_id, 4, dati.band_id)
+
+    resoconto, _banditi = controlla()
+
+    assert resoconto["ban"] == 1
+    with pg.connect() as conn:
+        contatore = conn.scalar(text("SELECT contatorestrike FROM sanction WHERE person_id = :id"), {"id": dati.direttore_id})
+    assert contatore == 2
+
+
+def test_blocchi_chiusi_sul_direttore_una_mail_a_testa(pg, dati, monkeypatch):
+    import app.services.sanction_service as sanction_service
+
+    #blocchi da 2 righe: le 3 scadenze del primo direttore finirebbero divise tra due blocchi
+    monkeypatch.setattr(sanction_service, "EXPIRY_CHUNK_SIZE", 2)
+    calendario = secondo_locale(pg)
+    richieste_scadute(pg, dati.calendar_id, 3, dati.band_id)
+    richieste_scadute(pg, calendario, 2, dati.band_id)
+
+    resoconto, banditi = controlla()
+
+    assert resoconto["elaborate"] == resoconto["scadute"] == 5
+    assert resoconto["strike"] == 5 and not banditi
+    with pg.connect() as conn:
+        mail = conn.execute(text("SELECT destinatario, count(*) FROM email_outbox GROUP BY destinatario")).all()
+        strike = dict(conn.execute(text("SELECT person_id, contatorestrike FROM sanction")).all())
+        liberi = conn.scalar(text("SELECT count(*) FROM slot WHERE stato = 'disponibile'"))
+    assert dict(mail) == {"direttore@easygig.it": 1, "direttrice@easygig.it": 1}
+    assert strike[dati.direttore_id] == 3 and strike[4] == 2
+    assert liberi == 3 + 5
+
+
+def test_sblocco_solo_dei_ban_scaduti(pg, dati):
+    import asyncio
+    from app.services.sanction_service import run_due_unbans
+
+    secondo_locale(pg)
+    with pg.begin() as conn:
+        #direttore 1: ban finito da un minuto; direttrice 4: ban prolungato dopo essere entrato in coda
+        conn.execute(text("UPDATE sanction SET numero_ban = 1, data_fine_ban = now() - interval '1 minute' WHERE person_id = 1"))
+        conn.execute(text("UPDATE sanction SET numero_ban = 1, data_fine_ban = now() + interval '7 days' WHERE person_id = 4"))
+        conn.execute(text("UPDATE stato_account SET stato = 'congelato' WHERE person_id IN (1, 4)"))
+
+    assert asyncio.run(run_due_unbans([1, 4])) == 1
+
+    with pg.connect() as conn:
+        stati = dict(conn.execute(text("SELECT person_id, stato FROM stato_account WHERE person_id IN (1, 4)")).all())
+        fine = dict(conn.execute(text("SELECT person_id, data_fine_ban FROM sanction WHERE person_id IN (1, 4)")).all())
+        versioni = dict(conn.execute(text("SELECT id, versione_stato FROM person WHERE id IN (1, 4)")).all())
+        mail = conn.execute(text("SELECT destinatario, oggetto FROM email_outbox")).all()
+    assert stati == {1: "attivo", 4: "congelato"}
+    assert fine[1] is None and fine[4] is not None
+    assert versioni == {1: 1, 4: 0}
+    assert [tuple(m) for m in mail] == [("direttore@easygig.it", "BENTORNATO!")]
+    #una voce superata in coda non fa danni: il secondo giro non trova niente da sbloccare
+    assert asyncio.run(run_due_unbans([1, 4])) == 0
@@ -0,0 +1,63 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+# Ricerca di band e artisti (pg_trgm + full-text) su Postgres (vedi conftest.py per TEST_DB_NAME).
+
+
+def client():
+    from app.main import app
+    return TestClient(app)
+
+
+def popola(pg):
+    with pg.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO person (id, nome, cognome, telefono, email, tipo_utente, link_streaming, privacy_accettata, city_id, genere_id) VALUES
+            (10, 'Mario', 'Rossi', '+39 3330000010', 'mario@easygig.it', 'artista', 'https://example.com/mario', true, 1, 1),
+            (11, 'Maria', 'Rossini', '+39 3330000011', 'maria@easygig.it', 'artista', 'https://example.com/maria', true, 3, 1),
+            (12, 'Luca', 'Bianchi', '+39 3330000012', 'luca@easygig.it', 'artista', 'https://example.com/luca', true, 3, 1)
+        """))
+        conn.execute(text("INSERT INTO band (id, nome, cachet, trattabile, categoria, genere_id) VALUES (2, 'Ramones Tribute', 300, false, 'tributeBand', 1)"))
+        conn.execute(text("INSERT INTO pers_band (person_id, band_id) VALUES (12, 2)"))
+
+
+def cerca(**parametri):
+    risposta = client().get("/artists/artists", params=parametri)
+    assert risposta.status_code == 200, risposta.text
+    return risposta.json()
+
+
+def test_ranking_e_refusi(pg, dati):
+    popola(pg)
+
+    #il nome esatto viene prima di quello solo simile
+    risultati = cerca(artist="Rossi")["items"]
+    assert [r["nome"] for r in risultati][:2] == ["Mario Rossi", "Maria Rossini"]
+    assert risultati[0]["rank"] > risultati[1]["rank"]
+    assert risultati[0]["nome_evidenziato"] == "Mario <mark>Rossi</mark>"
+
+    #un refuso trova comunque la band (similarità dei trigrammi)
+    band = cerca(artist="Rammones")["items"]
+    assert [(r["tipo"], r["nome"]) for r in band] == [("band", "Ramones Tribute")]
+    assert cerca(artist="Zzyzx")["items"] == []
+
+
+def test_filtri_e_pagine(pg, dati):
+    popola(pg)
+
+    #la categoria esiste solo per le band; la città vale per gli artisti e per i membri delle band
+    assert [r["nome"] for r in cerca(categoria="tributeBand")["items"]] == ["Ramones Tribute"]
+    torino = {(r["tipo"], r["nome"], r["citta"]) for r in cerca(citta="Torino")["items"]}
+    assert torino == {("artista", "Maria Rossini", "Torino"), ("artista", "Luca Bianchi", "Torino"),
+                      ("band", "Ramones Tribute", None)}
+
+    #pagine da un elemento: stesso ordine della pagina unica, senza doppioni
+    tutti = [(r["tipo"], r["id"]) for r in cerca(artist="ross", limit=50)["items"]]
+    pagine, cursor = [], None
+    while True:
+        pagina = cerca(artist="ross", limit=1, **({"cursor": cursor} if cursor else {}))
+        pagine += [(r["tipo"], r["id"]) for r in pagina["items"]]
+        cursor = pagina["next_cursor"]
+        if not cursor:
+            break
+    assert pagine == tutti and len(tutti) >= 2
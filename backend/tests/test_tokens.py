@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+# Token di accesso e refresh token su Postgres (vedi conftest.py per TEST_DB_NAME).
+
+
+def contesto(user_id):
+    from app.core.database import AsyncSessionLocal
+    from app.services.auth_context import load_auth_context
+
+    async def carica():
+        async with AsyncSessionLocal() as db:
+            return await load_auth_context(db, user_id)
+    return asyncio.run(carica())
+
+
+def banna(user_id):
+    from app.core.database import SessionLocal
+    from app.services.sanction_service import apply_ban
+
+    with SessionLocal() as db:
+        assert apply_ban(db, user_id)
+        db.commit()
+
+
+def test_ban_revoca_i_token_anche_dopo_un_riavvio(pg, dati):
+    from app.core.notify import pg_listener
+    from app.services.tokens import create_access_token, decode_access_token, reload_revocations, token_revocations
+
+    token = create_access_token(contesto(dati.artista_id))
+    assert decode_access_token(token).user_id == dati.artista_id
+
+    #nessun worker in ascolto al momento del ban: la NOTIFY va persa, come durante un riavvio
+    banna(dati.artista_id)
+    assert len(token_revocations) == 0
+    assert asyncio.run(reload_revocations()) == 1
+    with pytest.raises(HTTPException) as errore:
+        decode_access_token(token)
+    assert errore.value.status_code == 401
+
+    #il nuovo token (versione aggiornata, account congelato) resta valido
+    nuovo = decode_access_token(create_access_token(contesto(dati.artista_id)))
+    assert nuovo.congelato
+
+    #all'avvio il recupero lo fa l'ascolto stesso, appena connesso
+    token_revocations._minime.clear()
+
+    async def avvio():
+        pg_listener.start()
+        try:
+            for _ in range(100):
+                if len(token_revocations):
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            await pg_listener.stop()
+            await pg_listener.engine.dispose()
+
+    asyncio.run(avvio())
+    with pytest.raises(HTTPException):
+        decode_access_token(token)
+
+
+def test_rotazione_e_riuso_del_refresh_token(pg, dati):
+    from app.core.database import AsyncSessionLocal
+    from app.services.tokens import issue_tokens, rotate_refresh_token
+
+    ctx = contesto(dati.promoter_id)
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            primo = await issue_tokens(db, ctx)
+            secondo = await rotate_refresh_token(db, primo["refresh_token"])
+            terzo = await rotate_refresh_token(db, secondo["refresh_token"])
+            #il secondo token è già stato usato: chi lo ripresenta lo ha copiato
+            with pytest.raises(HTTPException) as riuso:
+                await rotate_refresh_token(db, secondo["refresh_token"])
+            #l'intera famiglia è revocata, compreso l'ultimo token emesso
+            with pytest.raises(HTTPException) as dopo:
+                await rotate_refresh_token(db, terzo["refresh_token"])
+        return primo, secondo, terzo, riuso.value, dopo.value
+
+    primo, secondo, terzo, riuso, dopo = asyncio.run(scenario())
+    assert len({primo["refresh_token"], secondo["refresh_token"], terzo["refresh_token"]}) == 3
+    assert riuso.status_code == dopo.status_code == 401
+    with pg.connect() as conn:
+        assert conn.scalar(text("SELECT count(*) FROM refresh_token")) == 0
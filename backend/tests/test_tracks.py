@@ -0,0 +1,88 @@
+import hashlib
+import io
+import math
+import os
+import wave
+import pytest
+from fastapi.testclient import TestClient
+from app.services.media import AUDIO_DIR, MEDIA_ROOT, analyze_audio, file_path, read_waveform
+
+# Brani demo degli artisti: file serviti con Range (206/416) e ETag, picchi calcolati dal worker.
+
+
+def brano_wav(secondi: float = 1.0, frequenza: int = 8000) -> bytes:
+    #sinusoide mono a 16 bit, ampiezza metà scala
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(frequenza)
+        campioni = (int(16384 * math.sin(2 * math.pi * 440 * i / frequenza)) for i in range(int(secondi * frequenza)))
+        f.writeframes(b"".join(c.to_bytes(2, "little", signed=True) for c in campioni))
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def brano():
+    """Un WAV salvato in MEDIA_ROOT come lo salverebbe l'upload; tolto alla fine del test."""
+    corpo = brano_wav()
+    nome_file = f"{hashlib.sha256(corpo).hexdigest()}.wav"
+    percorso = os.path.join(MEDIA_ROOT, file_path(nome_file, AUDIO_DIR))
+    os.makedirs(os.path.dirname(percorso), exist_ok=True)
+    with open(percorso, "wb") as f:
+        f.write(corpo)
+    yield nome_file, corpo
+    os.remove(percorso)
+
+
+def client():
+    from app.main import app
+    return TestClient(app)
+
+
+def test_brano_intero_parziale_e_fuori_intervallo(brano):
+    nome_file, corpo = brano
+    url = f"/artists/tracks/{nome_file}"
+
+    intero = client().get(url)
+    assert intero.status_code == 200 and intero.content == corpo
+    assert intero.headers["accept-ranges"] == "bytes"
+    assert intero.headers["content-type"] == "audio/wav"
+    assert intero.headers["etag"] == f'"{nome_file[:64]}"'
+
+    parte = client().get(url, headers={"Range": "bytes=100-199"})
+    assert parte.status_code == 206 and parte.content == corpo[100:200]
+    assert parte.headers["content-range"] == f"bytes 100-199/{len(corpo)}"
+    coda = client().get(url, headers={"Range": "bytes=-10"})
+    assert coda.status_code == 206 and coda.content == corpo[-10:]
+
+    assert client().get(url, headers={"Range": f"bytes={len(corpo)}-"}).status_code == 416
+    assert client().get(url, headers={"If-None-Match": intero.headers["etag"]}).status_code == 304
+
+    #HEAD per il player: dimensione senza corpo
+    testa = client().head(url)
+    assert testa.status_code == 200 and testa.content == b""
+    assert testa.headers["content-length"] == str(len(corpo))
+
+
+def test_nomi_non_validi_o_mancanti():
+    assert client().get("/artists/tracks/..%2F..%2Fetc%2Fpasswd").status_code == 404
+    assert client().get(f"/artists/tracks/{'0' * 64}.wav").status_code == 404
+    assert client().get(f"/artists/tracks/{'0' * 64}.exe").status_code == 404
+
+
+def test_picchi_del_brano(tmp_path):
+    corpo = brano_wav(secondi=2.0)
+    digest = hashlib.sha256(corpo).hexdigest()
+    percorso = tmp_path / file_path(f"{digest}.wav", AUDIO_DIR)
+    percorso.parent.mkdir(parents=True)
+    percorso.write_bytes(corpo)
+
+    assert analyze_audio(str(tmp_path), f"{digest}.wav", 50) == f"{digest}_picchi.json"
+    picchi = read_waveform(digest, root=str(tmp_path))
+    assert (picchi["durata"], picchi["canali"], picchi["frequenza"]) == (2.0, 1, 8000)
+    assert 0 < len(picchi["picchi"]) <= 50
+    assert all(0.45 < p <= 0.51 for p in picchi["picchi"])
+    #già calcolati: il secondo passaggio non rifà il lavoro
+    assert analyze_audio(str(tmp_path), f"{digest}.wav", 50) is None
+    assert read_waveform("0" * 64, root=str(tmp_path)) is None
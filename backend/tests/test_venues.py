@@ -0,0 +1,57 @@
+from datetime import timedelta
+from fastapi.testclient import TestClient
+
+# Ricerca dei locali e degli slot liberi su Postgres (vedi conftest.py per TEST_DB_NAME).
+
+
+def client():
+    from app.main import app
+    return TestClient(app)
+
+
+def test_slot_liberi_per_regione_senza_distinzione_di_maiuscole(dati):
+    periodo = {"dal": str(dati.giorno - timedelta(days=1)), "al": str(dati.giorno + timedelta(days=1))}
+    for regione in ("Lombardia", "lombardia", " LOMBARDIA "):
+        pagina = client().get("/venues/availability", params={**periodo, "regione": regione}).json()
+        assert [s["slot_id"] for s in pagina["items"]] == dati.slot_ids
+    assert client().get("/venues/availability", params={**periodo, "regione": "piemonte"}).json()["items"] == []
+
+
+def test_slot_liberi_a_pagine_e_in_streaming(dati):
+    periodo = {"dal": str(dati.giorno), "al": str(dati.giorno)}
+    pagine, cursor = [], None
+    while True:
+        pagina = client().get("/venues/availability", params={**periodo, "limit": 2, **({"cursor": cursor} if cursor else {})}).json()
+        pagine += [s["slot_id"] for s in pagina["items"]]
+        cursor = pagina["next_cursor"]
+        if not cursor:
+            break
+    flusso = client().get("/venues/availability", params={**periodo, "stream": True})
+    assert flusso.headers["content-type"] == "application/json"
+    assert pagine == [s["slot_id"] for s in flusso.json()] == dati.slot_ids
+
+
+def test_locali_nel_raggio_di_una_citta(pg, dati):
+    from sqlalchemy import text
+
+    #oltre al locale di Milano: uno a Monza (14 km) e uno a Torino (126 km)
+    with pg.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO venue (id, nome, email, telefono, tipo_sala, capienza, strumentazione, city_id, direttore_id) VALUES
+            (2, 'Locale Monza', 'monza@easygig.it', '+39 020000002', 'platea', 100, 'Mixer', 2, 1),
+            (3, 'Locale Torino', 'torino@easygig.it', '+39 020000003', 'platea', 100, 'Mixer', 3, 1)
+        """))
+
+    def locali(**parametri):
+        risposta = client().get("/venues/", params=parametri)
+        assert risposta.status_code == 200, risposta.text
+        return [v["id"] for v in risposta.json()["items"]]
+
+    assert locali(vicino_a="milano", raggio_km=20) == [1, 2]
+    assert locali(vicino_a="Milano", raggio_km=150) == [1, 2, 3]
+    assert locali(lat=45.07, lon=7.68, raggio_km=10) == [3]
+    #raggio e regione si combinano
+    assert locali(vicino_a="Milano", raggio_km=150, regione="Piemonte") == [3]
+    assert locali(regione="lombardia") == [1, 2]
+    assert client().get("/venues/", params={"vicino_a": "Roma"}).status_code == 404
+    assert client().get("/venues/", params={"lat": 45.0}).status_code == 400